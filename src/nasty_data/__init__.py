@@ -89,19 +89,69 @@ from nasty_data.document.twitter import (
     TwitterUserEntities,
     TwitterUserExt,
 )
+from nasty_data.elasticsearch_.backpressure import InFlightWindow
+from nasty_data.elasticsearch_.bulk import (
+    AdaptiveBulkSizer,
+    SerializedBulk,
+    compress_bulk_actions,
+    serialize_bulk_actions,
+    tagged_parallel_serialized_bulk,
+    tagged_parallel_streaming_bulk,
+)
+from nasty_data.elasticsearch_.bulk_ndjson import (
+    BulkNdjsonManifest,
+    find_bulk_ndjson_manifests,
+    read_bulk_ndjson,
+    replay_bulk_ndjson,
+    write_bulk_ndjson,
+)
+from nasty_data.elasticsearch_.checkpoint import DumpCheckpoint
+from nasty_data.elasticsearch_.content_hash import ContentHashStore, content_hash
+from nasty_data.elasticsearch_.converter import (
+    document_converter,
+    verify_document_converter,
+)
+from nasty_data.elasticsearch_.dead_letter import DeadLetter, DeadLetterFile
+from nasty_data.elasticsearch_.dedupe import (
+    BloomFilter,
+    DuplicatePolicy,
+    find_duplicate_ids,
+)
+from nasty_data.elasticsearch_.dump_files import (
+    DumpFileSummary,
+    find_dump_files,
+    index_dump_files,
+)
 from nasty_data.elasticsearch_.index import (
     BaseDocument,
+    DocumentLineBatch,
     add_documents_to_index,
     analyze_index,
+    bulk_load_index_settings,
     customize_document_cls,
     ensure_index_exists,
+    find_duplicate_document_ids,
+    load_document_line_batches,
+    meta_field_script_id,
     new_index,
+    put_meta_field_script,
+    serialize_documents,
+)
+from nasty_data.elasticsearch_.metrics import IngestMetrics, MetricsExporter
+from nasty_data.elasticsearch_.serializer import (
+    JsonBackend,
+    OrjsonSerializer,
+    elasticsearch_serializer,
+    json_loads_func,
 )
 from nasty_data.elasticsearch_.settings import ElasticsearchSettings
+from nasty_data.profiling import Profiler
 from nasty_data.source.nasty_batch_results import (
     NastyBatchMeta,
     NastyBatchResultsTwitterDocument,
     NastyRequestMeta,
+    is_nasty_batch_results_file,
+    load_document_batches_from_nasty_batch_results,
     load_document_dicts_from_nasty_batch_results,
 )
 from nasty_data.source.pushshift import (
@@ -109,6 +159,8 @@ from nasty_data.source.pushshift import (
     PushshiftDumpType,
     PushshiftRedditDocument,
     download_pushshift_dumps,
+    is_pushshift_dump_file,
+    load_document_batches_from_pushshift_dump,
     load_document_dicts_from_pushshift_dump,
     sample_pushshift_dumps,
 )
@@ -171,20 +223,63 @@ __all__ = [
     "TwitterUserEntities",
     "TwitterUserExt",
     "ElasticsearchSettings",
+    "JsonBackend",
+    "OrjsonSerializer",
+    "elasticsearch_serializer",
+    "json_loads_func",
+    "InFlightWindow",
+    "AdaptiveBulkSizer",
+    "SerializedBulk",
+    "compress_bulk_actions",
+    "serialize_bulk_actions",
+    "tagged_parallel_serialized_bulk",
+    "tagged_parallel_streaming_bulk",
+    "BulkNdjsonManifest",
+    "find_bulk_ndjson_manifests",
+    "read_bulk_ndjson",
+    "replay_bulk_ndjson",
+    "write_bulk_ndjson",
+    "DumpCheckpoint",
+    "ContentHashStore",
+    "content_hash",
+    "document_converter",
+    "verify_document_converter",
+    "DeadLetter",
+    "DeadLetterFile",
+    "BloomFilter",
+    "DuplicatePolicy",
+    "find_duplicate_ids",
+    "DumpFileSummary",
+    "find_dump_files",
+    "index_dump_files",
     "BaseDocument",
+    "DocumentLineBatch",
     "add_documents_to_index",
     "analyze_index",
+    "bulk_load_index_settings",
     "customize_document_cls",
     "ensure_index_exists",
+    "find_duplicate_document_ids",
+    "load_document_line_batches",
+    "meta_field_script_id",
     "new_index",
+    "put_meta_field_script",
+    "serialize_documents",
+    "IngestMetrics",
+    "MetricsExporter",
+    "Profiler",
     "NastyBatchMeta",
     "NastyBatchResultsTwitterDocument",
     "NastyRequestMeta",
+    "is_nasty_batch_results_file",
+    "load_document_batches_from_nasty_batch_results",
     "load_document_dicts_from_nasty_batch_results",
     "PushshiftDumpMeta",
     "PushshiftDumpType",
     "PushshiftRedditDocument",
     "download_pushshift_dumps",
+    "is_pushshift_dump_file",
+    "load_document_batches_from_pushshift_dump",
     "load_document_dicts_from_pushshift_dump",
     "sample_pushshift_dumps",
 ]
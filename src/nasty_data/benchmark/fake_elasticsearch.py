@@ -0,0 +1,290 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import gzip
+import json
+from http.server import BaseHTTPRequestHandler
+from logging import getLogger
+from random import Random
+from threading import Lock, Thread
+from time import sleep
+from types import TracebackType
+from typing import Dict, List, Mapping, NamedTuple, Optional, Set, Tuple, Type
+from urllib.parse import urlsplit
+
+from nasty_utils import ColoredBraceStyleAdapter
+
+from nasty_data.elasticsearch_.metrics import _ThreadingHTTPServer
+
+_LOGGER = ColoredBraceStyleAdapter(getLogger(__name__))
+
+_VERSION = "7.9.3"
+
+
+class FakeElasticsearchStats(NamedTuple):
+    """What a `FakeElasticsearch` received since it was started or last reset.
+
+    `num_payload_bytes` are the bytes of bulk request bodies as sent over the wire,
+    i.e., compressed if the client compresses requests, `num_ndjson_bytes` are the
+    bytes of the NDJSON after decompressing.
+    """
+
+    num_requests: int
+    num_actions: int
+    num_rejected: int
+    num_conflicts: int
+    num_payload_bytes: int
+    num_ndjson_bytes: int
+    max_concurrent_requests: int
+
+
+class FakeElasticsearch:
+    """In-process stand-in for the Elasticsearch endpoints used when indexing.
+
+    Serves plain HTTP on localhost on a free port (see `url`), with one thread per
+    connection. Bulk requests are parsed (gzip-compressed or not) and answered after
+    `latency` seconds plus `latency_per_action` seconds per action. Each action is
+    rejected with status 429 (as if the write queue of Elasticsearch was full) with
+    probability `rejection_rate`, and create actions fail with a version conflict if
+    a document with the same ID was indexed before, just like in Elasticsearch.
+    Documents are not stored, only their IDs. All other requests the indexing code
+    makes (checking that the index exists, counting its documents, storing scripts)
+    are acknowledged. Use as a context manager.
+    """
+
+    def __init__(
+        self,
+        *,
+        latency: float = 0.0,
+        latency_per_action: float = 0.0,
+        rejection_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        if latency < 0 or latency_per_action < 0:
+            raise ValueError("Latencies must not be negative.")
+        if not 0 <= rejection_rate < 1:
+            raise ValueError(
+                f"Rejection rate must be in [0, 1), but is {rejection_rate}."
+            )
+
+        self.latency = latency
+        self.latency_per_action = latency_per_action
+        self.rejection_rate = rejection_rate
+        self._rng = Random(seed)
+        self._lock = Lock()
+        self._ids: Set[Tuple[str, str]] = set()
+        self._stats: Dict[str, int] = {}
+        self._concurrent_requests = 0
+        self._server: Optional[_ThreadingHTTPServer] = None
+        self._thread: Optional[Thread] = None
+        self.reset()
+
+    @property
+    def url(self) -> str:
+        if self._server is None:
+            raise RuntimeError("Fake Elasticsearch is not running.")
+        return f"http://localhost:{self._server.server_port}"
+
+    def __enter__(self) -> "FakeElasticsearch":
+        self._server = _ThreadingHTTPServer(("localhost", 0), self._request_handler())
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        _LOGGER.debug("Serving fake Elasticsearch at {}.", self.url)
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def reset(self) -> None:
+        """Forgets all indexed IDs and resets the statistics."""
+
+        with self._lock:
+            self._ids.clear()
+            self._stats = {field: 0 for field in FakeElasticsearchStats._fields}
+
+    def stats(self) -> FakeElasticsearchStats:
+        with self._lock:
+            return FakeElasticsearchStats(**self._stats)
+
+    def count(self, index: str) -> int:
+        with self._lock:
+            return sum(1 for index_, _id in self._ids if index_ == index)
+
+    def bulk(
+        self,
+        ndjson: bytes,
+        *,
+        default_index: Optional[str] = None,
+        num_payload_bytes: Optional[int] = None,
+    ) -> Mapping[str, object]:
+        """Answers a bulk request like Elasticsearch would, after its latency.
+
+        :param num_payload_bytes: Size of the request body as received, if it was
+            compressed. Defaults to the size of `ndjson`.
+        """
+
+        with self._lock:
+            self._concurrent_requests += 1
+            self._stats["max_concurrent_requests"] = max(
+                self._stats["max_concurrent_requests"], self._concurrent_requests
+            )
+        try:
+            actions = _parse_bulk_actions(ndjson.splitlines())
+            sleep(self.latency + self.latency_per_action * len(actions))
+
+            with self._lock:
+                items = [
+                    self._bulk_item(op_type, meta, default_index=default_index)
+                    for op_type, meta in actions
+                ]
+                self._stats["num_requests"] += 1
+                self._stats["num_actions"] += len(actions)
+                self._stats["num_payload_bytes"] += (
+                    len(ndjson) if num_payload_bytes is None else num_payload_bytes
+                )
+                self._stats["num_ndjson_bytes"] += len(ndjson)
+                return {
+                    "took": 1,
+                    "errors": any(
+                        "error" in item[op_type]
+                        for (op_type, _meta), item in zip(actions, items)
+                    ),
+                    "items": items,
+                }
+        finally:
+            with self._lock:
+                self._concurrent_requests -= 1
+
+    def _bulk_item(
+        self,
+        op_type: str,
+        meta: Mapping[str, object],
+        *,
+        default_index: Optional[str],
+    ) -> Mapping[str, Mapping[str, object]]:
+        # Needs to be called while holding the lock.
+        index = str(meta.get("_index", default_index))
+        id_ = str(meta["_id"])
+        item: Dict[str, object] = {"_index": index, "_id": id_, "status": 200}
+
+        if self._rng.random() < self.rejection_rate:
+            self._stats["num_rejected"] += 1
+            item["status"] = 429
+            item["error"] = {
+                "type": "es_rejected_execution_exception",
+                "reason": "rejected execution (fake Elasticsearch)",
+            }
+        elif op_type == "create" and (index, id_) in self._ids:
+            self._stats["num_conflicts"] += 1
+            item["status"] = 409
+            item["error"] = {
+                "type": "version_conflict_engine_exception",
+                "reason": f"[{id_}]: version conflict, document already exists",
+            }
+        elif op_type == "delete":
+            self._ids.discard((index, id_))
+        else:
+            item["status"] = 200 if (index, id_) in self._ids else 201
+            self._ids.add((index, id_))
+        return {op_type: item}
+
+    def _handle(
+        self, method: str, url: str, body: bytes, *, num_payload_bytes: int
+    ) -> Tuple[int, Mapping[str, object]]:
+        path = [part for part in urlsplit(url).path.split("/") if part]
+        if method == "HEAD":
+            # Checks whether an index exists.
+            return 200, {}
+        elif not path:
+            return 200, {
+                "name": "fake",
+                "cluster_name": "fake",
+                "version": {"number": _VERSION, "build_flavor": "default"},
+                "tagline": "You Know, for Search",
+            }
+        elif path[-1] == "_bulk":
+            return 200, self.bulk(
+                body,
+                default_index=path[0] if len(path) > 1 else None,
+                num_payload_bytes=num_payload_bytes,
+            )
+        elif path[-1] == "_count" and len(path) == 2:
+            return 200, {"count": self.count(path[0])}
+        elif path[0] == "_scripts" or path[-1] == "_settings":
+            return 200, {"acknowledged": True}
+        return 404, {
+            "error": {
+                "type": "fake_elasticsearch_exception",
+                "reason": f"Unsupported request {url}.",
+            },
+            "status": 404,
+        }
+
+    def _request_handler(self) -> Type[BaseHTTPRequestHandler]:
+        fake_elasticsearch = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self) -> None:  # noqa: N802
+                num_payload_bytes = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(num_payload_bytes)
+                if self.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.decompress(body)
+
+                status, response = fake_elasticsearch._handle(
+                    self.command, self.path, body, num_payload_bytes=num_payload_bytes
+                )
+                data = json.dumps(response).encode("UTF-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=UTF-8")
+                self.send_header("Content-Length", str(len(data)))
+                # Needed by version 7.14 and later of the client.
+                self.send_header("X-Elastic-Product", "Elasticsearch")
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(data)
+
+            do_HEAD = do_POST = do_PUT = do_GET  # noqa: N815
+
+            def log_message(self, format: str, *args: object) -> None:  # noqa: A002
+                pass
+
+        return RequestHandler
+
+
+def _parse_bulk_actions(lines: List[bytes]) -> List[Tuple[str, Mapping[str, object]]]:
+    # Every action line is followed by a source line, except for deletes.
+    actions = []
+    line_iter = iter(line for line in lines if line.strip())
+    for line in line_iter:
+        action = json.loads(line)
+        ((op_type, meta),) = action.items()
+        if op_type != "delete":
+            json.loads(next(line_iter))
+        actions.append((op_type, meta))
+    return actions
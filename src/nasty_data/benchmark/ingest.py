@@ -0,0 +1,338 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+import platform
+from datetime import datetime
+from enum import Enum
+from itertools import product
+from logging import getLogger
+from os import cpu_count
+from pathlib import Path
+from time import perf_counter
+from typing import Iterable, Iterator, Mapping, NamedTuple, Sequence, Union
+
+from elasticsearch_dsl import connections
+from nasty_utils import ColoredBraceStyleAdapter, DecompressingTextIOWrapper
+
+import nasty_data
+from nasty_data.benchmark.fake_elasticsearch import FakeElasticsearch
+from nasty_data.benchmark.synthetic import SyntheticDataset, write_synthetic_dump
+from nasty_data.elasticsearch_.backpressure import InFlightWindow
+from nasty_data.elasticsearch_.bulk import AdaptiveBulkSizer
+from nasty_data.elasticsearch_.index import DocumentLineBatch, add_documents_to_index
+from nasty_data.elasticsearch_.metrics import IngestMetrics
+from nasty_data.elasticsearch_.serializer import JsonBackend, elasticsearch_serializer
+from nasty_data.source.nasty_batch_results import (
+    load_document_batches_from_nasty_batch_results,
+    load_document_dicts_from_nasty_batch_results,
+)
+from nasty_data.source.pushshift import (
+    load_document_batches_from_pushshift_dump,
+    load_document_dicts_from_pushshift_dump,
+)
+
+_LOGGER = ColoredBraceStyleAdapter(getLogger(__name__))
+
+_INDEX_NAME = "ingest-benchmark"
+
+
+class IngestLoaderFormat(Enum):
+    """How the dump is passed to `add_documents_to_index()`.
+
+    DICTS parses lines in the main process and passes single document dicts to the
+    worker processes, BATCHES passes batches of unparsed lines, SERIALIZED also lets
+    the worker processes serialize each batch into one bulk request, and COMPRESSED
+    lets them compress it as well.
+    """
+
+    DICTS = "dicts"
+    BATCHES = "batches"
+    SERIALIZED = "serialized"
+    COMPRESSED = "compressed"
+
+
+class IngestBenchmarkResult(NamedTuple):
+    """Outcome of indexing one synthetic dump with one configuration.
+
+    `num_bytes` are the bytes of the uncompressed dump, `num_payload_bytes` those of
+    all bulk requests as sent (compressed, if enabled), including retries.
+    """
+
+    dataset: str
+    loader_format: str
+    num_procs: int
+    bulk_size: int
+    num_documents: int
+    num_bytes: int
+    seconds: float
+    num_requests: int
+    num_rejected: int
+    num_payload_bytes: int
+    max_concurrent_requests: int
+
+    @property
+    def documents_per_second(self) -> float:
+        return self.num_documents / max(self.seconds, 1e-9)
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.num_bytes / max(self.seconds, 1e-9)
+
+
+def run_ingest_benchmarks(
+    directory: Path,
+    *,
+    datasets: Iterable[SyntheticDataset] = (SyntheticDataset.REDDIT_COMMENTS,),
+    num_documents: int = 20000,
+    seed: int = 0,
+    loader_formats: Iterable[IngestLoaderFormat] = tuple(IngestLoaderFormat),
+    num_procs: Iterable[int] = (cpu_count() or 1,),
+    bulk_sizes: Iterable[int] = (500,),
+    bulk_concurrency: int = 1,
+    latency: float = 0.0,
+    latency_per_action: float = 0.0,
+    rejection_rate: float = 0.0,
+    http_compress: bool = True,
+    compress_level: int = 6,
+    json_backend: JsonBackend = JsonBackend.AUTO,
+) -> Sequence[IngestBenchmarkResult]:
+    """Measures end-to-end throughput of `add_documents_to_index()`.
+
+    For each dataset, a synthetic dump of `num_documents` documents is written to
+    `directory` and then indexed into a `FakeElasticsearch` with each combination of
+    loader format, number of worker processes, and bulk size. The fake answers bulk
+    requests after `latency` seconds plus `latency_per_action` seconds per action, and
+    rejects each action with probability `rejection_rate`, so that slow or overloaded
+    clusters can be simulated. Each run starts with an empty index, i.e., documents
+    are created, and takes the wall-clock time of the whole call, including starting
+    the worker processes and decompressing the dump. With the COMPRESSED loader
+    format, requests are compressed at `compress_level` regardless of `http_compress`.
+    """
+
+    if num_documents < 1:
+        raise ValueError(
+            f"Number of documents must be positive, but is {num_documents}."
+        )
+
+    dump_files = {
+        dataset: write_synthetic_dump(
+            dataset, directory, num_documents=num_documents, seed=seed
+        )
+        for dataset in datasets
+    }
+
+    results = []
+    with FakeElasticsearch(
+        latency=latency,
+        latency_per_action=latency_per_action,
+        rejection_rate=rejection_rate,
+        seed=seed,
+    ) as fake_elasticsearch:
+        for (dataset, dump_file), loader_format, num_procs_, bulk_size in product(
+            dump_files.items(), loader_formats, num_procs, bulk_sizes
+        ):
+            connections.create_connection(
+                hosts=[fake_elasticsearch.url],
+                http_compress=(
+                    http_compress and loader_format != IngestLoaderFormat.COMPRESSED
+                ),
+                serializer=elasticsearch_serializer(json_backend),
+                maxsize=bulk_concurrency,
+                timeout=60,
+            )
+            _LOGGER.info(
+                "Indexing {} synthetic {} as {} with {} processes and {} actions "
+                "per bulk request.",
+                num_documents,
+                dataset.value,
+                loader_format.value,
+                num_procs_,
+                bulk_size,
+            )
+            fake_elasticsearch.reset()
+            results.append(
+                _run_ingest_benchmark(
+                    fake_elasticsearch,
+                    dataset,
+                    dump_file,
+                    loader_format=loader_format,
+                    num_procs=num_procs_,
+                    bulk_size=bulk_size,
+                    bulk_concurrency=bulk_concurrency,
+                    compress_level=compress_level,
+                    json_backend=json_backend,
+                )
+            )
+    return results
+
+
+def _run_ingest_benchmark(
+    fake_elasticsearch: FakeElasticsearch,
+    dataset: SyntheticDataset,
+    dump_file: Path,
+    *,
+    loader_format: IngestLoaderFormat,
+    num_procs: int,
+    bulk_size: int,
+    bulk_concurrency: int,
+    compress_level: int,
+    json_backend: JsonBackend,
+) -> IngestBenchmarkResult:
+    if num_procs < 1 or bulk_size < 1:
+        raise ValueError("Number of processes and bulk size must be positive.")
+
+    # Bulk requests of serialized batches have as many actions as the batch has lines,
+    # otherwise their size is pinned with the bounds of a bulk sizer.
+    serialized = loader_format in (
+        IngestLoaderFormat.SERIALIZED,
+        IngestLoaderFormat.COMPRESSED,
+    )
+    batch_size = bulk_size if serialized else 1000
+    bulk_sizer = None
+    if not serialized:
+        bulk_sizer = AdaptiveBulkSizer(
+            chunk_size=bulk_size,
+            min_chunk_size=bulk_size,
+            max_chunk_size=bulk_size,
+            max_chunk_bytes=100 * 1024 * 1024,
+            min_max_chunk_bytes=100 * 1024 * 1024,
+        )
+
+    start = perf_counter()
+    num_indexed = add_documents_to_index(
+        _INDEX_NAME,
+        dataset.document_cls,
+        _load_document_dicts(
+            dataset,
+            dump_file,
+            loader_format=loader_format,
+            batch_size=batch_size,
+            json_backend=json_backend,
+        ),
+        num_procs=num_procs,
+        bulk_concurrency=bulk_concurrency,
+        bulk_sizer=bulk_sizer,
+        serialize_in_workers=serialized,
+        compress_level=(
+            compress_level if loader_format == IngestLoaderFormat.COMPRESSED else None
+        ),
+        in_flight_window=InFlightWindow(max_documents=4 * batch_size * num_procs),
+        metrics=IngestMetrics(),
+    )
+    seconds = perf_counter() - start
+
+    stats = fake_elasticsearch.stats()
+    num_stored = fake_elasticsearch.count(_INDEX_NAME)
+    if num_indexed != num_stored:
+        _LOGGER.warning(
+            "Indexed {} documents, but fake Elasticsearch holds {}.",
+            num_indexed,
+            num_stored,
+        )
+    return IngestBenchmarkResult(
+        dataset.value,
+        loader_format.value,
+        num_procs,
+        bulk_size,
+        num_indexed,
+        _uncompressed_size(dump_file),
+        seconds,
+        stats.num_requests,
+        stats.num_rejected,
+        stats.num_payload_bytes,
+        stats.max_concurrent_requests,
+    )
+
+
+def _load_document_dicts(
+    dataset: SyntheticDataset,
+    dump_file: Path,
+    *,
+    loader_format: IngestLoaderFormat,
+    batch_size: int,
+    json_backend: JsonBackend,
+) -> Union[Iterator[Mapping[str, object]], Iterator[DocumentLineBatch]]:
+    nasty = dataset == SyntheticDataset.NASTY_TWEETS
+    if loader_format == IngestLoaderFormat.DICTS:
+        return (
+            load_document_dicts_from_nasty_batch_results
+            if nasty
+            else load_document_dicts_from_pushshift_dump
+        )(dump_file, progress_bar=False, json_backend=json_backend)
+    return (
+        load_document_batches_from_nasty_batch_results
+        if nasty
+        else load_document_batches_from_pushshift_dump
+    )(
+        dump_file,
+        batch_size=batch_size,
+        progress_bar=False,
+        json_backend=json_backend,
+    )
+
+
+def _uncompressed_size(file: Path) -> int:
+    with DecompressingTextIOWrapper(file, encoding="UTF-8") as fin:
+        return sum(len(line.encode("UTF-8")) for line in fin)
+
+
+def write_ingest_benchmark_results(
+    file: Path, results: Sequence[IngestBenchmarkResult], **parameters: object
+) -> None:
+    """Writes results, the environment, and the given parameters as JSON."""
+
+    file.parent.mkdir(parents=True, exist_ok=True)
+    with file.open("w", encoding="UTF-8") as fout:
+        json.dump(
+            {
+                "created_at": datetime.now().isoformat(),
+                "nasty_data_version": nasty_data.__version__,
+                "python_implementation": platform.python_implementation(),
+                "python_version": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": cpu_count(),
+                **parameters,
+                "results": [
+                    {
+                        **result._asdict(),
+                        "documents_per_second": result.documents_per_second,
+                        "bytes_per_second": result.bytes_per_second,
+                    }
+                    for result in results
+                ],
+            },
+            fout,
+            indent=2,
+        )
+        fout.write("\n")
+    _LOGGER.info("Wrote benchmark results to '{}'.", file)
+
+
+def log_ingest_benchmark_results(results: Sequence[IngestBenchmarkResult]) -> None:
+    lines = [
+        f"{'Dataset':<16} {'Loader':<10} {'procs':>5} {'bulk':>6} {'docs/s':>10} "
+        f"{'MiB/s':>7} {'requests':>8} {'rejected':>8} {'sent MiB':>8}"
+    ]
+    for result in results:
+        lines.append(
+            f"{result.dataset:<16} {result.loader_format:<10} {result.num_procs:>5} "
+            f"{result.bulk_size:>6} {result.documents_per_second:>10,.0f} "
+            f"{result.bytes_per_second / (1024 * 1024):>7.1f} "
+            f"{result.num_requests:>8} {result.num_rejected:>8} "
+            f"{result.num_payload_bytes / (1024 * 1024):>8.1f}"
+        )
+    _LOGGER.info("Benchmark results:\n{}", "\n".join(lines))
@@ -0,0 +1,346 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import gc
+import json
+import platform
+from datetime import datetime
+from logging import getLogger
+from pathlib import Path
+from time import perf_counter
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    MutableMapping,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
+
+from elasticsearch_dsl import Field, Object
+from elasticsearch_dsl.utils import ObjectBase
+from nasty_utils import ColoredBraceStyleAdapter
+
+import nasty_data
+from nasty_data.benchmark.synthetic import (
+    SyntheticDataset,
+    generate_synthetic_documents,
+)
+from nasty_data.document.reddit import RedditDate
+from nasty_data.document.twitter import TwitterJsonAsStr
+from nasty_data.elasticsearch_.index import BaseDocument, _make_upsert_op
+from nasty_data.elasticsearch_.serializer import JsonBackend, json_loads_func
+
+_LOGGER = ColoredBraceStyleAdapter(getLogger(__name__))
+
+_T_Item = TypeVar("_T_Item")
+
+# Fields whose deserialization is benchmarked on its own, because it is custom code that
+# runs for many values of each document.
+_BENCHMARKED_FIELD_TYPES: Tuple[Type[Field], ...] = (RedditDate, TwitterJsonAsStr)
+
+
+class MicroBenchmarkResult(NamedTuple):
+    """Best time of one benchmark over all repetitions.
+
+    For benchmarks of single fields, `num_documents` counts field values instead, and
+    `num_bytes` are their bytes as JSON.
+    """
+
+    dataset: str
+    document_cls: str
+    benchmark: str
+    num_documents: int
+    num_bytes: int
+    seconds: float
+
+    @property
+    def documents_per_second(self) -> float:
+        return self.num_documents / max(self.seconds, 1e-9)
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.num_bytes / max(self.seconds, 1e-9)
+
+
+def run_micro_benchmarks(
+    *,
+    datasets: Iterable[SyntheticDataset] = tuple(SyntheticDataset),
+    num_documents: int = 2000,
+    seed: int = 0,
+    repeat: int = 5,
+    json_backend: JsonBackend = JsonBackend.AUTO,
+) -> Sequence[MicroBenchmarkResult]:
+    """Measures the hot paths of converting raw documents to bulk actions.
+
+    For each dataset, `num_documents` synthetic documents are generated and serialized
+    to JSON lines. Then, the following steps are timed on their own: parsing the lines,
+    `from_dict()`, `full_clean()`, `to_dict()`, `_make_upsert_op()` (which is what
+    worker processes actually run), and deserializing the values of custom fields.
+    Each benchmark is run `repeat` times with the garbage collector disabled, and the
+    best time is reported, like `timeit` does.
+    """
+
+    if num_documents < 1:
+        raise ValueError(
+            f"Number of documents must be positive, but is {num_documents}."
+        )
+    if repeat < 1:
+        raise ValueError(f"Number of repetitions must be positive, but is {repeat}.")
+
+    results: List[MicroBenchmarkResult] = []
+    for dataset in datasets:
+        _LOGGER.info(
+            "Benchmarking {} synthetic {} ({} repetitions).",
+            num_documents,
+            dataset.value,
+            repeat,
+        )
+        results.extend(
+            _run_dataset_benchmarks(
+                dataset,
+                num_documents=num_documents,
+                seed=seed,
+                repeat=repeat,
+                json_backend=json_backend,
+            )
+        )
+    return results
+
+
+def _run_dataset_benchmarks(
+    dataset: SyntheticDataset,
+    *,
+    num_documents: int,
+    seed: int,
+    repeat: int,
+    json_backend: JsonBackend,
+) -> Sequence[MicroBenchmarkResult]:
+    document_cls = dataset.document_cls
+    lines = [
+        json.dumps(document_dict)
+        for document_dict in generate_synthetic_documents(
+            dataset, num_documents=num_documents, seed=seed
+        )
+    ]
+    num_bytes = sum(len(line.encode("UTF-8")) for line in lines)
+    loads = json_loads_func(json_backend)
+    document_dicts = [loads(line) for line in lines]
+
+    def result(benchmark: str, seconds: float) -> MicroBenchmarkResult:
+        return MicroBenchmarkResult(
+            dataset.value,
+            document_cls.__name__,
+            benchmark,
+            num_documents,
+            num_bytes,
+            seconds,
+        )
+
+    def make_documents() -> Sequence[BaseDocument]:
+        return [
+            document_cls.from_dict(document_dict) for document_dict in document_dicts
+        ]
+
+    def make_cleaned_documents() -> Sequence[BaseDocument]:
+        documents = make_documents()
+        for document in documents:
+            document.full_clean()
+        return documents
+
+    results = [
+        result("json_loads", _best_time(loads, lines, repeat=repeat)),
+        result(
+            "from_dict",
+            _best_time(document_cls.from_dict, document_dicts, repeat=repeat),
+        ),
+        result(
+            "full_clean",
+            _best_time(
+                lambda document: document.full_clean(), make_documents, repeat=repeat
+            ),
+        ),
+        result(
+            "to_dict",
+            _best_time(
+                lambda document: document.to_dict(),
+                make_cleaned_documents,
+                repeat=repeat,
+            ),
+        ),
+        result(
+            "make_upsert_op",
+            _best_time(
+                lambda document_dict: _make_upsert_op(
+                    document_dict, index_name="benchmark", document_cls=document_cls
+                ),
+                document_dicts,
+                repeat=repeat,
+            ),
+        ),
+    ]
+
+    field_values: Dict[Type[Field], List[Tuple[Field, object]]] = {}
+    for document_dict in document_dicts:
+        prepared_document_dict = document_cls.copy_doc_dict(document_dict)
+        document_cls.prepare_doc_dict(prepared_document_dict)
+        _collect_field_values(prepared_document_dict, document_cls, field_values)
+    for field_type, values in field_values.items():
+        results.append(
+            MicroBenchmarkResult(
+                dataset.value,
+                document_cls.__name__,
+                field_type.__name__ + ".deserialize",
+                len(values),
+                sum(len(json.dumps(value).encode("UTF-8")) for _, value in values),
+                _best_time(
+                    lambda field_value: field_value[0].deserialize(field_value[1]),
+                    values,
+                    repeat=repeat,
+                ),
+            )
+        )
+
+    return results
+
+
+def _best_time(
+    func: Callable[[_T_Item], object],
+    items: Union[Sequence[_T_Item], Callable[[], Sequence[_T_Item]]],
+    *,
+    repeat: int,
+) -> float:
+    # If items is callable, it is called before each repetition to get fresh items, for
+    # benchmarks that modify them.
+    best = float("inf")
+    for _ in range(repeat):
+        current_items = items() if callable(items) else items
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            start = perf_counter()
+            for item in current_items:
+                func(item)
+            best = min(best, perf_counter() - start)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+    return best
+
+
+def _collect_field_values(
+    doc_dict: Mapping[str, object],
+    document_cls: Type[ObjectBase],
+    field_values: MutableMapping[Type[Field], List[Tuple[Field, object]]],
+) -> None:
+    mapping = document_cls._doc_type.mapping
+    for key, value in doc_dict.items():
+        if key not in mapping or value is None:
+            continue
+        field = mapping[key]
+        if isinstance(field, Object):
+            for inner_doc_dict in value if isinstance(value, list) else [value]:
+                if isinstance(inner_doc_dict, Mapping):
+                    _collect_field_values(
+                        inner_doc_dict, field._doc_class, field_values
+                    )
+        elif isinstance(field, _BENCHMARKED_FIELD_TYPES):
+            field_values.setdefault(type(field), []).append((field, value))
+
+
+def write_micro_benchmark_results(
+    file: Path,
+    results: Sequence[MicroBenchmarkResult],
+    *,
+    num_documents: int,
+    seed: int,
+    repeat: int,
+) -> None:
+    """Writes results and the environment they were measured in as JSON."""
+
+    file.parent.mkdir(parents=True, exist_ok=True)
+    with file.open("w", encoding="UTF-8") as fout:
+        json.dump(
+            {
+                "created_at": datetime.now().isoformat(),
+                "nasty_data_version": nasty_data.__version__,
+                "python_implementation": platform.python_implementation(),
+                "python_version": platform.python_version(),
+                "platform": platform.platform(),
+                "num_documents": num_documents,
+                "seed": seed,
+                "repeat": repeat,
+                "results": [
+                    {
+                        **result._asdict(),
+                        "documents_per_second": result.documents_per_second,
+                        "bytes_per_second": result.bytes_per_second,
+                    }
+                    for result in results
+                ],
+            },
+            fout,
+            indent=2,
+        )
+        fout.write("\n")
+    _LOGGER.info("Wrote benchmark results to '{}'.", file)
+
+
+def load_micro_benchmark_results(file: Path) -> Sequence[MicroBenchmarkResult]:
+    with file.open(encoding="UTF-8") as fin:
+        return [
+            MicroBenchmarkResult(
+                **{field: result[field] for field in MicroBenchmarkResult._fields}
+            )
+            for result in json.load(fin)["results"]
+        ]
+
+
+def log_micro_benchmark_results(
+    results: Sequence[MicroBenchmarkResult],
+    *,
+    baseline: Optional[Sequence[MicroBenchmarkResult]] = None,
+) -> None:
+    """Logs results as a table, with speedups relative to `baseline`, if given."""
+
+    baseline_by_key = {
+        (result.dataset, result.benchmark): result for result in baseline or []
+    }
+    lines = [
+        f"{'Dataset':<16} {'Benchmark':<28} {'docs/s':>12} {'MiB/s':>8}"
+        + (f" {'speedup':>8}" if baseline is not None else "")
+    ]
+    for result in results:
+        line = (
+            f"{result.dataset:<16} {result.benchmark:<28} "
+            f"{result.documents_per_second:>12,.0f} "
+            f"{result.bytes_per_second / (1024 * 1024):>8.1f}"
+        )
+        baseline_result = baseline_by_key.get((result.dataset, result.benchmark))
+        if baseline_result is not None:
+            speedup = result.documents_per_second / baseline_result.documents_per_second
+            line += f" {speedup:>7.2f}x"
+        elif baseline is not None:
+            line += f" {'-':>8}"
+        lines.append(line)
+    _LOGGER.info("Benchmark results:\n{}", "\n".join(lines))
@@ -0,0 +1,793 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+import lzma
+from datetime import datetime
+from enum import Enum
+from itertools import chain
+from math import log
+from pathlib import Path
+from random import Random
+from typing import (
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+    cast,
+)
+
+from zstandard import ZstdCompressor
+
+from nasty_data.elasticsearch_.index import BaseDocument
+from nasty_data.source.nasty_batch_results import NastyBatchResultsTwitterDocument
+from nasty_data.source.pushshift import PushshiftRedditDocument
+
+# Synthetic documents mimic the structure and value distributions of real documents,
+# not their content. Fields and their legacy variants follow the mappings (and their
+# comments) in nasty_data.document.
+
+_WORDS = (
+    *"the a to and of is that it in you for this was not on with but are have be they "
+    "just like what so if my people would can think one about reddit game post really "
+    "good know time argument because source actually evidence".split(),
+    # Non-ASCII words, so that characters and bytes differ like in real data.
+    "über",
+    "naïve",
+    "café",
+    "😂",
+    "👍",
+)
+_SUBREDDITS = (
+    "AskReddit",
+    "politics",
+    "worldnews",
+    "changemyview",
+    "funny",
+    "science",
+    "gaming",
+    "de",
+)
+_DOMAINS = ("i.redd.it", "imgur.com", "youtube.com", "nytimes.com", "v.redd.it")
+
+_TIMESTAMP_2006 = 1136073600
+_TIMESTAMP_2013 = 1356998400
+_TIMESTAMP_2017 = 1483228800
+_TIMESTAMP_2020 = 1577836800
+
+_MEDIA_STATS_VARIANTS = (
+    {"r": {"missing": None}, "ttl": -1},
+    {"r": "Missing", "ttl": -1},
+    {"r": {"ok": {"viewCount": "1234"}}, "ttl": -1},
+)
+
+
+class SyntheticDataset(Enum):
+    """Kinds of documents `generate_synthetic_documents()` can generate."""
+
+    REDDIT_LINKS = "reddit-links"
+    REDDIT_COMMENTS = "reddit-comments"
+    NASTY_TWEETS = "nasty-tweets"
+
+    @property
+    def document_cls(self) -> Type[BaseDocument]:
+        if self == SyntheticDataset.NASTY_TWEETS:
+            return NastyBatchResultsTwitterDocument
+        return PushshiftRedditDocument
+
+
+def generate_synthetic_documents(
+    dataset: SyntheticDataset, *, num_documents: int, seed: int = 0
+) -> Iterator[Dict[str, object]]:
+    """Generates raw document dicts like those yielded by the dump loaders.
+
+    The documents are fully determined by `seed`. Reddit links and comments cover
+    both the sparse legacy format of early Pushshift dumps (timestamps as strings or
+    floats, bools instead of dates for `edited`) and the current one (awards, flair
+    richtext, `media_metadata` mappings, `crosspost_parent_list`, ...). Tweets follow
+    the format of NASTY batch results. The meta field that the loaders add to each
+    document (`pushshift_dump_meta` or `nasty_batch_meta`) is included.
+    """
+
+    rng = Random(seed)
+    if dataset == SyntheticDataset.NASTY_TWEETS:
+        users = [_twitter_user(rng) for _ in range(max(1, num_documents // 10))]
+        batch_meta = _nasty_batch_meta(rng)
+        for i in range(num_documents):
+            yield _nasty_tweet(rng, i, users=users, batch_meta=batch_meta)
+        return
+
+    dump_meta = {
+        "dump_file": (
+            "RS_2019-01.zst"
+            if dataset == SyntheticDataset.REDDIT_LINKS
+            else "RC_2019-01.zst"
+        ),
+        "dump_type": (
+            "LINKS" if dataset == SyntheticDataset.REDDIT_LINKS else "COMMENTS"
+        ),
+        "dump_date": "2019-01-01",
+    }
+    for i in range(num_documents):
+        document_dict = (
+            _reddit_link(rng, i)
+            if dataset == SyntheticDataset.REDDIT_LINKS
+            else _reddit_comment(rng, i)
+        )
+        document_dict["pushshift_dump_meta"] = dump_meta
+        yield document_dict
+
+
+def write_synthetic_dump(
+    dataset: SyntheticDataset, directory: Path, *, num_documents: int, seed: int = 0
+) -> Path:
+    """Writes synthetic documents to a dump file like those the loaders read.
+
+    Reddit documents are written to a zstd-compressed Pushshift dump, tweets to the
+    xz-compressed data file of NASTY batch results with its meta file. The meta field
+    is not written with each document, because the loaders add it.
+
+    :return: Path of the written dump file, to pass to the loaders.
+    """
+
+    directory.mkdir(parents=True, exist_ok=True)
+    meta_field = cast(Tuple[str, str], dataset.document_cls.meta_field())[0]
+    document_dicts = generate_synthetic_documents(
+        dataset, num_documents=num_documents, seed=seed
+    )
+    # All documents share the same meta, which determines the file name.
+    first_document_dict = next(document_dicts)
+    meta = cast(Mapping[str, object], first_document_dict[meta_field])
+    lines = (
+        json.dumps(
+            {key: value for key, value in document_dict.items() if key != meta_field}
+        ).encode("UTF-8")
+        + b"\n"
+        for document_dict in chain([first_document_dict], document_dicts)
+    )
+
+    if dataset == SyntheticDataset.NASTY_TWEETS:
+        file = directory / f"{meta['id']}.data.jsonl.xz"
+        file.with_name(f"{meta['id']}.meta.json").write_text(
+            json.dumps(meta, indent=2), encoding="UTF-8"
+        )
+        with lzma.open(file, "wb") as fout:
+            fout.writelines(lines)
+    else:
+        file = directory / str(meta["dump_file"])
+        with file.open("wb") as fout_raw:
+            with ZstdCompressor().stream_writer(fout_raw) as fout:
+                for line in lines:
+                    fout.write(line)
+    return file
+
+
+def _text(rng: Random, mean_words: float) -> str:
+    # Text lengths are roughly log-normally distributed, with a long tail.
+    num_words = max(1, int(rng.lognormvariate(log(mean_words), 1.0)))
+    return " ".join(rng.choice(_WORDS) for _ in range(min(num_words, 2000)))
+
+
+def _base36(number: int) -> str:
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    result = ""
+    while True:
+        number, digit = divmod(number, 36)
+        result = digits[digit] + result
+        if not number:
+            return result
+
+
+def _legacy_timestamp(rng: Random, timestamp: int) -> object:
+    # Old dumps store timestamps as integers, but also as strings and floats.
+    return rng.choice((timestamp, str(timestamp), float(timestamp)))
+
+
+def _reddit_base(rng: Random, i: int, *, legacy: bool) -> Dict[str, object]:
+    if legacy:
+        created_utc = rng.randint(_TIMESTAMP_2006, _TIMESTAMP_2013)
+    else:
+        created_utc = rng.randint(_TIMESTAMP_2017, _TIMESTAMP_2020)
+    subreddit = rng.choice(_SUBREDDITS)
+    document_dict: Dict[str, object] = {
+        "id": _base36(1000000 + i),
+        "author": f"user_{rng.randint(1, 5000)}",
+        "author_flair_css_class": None,
+        "author_flair_text": rng.choice((None, None, _text(rng, 2))),
+        "created_utc": (_legacy_timestamp(rng, created_utc) if legacy else created_utc),
+        # Was a bool in early dumps, is the date of the edit nowadays.
+        "edited": rng.choice(
+            (False, False, False, True)
+            if legacy
+            else (False, False, False, created_utc + rng.randint(60, 86400))
+        ),
+        "retrieved_on": created_utc + rng.randint(86400, 86400 * 365),
+        "distinguished": rng.choice((None, None, None, "moderator")),
+        "gilded": rng.choice((0, 0, 0, 1)),
+        "score": int(rng.paretovariate(1.2)),
+        "stickied": False,
+        "subreddit": subreddit,
+        "subreddit_id": "t5_" + _base36(100000 + _SUBREDDITS.index(subreddit)),
+    }
+    if legacy:
+        document_dict.update(
+            ups=document_dict["score"],
+            downs=0,
+            archived=rng.random() < 0.5,
+        )
+        return document_dict
+
+    document_dict.update(
+        all_awardings=[
+            _reddit_awarding(rng, created_utc) for _ in range(rng.choice((0, 0, 0, 2)))
+        ],
+        approved_at_utc=None,
+        associated_award=None,
+        author_created_utc=created_utc - rng.randint(86400, 86400 * 3000),
+        author_flair_background_color=rng.choice((None, "", "#edeff1")),
+        author_flair_richtext=(
+            [{"e": "text", "t": _text(rng, 2)}] if rng.random() < 0.2 else []
+        ),
+        author_flair_template_id=None,
+        author_flair_text_color=rng.choice((None, "dark")),
+        author_flair_type=rng.choice(("text", "richtext")),
+        author_fullname="t2_" + _base36(rng.randint(10 ** 6, 10 ** 8)),
+        author_patreon_flair=False,
+        author_premium=rng.random() < 0.05,
+        awarders=[],
+        banned_at_utc=None,
+        can_gild=True,
+        can_mod_post=False,
+        gildings=rng.choice(({}, {}, {"gid_1": 1}, {"gid_2": 1, "gid_3": 1})),
+        locked=False,
+        mod_reports=[],
+        no_follow=rng.random() < 0.7,
+        permalink=f"/r/{subreddit}/comments/{document_dict['id']}/",
+        rte_mode="markdown",
+        send_replies=True,
+        steward_reports=[],
+        subreddit_name_prefixed="r/" + subreddit,
+        subreddit_type="public",
+        total_awards_received=0,
+        user_reports=[],
+    )
+    if rng.random() < 0.05:
+        # A mapping of IDs to objects, turned into a list by prepare_doc_dict().
+        media_ids = [_base36(rng.randint(10 ** 9, 10 ** 10)) for _ in range(2)]
+        document_dict["media_metadata"] = {
+            media_id: {
+                "e": "Image",
+                "id": media_id,
+                "m": "image/png",
+                "s": {"u": f"https://i.redd.it/{media_id}.png", "x": 640, "y": 480},
+                "status": "valid",
+            }
+            for media_id in media_ids
+        }
+    return document_dict
+
+
+def _reddit_awarding(rng: Random, created_utc: int) -> Dict[str, object]:
+    return {
+        "award_type": "global",
+        "coin_price": rng.choice((100, 500, 1800)),
+        "coin_reward": 0,
+        "count": rng.randint(1, 3),
+        "days_of_drip_extension": 0,
+        "days_of_premium": rng.choice((0, 7)),
+        "description": _text(rng, 8),
+        "end_date": rng.choice((None, created_utc + 86400 * 30)),
+        "icon_height": 512,
+        "icon_url": "https://www.redditstatic.com/gold/awards/icon/silver_512.png",
+        "icon_width": 512,
+        "id": rng.choice(("gid_1", "gid_2", "gid_3")),
+        "is_enabled": True,
+        "name": rng.choice(("Silver", "Gold", "Platinum")),
+        "resized_icons": [
+            {
+                "height": size,
+                "url": f"https://www.redditstatic.com/gold/awards/icon/{size}.png",
+                "width": size,
+            }
+            for size in (16, 32, 48, 64, 128)
+        ],
+        "start_date": None,
+        "subreddit_coin_reward": 0,
+        "subreddit_id": None,
+    }
+
+
+def _reddit_comment(rng: Random, i: int) -> Dict[str, object]:
+    legacy = rng.random() < 0.3
+    document_dict = _reddit_base(rng, i, legacy=legacy)
+    link_id = "t3_" + _base36(rng.randint(10 ** 6, 10 ** 7))
+    document_dict.update(
+        body=rng.choice((_text(rng, 25), _text(rng, 25), "[deleted]")),
+        controversiality=rng.choice((0, 0, 0, 1)),
+        link_id=link_id,
+        parent_id=(
+            link_id
+            if rng.random() < 0.4
+            else "t1_" + _base36(rng.randint(10 ** 6, 10 ** 7))
+        ),
+    )
+    if legacy:
+        document_dict["score_hidden"] = False
+    else:
+        document_dict.update(
+            collapsed=False,
+            collapsed_because_crowd_control=None,
+            collapsed_reason=None,
+            is_submitter=rng.random() < 0.1,
+            quarantined=False,
+            removal_reason=None,
+        )
+    return document_dict
+
+
+def _reddit_link(rng: Random, i: int) -> Dict[str, object]:
+    legacy = rng.random() < 0.3
+    document_dict = _reddit_base(rng, i, legacy=legacy)
+    created_utc = float(cast(Union[int, str, float], document_dict["created_utc"]))
+    is_self = rng.random() < 0.4
+    domain = "self." + str(document_dict["subreddit"]) if is_self else None
+    domain = domain or rng.choice(_DOMAINS)
+    document_dict.update(
+        domain=domain,
+        is_self=is_self,
+        media=None,
+        media_embed={},
+        num_comments=int(rng.paretovariate(1.0)),
+        over_18=rng.random() < 0.05,
+        permalink=f"/r/{document_dict['subreddit']}/comments/{document_dict['id']}/",
+        selftext=_text(rng, 60) if is_self else "",
+        thumbnail=rng.choice(
+            ("default", "self", "https://b.thumbs.redditmedia.com/x.jpg")
+        ),
+        title=_text(rng, 10),
+        url=f"https://{domain}/{_base36(rng.randint(10 ** 6, 10 ** 9))}",
+    )
+    if legacy:
+        # Old dumps contain a local creation time as float next to the UTC one.
+        document_dict["created"] = float(rng.randint(_TIMESTAMP_2006, _TIMESTAMP_2013))
+        return document_dict
+
+    document_dict.update(
+        allow_live_comments=False,
+        contest_mode=False,
+        is_crosspostable=True,
+        is_original_content=False,
+        is_reddit_media_domain=domain in ("i.redd.it", "v.redd.it"),
+        is_robot_indexable=True,
+        is_video=domain == "v.redd.it",
+        link_flair_richtext=(
+            [{"e": "text", "t": _text(rng, 2)}] if rng.random() < 0.3 else []
+        ),
+        link_flair_type="richtext",
+        num_crossposts=0,
+        parent_whitelist_status="all_ads",
+        pinned=False,
+        post_hint=rng.choice(("image", "link", "self", "rich:video")),
+        pwls=6,
+        secure_media=None,
+        secure_media_embed={},
+        spoiler=False,
+        suggested_sort=None,
+        thumbnail_height=140,
+        thumbnail_width=140,
+        whitelist_status="all_ads",
+        wls=6,
+    )
+    if domain == "youtube.com":
+        document_dict["media"] = document_dict["secure_media"] = _reddit_media(rng)
+        document_dict["media_embed"] = document_dict["secure_media_embed"] = {
+            "content": "&lt;iframe&gt;&lt;/iframe&gt;",
+            "height": 338,
+            "scrolling": False,
+            "width": 600,
+        }
+    if not is_self:
+        document_dict["preview"] = _reddit_preview(rng)
+    if rng.random() < 0.05:
+        # Discarded by prepare_doc_dict().
+        document_dict["crosspost_parent"] = "t3_" + _base36(
+            rng.randint(10 ** 6, 10 ** 7)
+        )
+        document_dict["crosspost_parent_list"] = [_reddit_link(rng, i + 1)]
+    if rng.random() < 0.01:
+        document_dict["collections"] = [
+            {
+                "author_id": document_dict["author_fullname"],
+                "author_name": document_dict["author"],
+                "collection_id": "7c5f1a3e-0000-4000-8000-000000000000",
+                "created_at_utc": created_utc + 0.123,
+                "description": _text(rng, 10),
+                "display_layout": None,
+                "last_update_utc": created_utc + 60.5,
+                "link_ids": ["t3_" + str(document_dict["id"])],
+                "permalink": "https://www.reddit.com/r/x/collection/7c5f1a3e",
+                "subreddit_id": document_dict["subreddit_id"],
+                "title": _text(rng, 4),
+            }
+        ]
+    if rng.random() < 0.01:
+        # Promoted links, with timestamps in milliseconds.
+        document_dict["promoted"] = True
+        document_dict["outbound_link"] = {
+            "created": int(created_utc) * 1000 + 123,
+            "expiration": int(created_utc) * 1000 + 3600123,
+            "url": "https://alb.reddit.com/cr",
+        }
+    if rng.random() < 0.01:
+        document_dict["previous_visits"] = [
+            created_utc + rng.random() * 86400 for _ in range(3)
+        ]
+    return document_dict
+
+
+def _reddit_media(rng: Random) -> Dict[str, object]:
+    return {
+        "oembed": {
+            "author_name": f"channel_{rng.randint(1, 500)}",
+            "author_url": "https://www.youtube.com/user/x",
+            "height": 338,
+            "html": "&lt;iframe width=&quot;600&quot;&gt;&lt;/iframe&gt;",
+            "provider_name": "YouTube",
+            "provider_url": "https://www.youtube.com/",
+            "thumbnail_height": 360,
+            "thumbnail_url": "https://i.ytimg.com/vi/x/hqdefault.jpg",
+            "thumbnail_width": 480,
+            "title": _text(rng, 8),
+            "type": "video",
+            "version": "1.0",
+            "width": 600,
+        },
+        "type": "youtube.com",
+    }
+
+
+def _reddit_preview(rng: Random) -> Dict[str, object]:
+    def image(width: int, height: int) -> Dict[str, object]:
+        return {
+            "height": height,
+            "url": f"https://preview.redd.it/{_base36(rng.randint(10 ** 9, 10 ** 10))}",
+            "width": width,
+        }
+
+    resolutions = [image(width, width * 3 // 4) for width in (108, 216, 320, 640)]
+    return {
+        "enabled": rng.random() < 0.5,
+        "images": [
+            {
+                "id": _base36(rng.randint(10 ** 9, 10 ** 10)),
+                "resolutions": resolutions,
+                "source": image(1024, 768),
+                "variants": (
+                    {"gif": {"resolutions": resolutions, "source": image(1024, 768)}}
+                    if rng.random() < 0.1
+                    else {}
+                ),
+            }
+        ],
+    }
+
+
+def _twitter_timestamp(timestamp: int) -> str:
+    return datetime.utcfromtimestamp(timestamp).strftime("%a %b %d %H:%M:%S +0000 %Y")
+
+
+def _twitter_entities(
+    rng: Random, text: str, *, users: Sequence[Mapping[str, object]]
+) -> Dict[str, object]:
+    return {
+        "hashtags": [
+            {"indices": [0, 8], "text": rng.choice(_WORDS)}
+            for _ in range(rng.choice((0, 0, 1, 3)))
+        ],
+        "symbols": [],
+        "user_mentions": [
+            {
+                "id": user["id"],
+                "id_str": user["id_str"],
+                "indices": [0, 12],
+                "name": user["name"],
+                "screen_name": user["screen_name"],
+            }
+            for user in rng.sample(users, min(len(users), rng.choice((0, 0, 1, 2))))
+        ],
+        "urls": [
+            {
+                "url": "https://t.co/" + _base36(rng.randint(10 ** 9, 10 ** 10)),
+                "expanded_url": "https://example.com/" + rng.choice(_WORDS),
+                "display_url": "example.com/…",
+                "indices": [len(text) - 23, len(text)],
+            }
+            for _ in range(rng.choice((0, 0, 1)))
+        ],
+    }
+
+
+def _twitter_media(
+    rng: Random, *, users: Sequence[Mapping[str, object]]
+) -> Dict[str, object]:
+    media_id = rng.randint(10 ** 18, 10 ** 19)
+    is_video = rng.random() < 0.3
+    media: Dict[str, object] = {
+        "id": media_id,
+        "id_str": str(media_id),
+        "indices": [100, 123],
+        "media_url": f"http://pbs.twimg.com/media/{media_id}.jpg",
+        "media_url_https": f"https://pbs.twimg.com/media/{media_id}.jpg",
+        "url": "https://t.co/" + _base36(media_id % 10 ** 10),
+        "display_url": "pic.twitter.com/x",
+        "expanded_url": "https://twitter.com/x/status/1/photo/1",
+        "type": "video" if is_video else "photo",
+        "original_info": {
+            "height": 1080,
+            "width": 1920,
+            "focus_rects": [{"x": 0, "y": 0, "h": 1080, "w": 1080}],
+        },
+        "sizes": {
+            name: {"h": h, "w": w, "resize": "fit" if name != "thumb" else "crop"}
+            for name, h, w in (
+                ("thumb", 150, 150),
+                ("large", 1080, 1920),
+                ("medium", 675, 1200),
+                ("small", 383, 680),
+            )
+        },
+        "features": {
+            name: {"faces": []} for name in ("small", "medium", "large", "orig")
+        },
+        "media_key": f"3_{media_id}",
+        "ext_media_availability": {"status": "available"},
+        "ext_media_color": {
+            "palette": [
+                {
+                    "rgb": {
+                        "red": rng.randint(0, 255),
+                        "green": rng.randint(0, 255),
+                        "blue": rng.randint(0, 255),
+                    },
+                    "percentage": round(rng.random() * 100, 2),
+                }
+                for _ in range(3)
+            ]
+        },
+        "ext_alt_text": None,
+        "ext": {"mediaStats": rng.choice(_MEDIA_STATS_VARIANTS)},
+    }
+    if is_video:
+        media["video_info"] = {
+            "aspect_ratio": [16, 9],
+            "duration_millis": rng.randint(1000, 140000),
+            "variants": [
+                {
+                    "bitrate": bitrate,
+                    "content_type": "video/mp4",
+                    "url": f"https://video.twimg.com/{media_id}/{bitrate}.mp4",
+                }
+                for bitrate in (256000, 832000, 2176000)
+            ],
+        }
+        # Removed by prepare_doc_dict().
+        media["additional_media_info"] = {
+            "monetizable": False,
+            "source_user": rng.choice(users),
+        }
+    return media
+
+
+def _twitter_user(rng: Random) -> Dict[str, object]:
+    user_id = rng.randint(10 ** 6, 10 ** 18)
+    screen_name = f"user_{_base36(user_id)[:10]}"
+    media_stats = rng.choice(_MEDIA_STATS_VARIANTS)
+    profile_image_url = f"pbs.twimg.com/profile_images/{user_id}.jpg"
+    return {
+        "id": user_id,
+        "id_str": str(user_id),
+        "name": _text(rng, 2)[:50],
+        "screen_name": screen_name,
+        "location": rng.choice(("", "Berlin", "New York, NY", "🌍")),
+        "description": _text(rng, 15),
+        "url": None,
+        "entities": {"description": {"urls": []}},
+        "protected": False,
+        "followers_count": int(rng.paretovariate(0.8)),
+        "fast_followers_count": 0,
+        "normal_followers_count": int(rng.paretovariate(0.8)),
+        "friends_count": int(rng.paretovariate(1.0)),
+        "listed_count": int(rng.paretovariate(1.5)),
+        "created_at": _twitter_timestamp(rng.randint(_TIMESTAMP_2006, _TIMESTAMP_2020)),
+        "favourites_count": int(rng.paretovariate(0.8)),
+        "utc_offset": None,
+        "time_zone": None,
+        "geo_enabled": rng.random() < 0.3,
+        "verified": rng.random() < 0.02,
+        "statuses_count": int(rng.paretovariate(0.7)),
+        "media_count": int(rng.paretovariate(1.0)),
+        "lang": None,
+        "contributors_enabled": False,
+        "is_translator": False,
+        "is_translation_enabled": False,
+        "translator_type": "none",
+        "withheld_in_countries": [],
+        "profile_background_color": "F5F8FA",
+        "profile_background_image_url": None,
+        "profile_background_image_url_https": None,
+        "profile_background_tile": False,
+        "profile_image_extensions": {"mediaStats": media_stats},
+        "profile_image_extensions_alt_text": None,
+        "profile_image_extensions_media_availability": None,
+        "profile_image_url": f"http://{profile_image_url}",
+        "profile_image_url_https": f"https://{profile_image_url}",
+        "profile_link_color": "1DA1F2",
+        "profile_sidebar_border_color": "C0DEED",
+        "profile_sidebar_fill_color": "DDEEF6",
+        "profile_text_color": "333333",
+        "profile_use_background_image": True,
+        "has_extended_profile": False,
+        "default_profile": True,
+        "default_profile_image": False,
+        "pinned_tweet_ids": [],
+        "pinned_tweet_ids_str": [],
+        "has_custom_timelines": False,
+        "can_dm": None,
+        "can_media_tag": None,
+        "following": None,
+        "follow_request_sent": None,
+        "notifications": None,
+        "muting": None,
+        "blocking": None,
+        "blocked_by": None,
+        "want_retweets": None,
+        "followed_by": None,
+        "ext": {"highlightedLabel": {"r": {"ok": {}}, "ttl": -1}},
+        "advertiser_account_type": "none",
+        "advertiser_account_service_levels": [],
+        "profile_interstitial_type": "",
+        "business_profile_state": "none",
+        "require_some_consent": False,
+    }
+
+
+def _nasty_batch_meta(rng: Random) -> Dict[str, object]:
+    return {
+        "id": "%032x" % rng.getrandbits(128),
+        "request": {
+            "type": "search",
+            "query": rng.choice(_WORDS),
+            "since": "2019-01-01",
+            "until": "2019-01-02",
+            "filter": "LATEST",
+            "lang": "en",
+            "max_tweets": None,
+            "batch_size": 20,
+        },
+        "completed_at": "2020-01-01T00:00:00.000000",
+    }
+
+
+def _nasty_tweet(
+    rng: Random,
+    i: int,
+    *,
+    users: Sequence[Mapping[str, object]],
+    batch_meta: Mapping[str, object],
+) -> Dict[str, object]:
+    tweet_id = 1080000000000000000 + i * 7919
+    text = _text(rng, 20)[:280]
+    user = rng.choice(users)
+    in_reply_to: Optional[Mapping[str, object]] = (
+        rng.choice(users) if rng.random() < 0.3 else None
+    )
+
+    entities = _twitter_entities(rng, text, users=users)
+    document_dict: Dict[str, object] = {
+        "created_at": _twitter_timestamp(_TIMESTAMP_2017 + i * 13),
+        "id": tweet_id,
+        "id_str": str(tweet_id),
+        "full_text": text,
+        "truncated": False,
+        "display_text_range": [0, len(text)],
+        "entities": entities,
+        "source": '<a href="https://mobile.twitter.com" rel="nofollow">Twitter Web App'
+        "</a>",
+        "in_reply_to_status_id": tweet_id - 7919 if in_reply_to else None,
+        "in_reply_to_status_id_str": str(tweet_id - 7919) if in_reply_to else None,
+        "in_reply_to_user_id": in_reply_to["id"] if in_reply_to else None,
+        "in_reply_to_user_id_str": in_reply_to["id_str"] if in_reply_to else None,
+        "in_reply_to_screen_name": (
+            in_reply_to["screen_name"] if in_reply_to else None
+        ),
+        "geo": None,
+        "coordinates": None,
+        "place": None,
+        "contributors": None,
+        "is_quote_status": False,
+        "retweet_count": int(rng.paretovariate(1.5)) - 1,
+        "favorite_count": int(rng.paretovariate(1.2)) - 1,
+        "reply_count": int(rng.paretovariate(2.0)) - 1,
+        "conversation_id": tweet_id,
+        "conversation_id_str": str(tweet_id),
+        "favorited": False,
+        "retweeted": False,
+        "lang": rng.choice(("en", "en", "en", "de", "und")),
+        "user": user,
+        "nasty_batch_meta": batch_meta,
+    }
+
+    if rng.random() < 0.2:
+        medias: List[Dict[str, object]] = [
+            _twitter_media(rng, users=users) for _ in range(rng.choice((1, 1, 4)))
+        ]
+        entities["media"] = medias[:1]
+        document_dict["extended_entities"] = {"media": medias}
+        document_dict["possibly_sensitive"] = False
+        document_dict["possibly_sensitive_editable"] = True
+    if rng.random() < 0.02:
+        latitude, longitude = rng.uniform(-90, 90), rng.uniform(-180, 180)
+        document_dict["geo"] = {"type": "Point", "coordinates": [latitude, longitude]}
+        document_dict["coordinates"] = {
+            "type": "Point",
+            "coordinates": [longitude, latitude],
+        }
+    if rng.random() < 0.05:
+        document_dict["place"] = {
+            "attributes": {},
+            "bounding_box": {
+                "type": "Polygon",
+                "coordinates": [
+                    [[13.08, 52.33], [13.76, 52.33], [13.76, 52.67], [13.08, 52.67]]
+                ],
+            },
+            "contained_within": [],
+            "country": "Germany",
+            "country_code": "DE",
+            "full_name": "Berlin, Germany",
+            "id": "3078869807f9dd36",
+            "name": "Berlin",
+            "place_type": "city",
+            "url": "https://api.twitter.com/1.1/geo/id/3078869807f9dd36.json",
+        }
+    if rng.random() < 0.1:
+        # Cards are kept as JSON strings.
+        document_dict["card"] = {
+            "name": "summary_large_image",
+            "url": "https://t.co/" + _base36(rng.randint(10 ** 9, 10 ** 10)),
+            "binding_values": {
+                "title": {"type": "STRING", "string_value": _text(rng, 8)},
+                "description": {"type": "STRING", "string_value": _text(rng, 20)},
+                "domain": {"type": "STRING", "string_value": rng.choice(_DOMAINS)},
+            },
+        }
+    if rng.random() < 0.1:
+        document_dict["is_quote_status"] = True
+        document_dict["quoted_status_id"] = tweet_id - 1
+        document_dict["quoted_status_id_str"] = str(tweet_id - 1)
+        document_dict["quoted_status_permalink"] = {
+            "url": "https://t.co/x",
+            "expanded": f"https://twitter.com/x/status/{tweet_id - 1}",
+            "display": "twitter.com/x/status/…",
+        }
+    if rng.random() < 0.05:
+        document_dict["self_thread"] = {"id": tweet_id, "id_str": str(tweet_id)}
+    return document_dict
@@ -14,11 +14,31 @@
 # limitations under the License.
 #
 
+from asyncio import new_event_loop
+from contextlib import ExitStack
 from datetime import date
+from enum import Enum
+from functools import partial
 from inspect import signature
+from itertools import islice
 from logging import getLogger
+from os import cpu_count
 from pathlib import Path
-from typing import Callable, Iterator, Mapping, Optional, Type, TypeVar, cast
+from tempfile import TemporaryDirectory
+from time import monotonic
+from typing import (
+    Callable,
+    Dict,
+    Iterator,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+    cast,
+)
 
 from nasty_utils import (
     Argument,
@@ -35,16 +55,46 @@ from overrides import overrides
 from pydantic import validator
 
 import nasty_data
+from nasty_data.benchmark.ingest import IngestLoaderFormat
+from nasty_data.benchmark.synthetic import SyntheticDataset
+from nasty_data.elasticsearch_.backpressure import InFlightWindow
+from nasty_data.elasticsearch_.bulk import AdaptiveBulkSizer
+from nasty_data.elasticsearch_.bulk_ndjson import (
+    find_bulk_ndjson_manifests,
+    replay_bulk_ndjson,
+    write_bulk_ndjson,
+)
+from nasty_data.elasticsearch_.checkpoint import DumpCheckpoint
+from nasty_data.elasticsearch_.content_hash import ContentHashStore
+from nasty_data.elasticsearch_.converter import verify_document_converter
+from nasty_data.elasticsearch_.dead_letter import DeadLetterFile
+from nasty_data.elasticsearch_.dedupe import DuplicatePolicy
+from nasty_data.elasticsearch_.dump_files import find_dump_files, index_dump_files
 from nasty_data.elasticsearch_.index import (
     BaseDocument,
+    DocumentLineBatch,
     add_documents_to_index,
     analyze_index,
+    bulk_load_index_settings,
+    find_duplicate_document_ids,
     new_index,
+    serialize_documents,
 )
+from nasty_data.elasticsearch_.metrics import IngestMetrics, MetricsExporter
+from nasty_data.elasticsearch_.serializer import elasticsearch_serializer
 from nasty_data.elasticsearch_.settings import ElasticsearchSettings
+from nasty_data.profiling import Profiler
+from nasty_data.source.nasty_batch_results import (
+    is_nasty_batch_results_file,
+    load_document_batches_from_nasty_batch_results,
+    load_document_dicts_from_nasty_batch_results,
+)
 from nasty_data.source.pushshift import (
     PushshiftDumpType,
     download_pushshift_dumps,
+    is_pushshift_dump_file,
+    load_document_batches_from_pushshift_dump,
+    load_document_dicts_from_pushshift_dump,
     sample_pushshift_dumps,
 )
 
@@ -52,6 +102,9 @@ _LOGGER = ColoredBraceStyleAdapter(getLogger(__name__))
 
 _T_BaseDocument = TypeVar("_T_BaseDocument", bound=BaseDocument)
 _T_Validator = classmethod
+_T_LoadDocumentDictsFunc = Callable[
+    ..., Union[Iterator[Mapping[str, object]], Iterator[DocumentLineBatch]]
+]
 
 
 class _NastyElasticsearchSettings(ElasticsearchSettings):
@@ -68,9 +121,7 @@ def _document_cls_validator(value: str) -> Type[BaseDocument]:
     return cast(Type[BaseDocument], document_cls)
 
 
-def _load_document_dicts_func_validator(
-    value: str,
-) -> Callable[[Path], Iterator[Mapping[str, object]]]:
+def _load_document_dicts_func_validator(value: str) -> _T_LoadDocumentDictsFunc:
     load_document_dicts_func = lookup_qualified_name(value)
     if not callable(load_document_dicts_func):
         raise ValueError(
@@ -84,13 +135,23 @@ def _load_document_dicts_func_validator(
             "annotation exists.",
             load_document_dicts_func,
         )
-    elif sig.return_annotation != Iterator[Mapping[str, object]]:
+    elif sig.return_annotation not in (
+        Iterator[Mapping[str, object]],
+        Iterator[DocumentLineBatch],
+    ):
         raise ValueError(
             f"Return type annotation of given function "
-            f"{repr(load_document_dicts_func)} is not "
-            f"{repr(Iterator[Mapping[str, object]])} but instead "
+            f"{repr(load_document_dicts_func)} is neither "
+            f"{repr(Iterator[Mapping[str, object]])} nor "
+            f"{repr(Iterator[DocumentLineBatch])} but instead "
             f"{repr(sig.return_annotation)}."
         )
+    elif sig.return_annotation == Iterator[DocumentLineBatch]:
+        if "batch_size" not in sig.parameters:
+            raise ValueError(
+                f"Given function {repr(load_document_dicts_func)} yields batches but "
+                f"does not accept a batch_size parameter."
+            )
 
     if len(sig.parameters) < 1:
         raise ValueError(
@@ -112,15 +173,19 @@ def _load_document_dicts_func_validator(
             f"`{repr(param.annotation)}."
         )
 
-    return cast(
-        Callable[[Path], Iterator[Mapping[str, object]]], load_document_dicts_func
-    )
+    return cast(_T_LoadDocumentDictsFunc, load_document_dicts_func)
 
 
 def _yyyy_mm_validator(value: Optional[str]) -> Optional[date]:
     return parse_yyyy_mm(value) if value else None
 
 
+def _comma_separated_validator(value: object) -> object:
+    if isinstance(value, str):
+        return [part.strip() for part in value.split(",") if part.strip()]
+    return value
+
+
 _NEW_INDEX_ARGUMENT_GROUP = ArgumentGroup(name="New Index Arguments")
 
 
@@ -180,6 +245,39 @@ class _NewIndexProgram(Program):
 
 _INDEX_DUMP_ARGUMENT_GROUP = ArgumentGroup(name="Index Dump Arguments")
 
+# Which files in a directory of dumps the loaders of this package can read. Files for
+# other loaders are only filtered by find_dump_files() itself.
+_DUMP_FILE_FUNCS: Sequence[
+    Tuple[Sequence[Callable[..., object]], Callable[[Path], bool]]
+] = [
+    (
+        [
+            load_document_dicts_from_pushshift_dump,
+            load_document_batches_from_pushshift_dump,
+        ],
+        is_pushshift_dump_file,
+    ),
+    (
+        [
+            load_document_dicts_from_nasty_batch_results,
+            load_document_batches_from_nasty_batch_results,
+        ],
+        is_nasty_batch_results_file,
+    ),
+]
+
+
+class _IngestEngine(Enum):
+    POOL = "pool"
+    ASYNCIO = "asyncio"
+
+
+# Used to size the Bloom filters of --dedupe. Compressed Pushshift dumps have about 50
+# to 100 bytes per document, more documents only cost some more memory.
+_DUMP_BYTES_PER_DOCUMENT = 64
+
+_DEFAULT_CHECKPOINT_INTERVAL = 100000
+
 
 class _IndexDumpProgram(Program):
     class Config(ProgramConfig):
@@ -204,33 +302,288 @@ class _IndexDumpProgram(Program):
         metavar="FQN",
         group=_NEW_INDEX_ARGUMENT_GROUP,
     )
-    load_document_dicts_func: Callable[
-        [Path], Iterator[Mapping[str, object]]
-    ] = Argument(
+    load_document_dicts_func: _T_LoadDocumentDictsFunc = Argument(
         alias="load-fun",
         short_alias="l",
         description=(
             "Fully-qualified name of function taking a file path and yielding document "
-            "dicts (passed to --class init)."
+            "dicts (passed to --class init) or batches of unparsed lines."
         ),
         metavar="FQN",
         group=_NEW_INDEX_ARGUMENT_GROUP,
     )
     file: Path = Argument(
         short_alias="f",
-        description="Dump file containing all posts to index.",
+        description=(
+            "Dump file containing all posts to index, or a directory or glob pattern "
+            "of multiple such files. Of those, only files named like the dumps of "
+            "the given --load-fun are indexed."
+        ),
+        group=_NEW_INDEX_ARGUMENT_GROUP,
+    )
+    file_procs: int = Argument(
+        1,
+        alias="file-procs",
+        description=(
+            "Number of dump files to index in parallel, each in its own process with "
+            "its own decompression, preprocessing, and Elasticsearch connection "
+            "(default: 1)."
+        ),
+        metavar="N",
         group=_NEW_INDEX_ARGUMENT_GROUP,
     )
     num_procs: int = Argument(
         0,
         alias="num-procs",
         description=(
-            "Number of processors to use for parallel preprocessing "
-            "(default: 0, detects number of available processors)."
+            "Number of processors to use for parallel preprocessing of each file "
+            "(default: 0, detects number of available processors and shares them "
+            "among --file-procs)."
+        ),
+        metavar="N",
+        group=_NEW_INDEX_ARGUMENT_GROUP,
+    )
+    batch_size: int = Argument(
+        1000,
+        alias="batch-size",
+        description=(
+            "Number of lines per batch passed to worker processes, if --load-fun "
+            "yields batches of unparsed lines (default: 1000)."
+        ),
+        metavar="N",
+        group=_NEW_INDEX_ARGUMENT_GROUP,
+    )
+    max_in_flight: int = Argument(
+        0,
+        alias="max-in-flight",
+        description=(
+            "Stop reading the dump while this many documents are read but not yet "
+            "transformed, pool engine only (default: 0, four batches per worker "
+            "process)."
+        ),
+        metavar="N",
+        group=_NEW_INDEX_ARGUMENT_GROUP,
+    )
+    max_in_flight_mib: int = Argument(
+        0,
+        alias="max-in-flight-mib",
+        description=(
+            "Stop reading the dump while this many MiB of lines are read but not yet "
+            "transformed, pool engine only (default: 0, no limit)."
+        ),
+        metavar="MIB",
+        group=_NEW_INDEX_ARGUMENT_GROUP,
+    )
+    bulk_concurrency: int = Argument(
+        1,
+        alias="bulk-concurrency",
+        description=(
+            "Number of bulk requests to keep in flight at the same time, each using "
+            "its own HTTP connection (default: 1)."
         ),
         metavar="N",
         group=_NEW_INDEX_ARGUMENT_GROUP,
     )
+    bulk_target_latency: float = Argument(
+        0.0,
+        alias="bulk-target-latency",
+        description=(
+            "Adapt size of bulk requests so that each takes about this many seconds "
+            "(default: 0, fixed size of 500 actions)."
+        ),
+        metavar="SECONDS",
+        group=_NEW_INDEX_ARGUMENT_GROUP,
+    )
+    serialize_in_workers: bool = Argument(
+        False,
+        alias="serialize-in-workers",
+        description=(
+            "Let worker processes serialize each batch into one bulk request, so that "
+            "the main process only sends them (requires --load-fun yielding batches, "
+            "can not be combined with --bulk-target-latency, pool engine only)."
+        ),
+        group=_NEW_INDEX_ARGUMENT_GROUP,
+    )
+    compress_in_workers: Optional[int] = Argument(
+        None,
+        alias="compress-in-workers",
+        description=(
+            "Let worker processes also gzip-compress each bulk request at this level "
+            "from 1 (fastest) to 9 (smallest), instead of the main process (requires "
+            "--serialize-in-workers, overrides http_compress of the config)."
+        ),
+        metavar="LEVEL",
+        group=_NEW_INDEX_ARGUMENT_GROUP,
+    )
+    checkpoint_interval: int = Argument(
+        0,
+        alias="checkpoint-interval",
+        description=(
+            "Save the progress to a sidecar file next to the dump after this many "
+            "acknowledged documents (default: 0, no checkpoints unless resuming, pool "
+            "engine only)."
+        ),
+        metavar="N",
+        group=_NEW_INDEX_ARGUMENT_GROUP,
+    )
+    resume: bool = Argument(
+        False,
+        description=(
+            "Resume from the last checkpoint of the dump file, or start from the "
+            "beginning if there is none. Saves checkpoints every "
+            f"{_DEFAULT_CHECKPOINT_INTERVAL} documents unless --checkpoint-interval "
+            "is given."
+        ),
+        group=_NEW_INDEX_ARGUMENT_GROUP,
+    )
+    bootstrap: bool = Argument(
+        False,
+        description=(
+            "Create documents instead of upserting them even if the index is not "
+            "empty, documents whose IDs already exist are upserted instead (default: "
+            "only if the index is empty, pool engine only). Unless serializing in "
+            "workers, an extra pass over the dump finds IDs that occur more than "
+            "once, which are always upserted."
+        ),
+        group=_NEW_INDEX_ARGUMENT_GROUP,
+    )
+    dead_letter_dir: Optional[Path] = Argument(
+        None,
+        alias="dead-letter-dir",
+        description=(
+            "Instead of aborting, write lines that can not be parsed and documents "
+            "that can not be indexed to a compressed file per dump in this directory "
+            "(pool engine only, parse errors are only caught for --load-fun yielding "
+            "batches)."
+        ),
+        metavar="DIR",
+        group=_NEW_INDEX_ARGUMENT_GROUP,
+    )
+    max_error_rate: float = Argument(
+        0.001,
+        alias="max-error-rate",
+        description=(
+            "Abort if more than this fraction of documents could not be indexed, "
+            "only used with --dead-letter-dir (default: 0.001)."
+        ),
+        metavar="RATE",
+        group=_NEW_INDEX_ARGUMENT_GROUP,
+    )
+    bulk_load: bool = Argument(
+        False,
+        alias="bulk-load",
+        description=(
+            "Disable refreshes, relax translog durability, and drop replicas of the "
+            "index while indexing, restore the original settings afterwards."
+        ),
+        group=_NEW_INDEX_ARGUMENT_GROUP,
+    )
+    metrics_dir: Optional[Path] = Argument(
+        None,
+        alias="metrics-dir",
+        description=(
+            "Periodically write metrics of each ingest stage in the Prometheus text "
+            "format to a file per dump in this directory, e.g., for the textfile "
+            "collector of the node exporter (pool engine only)."
+        ),
+        metavar="DIR",
+        group=_NEW_INDEX_ARGUMENT_GROUP,
+    )
+    metrics_port: Optional[int] = Argument(
+        None,
+        alias="metrics-port",
+        description=(
+            "Serve metrics of each ingest stage for Prometheus on this port (pool "
+            "engine only, requires --file-procs 1)."
+        ),
+        metavar="PORT",
+        group=_NEW_INDEX_ARGUMENT_GROUP,
+    )
+    metrics_host: str = Argument(
+        "localhost",
+        alias="metrics-host",
+        description=(
+            "Address to serve metrics on with --metrics-port, use an empty string to "
+            "serve on all interfaces."
+        ),
+        metavar="HOST",
+        group=_NEW_INDEX_ARGUMENT_GROUP,
+    )
+    profile_dir: Optional[Path] = Argument(
+        None,
+        alias="profile",
+        description=(
+            "Profile this and all worker processes, write a profile per process and a "
+            "merged one to this directory, and log the top functions (pool engine "
+            "only)."
+        ),
+        metavar="DIR",
+        group=_NEW_INDEX_ARGUMENT_GROUP,
+    )
+    profile_memory: bool = Argument(
+        False,
+        alias="profile-memory",
+        description=(
+            "When profiling, also trace memory allocations and write a tracemalloc "
+            "snapshot per process (slow)."
+        ),
+        group=_NEW_INDEX_ARGUMENT_GROUP,
+    )
+    incremental: Optional[Path] = Argument(
+        None,
+        description=(
+            "Only send documents that are new or changed since they were last indexed "
+            "into the index, by keeping hashes of their contents in this SQLite file "
+            "(default: send all, pool engine only, can not be combined with "
+            "--serialize-in-workers)."
+        ),
+        metavar="FILE",
+        group=_NEW_INDEX_ARGUMENT_GROUP,
+    )
+    dedupe: Optional[DuplicatePolicy] = Argument(
+        None,
+        description=(
+            "Send only one document per ID of each dump, chosen by this policy "
+            f"({', '.join(p.value for p in DuplicatePolicy)}), which needs an extra "
+            "pass over the dump to find the IDs. Documents with such IDs are held back "
+            "until the last one with the same ID is read, so checkpoints do not "
+            "advance past the first of them before (default: send all, pool engine "
+            "only, can not be combined with --serialize-in-workers)."
+        ),
+        metavar="POLICY",
+        group=_NEW_INDEX_ARGUMENT_GROUP,
+    )
+    output_ndjson: Optional[Path] = Argument(
+        None,
+        alias="output-ndjson",
+        description=(
+            "Instead of indexing, write the bulk actions to zstd-compressed NDJSON "
+            "segments and a manifest per dump in this directory, which can be sent to "
+            "any index with the replay command later (requires --load-fun yielding "
+            "batches, pool engine only, --name is not used)."
+        ),
+        metavar="DIR",
+        group=_NEW_INDEX_ARGUMENT_GROUP,
+    )
+    verify_converter: int = Argument(
+        0,
+        alias="verify-converter",
+        description=(
+            "Before indexing each dump, check that the compiled document converter "
+            "produces the same output as elasticsearch-dsl for its first N documents "
+            "(default: 0, no check)."
+        ),
+        metavar="N",
+        group=_NEW_INDEX_ARGUMENT_GROUP,
+    )
+    engine: _IngestEngine = Argument(
+        _IngestEngine.POOL,
+        description=(
+            "Ingest engine to use "
+            f"({', '.join(e.value for e in _IngestEngine)}, default: pool)."
+        ),
+        group=_NEW_INDEX_ARGUMENT_GROUP,
+    )
 
     _document_cls_validator: _T_Validator = validator(
         "document_cls", pre=True, allow_reuse=True
@@ -241,16 +594,403 @@ class _IndexDumpProgram(Program):
 
     @overrides
     def run(self) -> None:
-        self.settings.setup_elasticsearch_connection()
-        add_documents_to_index(
-            self.index_name,
+        if self.engine == _IngestEngine.ASYNCIO:
+            self._check_asyncio_arguments()
+        if self.output_ndjson:
+            self._check_output_ndjson_arguments()
+        if (self.incremental or self.dedupe) and (
+            self.serialize_in_workers or self.output_ndjson
+        ):
+            raise ValueError(
+                "Incremental mode and deduplication can not be combined with "
+                "serializing in workers."
+            )
+        if self.compress_in_workers is not None and not self.serialize_in_workers:
+            raise ValueError("Compressing in workers requires --serialize-in-workers.")
+        if self.metrics_port and self.file_procs > 1:
+            raise ValueError(
+                "Serving metrics requires a single file process, use --metrics-dir "
+                "instead."
+            )
+
+        files = find_dump_files(self.file, is_dump_file=self._is_dump_file_func())
+        with ExitStack() as stack:
+            profiler = None
+            if self.profile_dir:
+                profiler = stack.enter_context(
+                    Profiler(self.profile_dir, trace_memory=self.profile_memory)
+                )
+            if self.bulk_load:
+                # Wraps all files, so that settings are not restored while other
+                # files are still being indexed.
+                self.settings.setup_elasticsearch_connection()
+                stack.enter_context(bulk_load_index_settings(self.index_name))
+
+            index_dump_file = partial(self._index_dump_file, profiler=profiler)
+            if files == [self.file]:
+                index_dump_file(self.file)
+            else:
+                index_dump_files(files, index_dump_file, num_file_procs=self.file_procs)
+
+    def _is_dump_file_func(self) -> Optional[Callable[[Path], bool]]:
+        for load_funcs, is_dump_file in _DUMP_FILE_FUNCS:
+            if self.load_document_dicts_func in load_funcs:
+                return is_dump_file
+        return None
+
+    def _check_asyncio_arguments(self) -> None:
+        if self.bulk_target_latency > 0:
+            raise ValueError(
+                "Adaptive bulk sizing is only supported by the pool engine."
+            )
+        if self.resume or self.checkpoint_interval:
+            raise ValueError(
+                "Checkpoints and resuming are only supported by the pool engine."
+            )
+        if self.bootstrap:
+            raise ValueError("Bootstrap loads are only supported by the pool engine.")
+        if self.dead_letter_dir:
+            raise ValueError("Dead letters are only supported by the pool engine.")
+        if self.serialize_in_workers:
+            raise ValueError(
+                "Serializing in workers is only supported by the pool engine."
+            )
+        if self.metrics_dir or self.metrics_port:
+            raise ValueError("Metrics are only supported by the pool engine.")
+        if self.profile_dir:
+            raise ValueError("Profiling is only supported by the pool engine.")
+        if self.incremental or self.dedupe:
+            raise ValueError(
+                "Incremental mode and deduplication are only supported by the pool "
+                "engine."
+            )
+        if self.max_in_flight or self.max_in_flight_mib:
+            raise ValueError(
+                "Limiting documents in flight is only supported by the pool "
+                "engine, use --bulk-concurrency instead."
+            )
+
+    def _check_output_ndjson_arguments(self) -> None:
+        if self.engine == _IngestEngine.ASYNCIO:
+            raise ValueError("Writing NDJSON is only supported by the pool engine.")
+        load_document_dicts_func = self.load_document_dicts_func
+        if "batch_size" not in signature(load_document_dicts_func).parameters:
+            raise ValueError("Writing NDJSON requires --load-fun yielding batches.")
+        if self.resume or self.checkpoint_interval:
+            raise ValueError("Checkpoints do not apply when writing NDJSON.")
+        if self.bootstrap or self.bulk_load:
+            raise ValueError(
+                "Bootstrap loads and bulk load settings do not apply when writing "
+                "NDJSON."
+            )
+
+    def _index_dump_file(
+        self, file: Path, *, profiler: Optional[Profiler] = None
+    ) -> int:
+        if self.verify_converter > 0:
+            self._verify_document_converter(file)
+
+        maxsize = self.bulk_concurrency if self.bulk_concurrency > 1 else None
+        if self.engine == _IngestEngine.ASYNCIO:
+            return self._index_dump_file_asyncio(file, maxsize)
+        if profiler is not None:
+            # Profiles the process of this file, if it is not the main process.
+            with profiler.profile_process("file"):
+                return self._index_dump_file_pool(file, maxsize, profiler=profiler)
+        return self._index_dump_file_pool(file, maxsize, profiler=None)
+
+    def _verify_document_converter(self, file: Path) -> None:
+        def document_dicts() -> Iterator[Mapping[str, object]]:
+            for item in self._load_document_dicts(file, progress_bar=False):
+                if isinstance(item, DocumentLineBatch):
+                    yield from item.load_document_dicts()
+                else:
+                    yield item
+
+        num_documents = verify_document_converter(
+            self.document_cls, islice(document_dicts(), self.verify_converter)
+        )
+        _LOGGER.info(
+            "Compiled converter matches elasticsearch-dsl for {} documents of '{}'.",
+            num_documents,
+            file,
+        )
+
+    def _index_dump_file_pool(
+        self, file: Path, maxsize: Optional[int], *, profiler: Optional[Profiler]
+    ) -> int:
+
+        checkpoint = None
+        skip_lines = 0
+        if self.checkpoint_interval > 0 or self.resume:
+            checkpoint = DumpCheckpoint(
+                file, interval=self.checkpoint_interval or _DEFAULT_CHECKPOINT_INTERVAL
+            )
+            if self.resume:
+                skip_lines = checkpoint.load()
+                _LOGGER.info("Resuming '{}' from line {}.", file, skip_lines)
+
+        if not self.output_ndjson:
+            self.settings.setup_elasticsearch_connection(
+                maxsize=maxsize,
+                http_compress=False if self.compress_in_workers is not None else None,
+            )
+        metrics = IngestMetrics(labels={"dump_file": file.name})
+        with MetricsExporter(
+            metrics,
+            file=(
+                self.metrics_dir / (file.name + ".prom") if self.metrics_dir else None
+            ),
+            port=self.metrics_port,
+            host=self.metrics_host,
+        ):
+            if self.output_ndjson:
+                return self._write_bulk_ndjson(
+                    file, self.output_ndjson, metrics=metrics, profiler=profiler
+                )
+            return self._add_documents_to_index(
+                file,
+                checkpoint=checkpoint,
+                skip_lines=skip_lines,
+                metrics=metrics,
+                profiler=profiler,
+            )
+
+    def _add_documents_to_index(
+        self,
+        file: Path,
+        *,
+        checkpoint: Optional[DumpCheckpoint],
+        skip_lines: int,
+        metrics: IngestMetrics,
+        profiler: Optional[Profiler],
+    ) -> int:
+        with ExitStack() as stack:
+            content_hashes = None
+            if self.incremental:
+                content_hashes = stack.enter_context(
+                    ContentHashStore(self.incremental, index_name=self.index_name)
+                )
+            return add_documents_to_index(
+                self.index_name,
+                self.document_cls,
+                self._load_document_dicts(file, skip_lines=skip_lines),
+                max_retries=self.settings.elasticsearch.max_retries,
+                num_procs=self._num_procs(),
+                bulk_concurrency=self.bulk_concurrency,
+                bulk_sizer=(
+                    AdaptiveBulkSizer(target_latency=self.bulk_target_latency)
+                    if self.bulk_target_latency > 0
+                    else None
+                ),
+                checkpoint=checkpoint,
+                create_only=True if self.bootstrap else None,
+                dead_letters=self._dead_letter_file(file),
+                serialize_in_workers=self.serialize_in_workers,
+                compress_level=self.compress_in_workers,
+                content_hashes=content_hashes,
+                duplicate_ids=(
+                    self._find_duplicate_ids(file, skip_lines=skip_lines)
+                    if self.dedupe or (self.bootstrap and not self.serialize_in_workers)
+                    else None
+                ),
+                duplicate_policy=self.dedupe,
+                in_flight_window=self._in_flight_window(),
+                metrics=metrics,
+                profiler=profiler,
+            )
+
+    def _find_duplicate_ids(self, file: Path, *, skip_lines: int) -> Mapping[str, int]:
+        _LOGGER.info("Finding duplicate IDs in '{}'.", file)
+        return find_duplicate_document_ids(
             self.document_cls,
-            # Need type: ignore because of https://github.com/python/mypy/issues/708
-            self.load_document_dicts_func(self.file),  # type: ignore
-            max_retries=self.settings.elasticsearch.max_retries,
-            num_procs=self.num_procs if self.num_procs > 0 else None,
+            self._load_document_dicts(file, skip_lines=skip_lines),
+            capacity=max(1, file.stat().st_size // _DUMP_BYTES_PER_DOCUMENT),
+            num_procs=self._num_procs(),
+            in_flight_window=self._in_flight_window(),
         )
 
+    def _write_bulk_ndjson(
+        self,
+        file: Path,
+        directory: Path,
+        *,
+        metrics: IngestMetrics,
+        profiler: Optional[Profiler],
+    ) -> int:
+        return write_bulk_ndjson(
+            directory,
+            file,
+            self.document_cls,
+            serialize_documents(
+                self.document_cls,
+                cast(Iterator[DocumentLineBatch], self._load_document_dicts(file)),
+                serializer=elasticsearch_serializer(
+                    self.settings.elasticsearch.json_backend
+                ),
+                num_procs=self._num_procs(),
+                dead_letters=self._dead_letter_file(file),
+                in_flight_window=self._in_flight_window(),
+                metrics=metrics,
+                profiler=profiler,
+            ),
+        )
+
+    def _dead_letter_file(self, file: Path) -> Optional[DeadLetterFile]:
+        if not self.dead_letter_dir:
+            return None
+        return DeadLetterFile(
+            self.dead_letter_dir / (file.name + ".dead-letters.ndjson.gz"),
+            dump_file=file,
+            max_error_rate=self.max_error_rate,
+        )
+
+    def _in_flight_window(self) -> InFlightWindow:
+        return InFlightWindow(
+            max_documents=(
+                self.max_in_flight
+                or 4 * self.batch_size * (self._num_procs() or cpu_count() or 1)
+            ),
+            max_bytes=self.max_in_flight_mib * 1024 * 1024 or None,
+            progress_bar=self.file_procs == 1,
+        )
+
+    def _index_dump_file_asyncio(self, file: Path, maxsize: Optional[int]) -> int:
+        # Only imported here, because the asyncio engine requires optional packages.
+        from nasty_data.elasticsearch_.async_index import add_documents_to_index_async
+
+        client = self.settings.create_async_elasticsearch_client(maxsize=maxsize)
+        loop = new_event_loop()
+        try:
+            return loop.run_until_complete(
+                add_documents_to_index_async(
+                    client,
+                    self.index_name,
+                    self.document_cls,
+                    self._load_document_dicts(file),
+                    max_retries=self.settings.elasticsearch.max_retries,
+                    num_procs=self._num_procs(),
+                    bulk_concurrency=self.bulk_concurrency,
+                )
+            )
+        finally:
+            loop.run_until_complete(client.close())
+            loop.close()
+
+    def _num_procs(self) -> Optional[int]:
+        if self.num_procs > 0:
+            return self.num_procs
+        if self.file_procs > 1:
+            # Share the available processors among the files indexed in parallel.
+            return max(1, (cpu_count() or 1) // self.file_procs)
+        return None
+
+    def _load_document_dicts(
+        self, file: Path, *, skip_lines: int = 0, progress_bar: bool = True
+    ) -> Union[Iterator[Mapping[str, object]], Iterator[DocumentLineBatch]]:
+        load_document_dicts_func = self.load_document_dicts_func
+        parameters = signature(load_document_dicts_func).parameters
+
+        kwargs: Dict[str, object] = {}
+        if "batch_size" in parameters:
+            kwargs["batch_size"] = self.batch_size
+        if skip_lines:
+            if "skip_lines" not in parameters:
+                raise ValueError(
+                    f"Given function {repr(load_document_dicts_func)} does not "
+                    f"accept a skip_lines parameter and can therefore not resume."
+                )
+            kwargs["skip_lines"] = skip_lines
+        if "json_backend" in parameters:
+            kwargs["json_backend"] = self.settings.elasticsearch.json_backend
+        if (not progress_bar or self.file_procs > 1) and "progress_bar" in parameters:
+            # Progress bars of multiple processes would garble each other.
+            kwargs["progress_bar"] = False
+
+        return load_document_dicts_func(file, **kwargs)
+
+
+_REPLAY_ARGUMENT_GROUP = ArgumentGroup(name="Replay Arguments")
+
+
+class _ReplayProgram(Program):
+    class Config(ProgramConfig):
+        title = "replay"
+        aliases = ("r",)
+        description = (
+            "Send bulk NDJSON segments written by index-dump --output-ndjson to an "
+            "index."
+        )
+
+    settings: _NastyElasticsearchSettings = Argument(
+        alias="config", description="Overwrite default config file path."
+    )
+
+    index_name: str = Argument(
+        alias="name",
+        short_alias="n",
+        description="Name of the index.",
+        group=_REPLAY_ARGUMENT_GROUP,
+    )
+    file: Path = Argument(
+        short_alias="f",
+        description=(
+            "Manifest of the segments of a dump, or a directory of such manifests."
+        ),
+        group=_REPLAY_ARGUMENT_GROUP,
+    )
+    bulk_size: int = Argument(
+        1000,
+        alias="bulk-size",
+        description="Number of actions per bulk request (default: 1000).",
+        metavar="N",
+        group=_REPLAY_ARGUMENT_GROUP,
+    )
+    bulk_concurrency: int = Argument(
+        4,
+        alias="bulk-concurrency",
+        description=(
+            "Number of bulk requests to keep in flight at the same time, each using "
+            "its own HTTP connection (default: 4)."
+        ),
+        metavar="N",
+        group=_REPLAY_ARGUMENT_GROUP,
+    )
+    bulk_load: bool = Argument(
+        False,
+        alias="bulk-load",
+        description=(
+            "Disable refreshes, relax translog durability, and drop replicas of the "
+            "index while replaying, restore the original settings afterwards."
+        ),
+        group=_REPLAY_ARGUMENT_GROUP,
+    )
+
+    @overrides
+    def run(self) -> None:
+        manifest_files = find_bulk_ndjson_manifests(self.file)
+        self.settings.setup_elasticsearch_connection(maxsize=self.bulk_concurrency)
+        with ExitStack() as stack:
+            if self.bulk_load:
+                stack.enter_context(bulk_load_index_settings(self.index_name))
+            for manifest_file in manifest_files:
+                start = monotonic()
+                num_indexed = replay_bulk_ndjson(
+                    self.index_name,
+                    manifest_file,
+                    bulk_size=self.bulk_size,
+                    bulk_concurrency=self.bulk_concurrency,
+                    max_retries=self.settings.elasticsearch.max_retries,
+                )
+                seconds = monotonic() - start
+                _LOGGER.info(
+                    "Replayed {} documents from '{}' in {:.1f}s ({:.0f} documents/s).",
+                    num_indexed,
+                    manifest_file,
+                    seconds,
+                    num_indexed / max(seconds, 1e-3),
+                )
+
 
 _ANALYZE_INDEX_ARGUMENT_GROUP = ArgumentGroup(name="Analyze Index Arguments")
 
@@ -375,10 +1115,34 @@ class _SamplePushshiftProgram(Program):
         description="Directory containing dumps. Samples will be written here.",
         group=_SAMPLE_PUSHSHIFT_ARGUMENT_GROUP,
     )
+    profile_dir: Optional[Path] = Argument(
+        None,
+        alias="profile",
+        description=(
+            "Profile sampling, write the profile to this directory, and log the top "
+            "functions."
+        ),
+        metavar="DIR",
+        group=_SAMPLE_PUSHSHIFT_ARGUMENT_GROUP,
+    )
+    profile_memory: bool = Argument(
+        False,
+        alias="profile-memory",
+        description=(
+            "When profiling, also trace memory allocations and write a tracemalloc "
+            "snapshot (slow)."
+        ),
+        group=_SAMPLE_PUSHSHIFT_ARGUMENT_GROUP,
+    )
 
     @overrides
     def run(self) -> None:
-        sample_pushshift_dumps(self.directory)
+        with ExitStack() as stack:
+            if self.profile_dir:
+                stack.enter_context(
+                    Profiler(self.profile_dir, trace_memory=self.profile_memory)
+                )
+            sample_pushshift_dumps(self.directory)
 
 
 class _PushshiftProgram(Program):
@@ -393,6 +1157,286 @@ class _PushshiftProgram(Program):
     )
 
 
+_MICRO_BENCHMARK_ARGUMENT_GROUP = ArgumentGroup(name="Micro-Benchmark Arguments")
+
+
+class _MicroBenchmarkProgram(Program):
+    class Config(ProgramConfig):
+        title = "micro"
+        aliases = ("m",)
+        description = (
+            "Measure throughput of document conversion hot paths on synthetic "
+            "documents."
+        )
+
+    settings: _NastyElasticsearchSettings = Argument(
+        alias="config", description="Overwrite default config file path."
+    )
+
+    dataset: Optional[SyntheticDataset] = Argument(
+        None,
+        short_alias="d",
+        description=(
+            "Only benchmark this kind of documents "
+            f"({', '.join(d.value for d in SyntheticDataset)})."
+        ),
+        group=_MICRO_BENCHMARK_ARGUMENT_GROUP,
+    )
+    num_documents: int = Argument(
+        2000,
+        alias="num-docs",
+        short_alias="n",
+        description="Number of synthetic documents per dataset (default: 2000).",
+        metavar="N",
+        group=_MICRO_BENCHMARK_ARGUMENT_GROUP,
+    )
+    seed: int = Argument(
+        0,
+        description="Seed of the synthetic document generator (default: 0).",
+        metavar="N",
+        group=_MICRO_BENCHMARK_ARGUMENT_GROUP,
+    )
+    repeat: int = Argument(
+        5,
+        short_alias="r",
+        description="Repeat each benchmark and report the best time (default: 5).",
+        metavar="N",
+        group=_MICRO_BENCHMARK_ARGUMENT_GROUP,
+    )
+    output: Optional[Path] = Argument(
+        None,
+        alias="out",
+        short_alias="o",
+        description="Write results as JSON to this file.",
+        metavar="FILE",
+        group=_MICRO_BENCHMARK_ARGUMENT_GROUP,
+    )
+    baseline: Optional[Path] = Argument(
+        None,
+        alias="compare",
+        short_alias="c",
+        description="Report speedups relative to results previously written to FILE.",
+        metavar="FILE",
+        group=_MICRO_BENCHMARK_ARGUMENT_GROUP,
+    )
+
+    @overrides
+    def run(self) -> None:
+        # Imported here, to only load the benchmark code when benchmarking.
+        from nasty_data.benchmark.micro import (
+            load_micro_benchmark_results,
+            log_micro_benchmark_results,
+            run_micro_benchmarks,
+            write_micro_benchmark_results,
+        )
+
+        results = run_micro_benchmarks(
+            datasets=[self.dataset] if self.dataset else tuple(SyntheticDataset),
+            num_documents=self.num_documents,
+            seed=self.seed,
+            repeat=self.repeat,
+            json_backend=self.settings.elasticsearch.json_backend,
+        )
+        log_micro_benchmark_results(
+            results,
+            baseline=(
+                load_micro_benchmark_results(self.baseline) if self.baseline else None
+            ),
+        )
+        if self.output:
+            write_micro_benchmark_results(
+                self.output,
+                results,
+                num_documents=self.num_documents,
+                seed=self.seed,
+                repeat=self.repeat,
+            )
+
+
+_INGEST_BENCHMARK_ARGUMENT_GROUP = ArgumentGroup(name="Ingest Benchmark Arguments")
+
+
+class _IngestBenchmarkProgram(Program):
+    class Config(ProgramConfig):
+        title = "ingest"
+        aliases = ("i",)
+        description = (
+            "Measure end-to-end indexing throughput of synthetic dumps against an "
+            "in-process Elasticsearch stand-in."
+        )
+
+    settings: _NastyElasticsearchSettings = Argument(
+        alias="config", description="Overwrite default config file path."
+    )
+
+    dataset: Optional[SyntheticDataset] = Argument(
+        None,
+        short_alias="d",
+        description=(
+            "Only benchmark this kind of documents "
+            f"({', '.join(d.value for d in SyntheticDataset)})."
+        ),
+        group=_INGEST_BENCHMARK_ARGUMENT_GROUP,
+    )
+    num_documents: int = Argument(
+        20000,
+        alias="num-docs",
+        short_alias="n",
+        description="Number of synthetic documents per dataset (default: 20000).",
+        metavar="N",
+        group=_INGEST_BENCHMARK_ARGUMENT_GROUP,
+    )
+    seed: int = Argument(
+        0,
+        description=(
+            "Seed of the synthetic document generator and of rejections (default: 0)."
+        ),
+        metavar="N",
+        group=_INGEST_BENCHMARK_ARGUMENT_GROUP,
+    )
+    loader_formats: Sequence[IngestLoaderFormat] = Argument(
+        tuple(IngestLoaderFormat),
+        alias="loader",
+        short_alias="l",
+        description=(
+            "Comma-separated ways to load the dump "
+            f"({', '.join(f.value for f in IngestLoaderFormat)}, default: all)."
+        ),
+        metavar="FORMATS",
+        group=_INGEST_BENCHMARK_ARGUMENT_GROUP,
+    )
+    num_procs: Sequence[int] = Argument(
+        (0,),
+        alias="num-procs",
+        description=(
+            "Comma-separated numbers of worker processes (default: 0, number of "
+            "available processors)."
+        ),
+        metavar="N,...",
+        group=_INGEST_BENCHMARK_ARGUMENT_GROUP,
+    )
+    bulk_sizes: Sequence[int] = Argument(
+        (500,),
+        alias="bulk-size",
+        description=(
+            "Comma-separated numbers of actions per bulk request (default: 500)."
+        ),
+        metavar="N,...",
+        group=_INGEST_BENCHMARK_ARGUMENT_GROUP,
+    )
+    bulk_concurrency: int = Argument(
+        1,
+        alias="bulk-concurrency",
+        description="Number of bulk requests to keep in flight (default: 1).",
+        metavar="N",
+        group=_INGEST_BENCHMARK_ARGUMENT_GROUP,
+    )
+    latency: float = Argument(
+        0.0,
+        description=(
+            "Seconds the stand-in takes to answer each bulk request (default: 0)."
+        ),
+        metavar="SECONDS",
+        group=_INGEST_BENCHMARK_ARGUMENT_GROUP,
+    )
+    latency_per_action: float = Argument(
+        0.0,
+        alias="latency-per-action",
+        description=(
+            "Additional seconds the stand-in takes per action of a bulk request "
+            "(default: 0)."
+        ),
+        metavar="SECONDS",
+        group=_INGEST_BENCHMARK_ARGUMENT_GROUP,
+    )
+    rejection_rate: float = Argument(
+        0.0,
+        alias="rejection-rate",
+        description=(
+            "Fraction of actions the stand-in rejects with status 429, which are "
+            "retried with backoff (default: 0)."
+        ),
+        metavar="RATE",
+        group=_INGEST_BENCHMARK_ARGUMENT_GROUP,
+    )
+    directory: Optional[Path] = Argument(
+        None,
+        alias="dir",
+        description=(
+            "Write the synthetic dumps to this directory (default: a temporary "
+            "directory that is deleted afterwards)."
+        ),
+        metavar="DIR",
+        group=_INGEST_BENCHMARK_ARGUMENT_GROUP,
+    )
+    output: Optional[Path] = Argument(
+        None,
+        alias="out",
+        short_alias="o",
+        description="Write results as JSON to this file.",
+        metavar="FILE",
+        group=_INGEST_BENCHMARK_ARGUMENT_GROUP,
+    )
+
+    _comma_separated_validator: _T_Validator = validator(
+        "loader_formats", "num_procs", "bulk_sizes", pre=True, allow_reuse=True
+    )(_comma_separated_validator)
+
+    @overrides
+    def run(self) -> None:
+        # Imported here, to only load the benchmark code when benchmarking.
+        from nasty_data.benchmark.ingest import (
+            log_ingest_benchmark_results,
+            run_ingest_benchmarks,
+            write_ingest_benchmark_results,
+        )
+
+        with ExitStack() as stack:
+            directory = self.directory or Path(
+                stack.enter_context(TemporaryDirectory(prefix="nasty-data-"))
+            )
+            results = run_ingest_benchmarks(
+                directory,
+                datasets=[self.dataset] if self.dataset else tuple(SyntheticDataset),
+                num_documents=self.num_documents,
+                seed=self.seed,
+                loader_formats=self.loader_formats,
+                num_procs=[n or cpu_count() or 1 for n in self.num_procs],
+                bulk_sizes=self.bulk_sizes,
+                bulk_concurrency=self.bulk_concurrency,
+                latency=self.latency,
+                latency_per_action=self.latency_per_action,
+                rejection_rate=self.rejection_rate,
+                http_compress=self.settings.elasticsearch.http_compress,
+                json_backend=self.settings.elasticsearch.json_backend,
+            )
+        log_ingest_benchmark_results(results)
+        if self.output:
+            write_ingest_benchmark_results(
+                self.output,
+                results,
+                num_documents=self.num_documents,
+                seed=self.seed,
+                bulk_concurrency=self.bulk_concurrency,
+                latency=self.latency,
+                latency_per_action=self.latency_per_action,
+                rejection_rate=self.rejection_rate,
+                http_compress=self.settings.elasticsearch.http_compress,
+            )
+
+
+class _BenchmarkProgram(Program):
+    class Config(ProgramConfig):
+        title = "benchmark"
+        aliases = ("b",)
+        description = "Benchmark the ingest pipeline."
+        subprograms = (_MicroBenchmarkProgram, _IngestBenchmarkProgram)
+
+    settings: _NastyElasticsearchSettings = Argument(
+        alias="config", description="Overwrite default config file path."
+    )
+
+
 class NastyDataProgram(Program):
     class Config(ProgramConfig):
         title = "nasty-data"
@@ -401,8 +1445,10 @@ class NastyDataProgram(Program):
         subprograms = (
             _NewIndexProgram,
             _IndexDumpProgram,
+            _ReplayProgram,
             _AnalyzeIndexProgram,
             _PushshiftProgram,
+            _BenchmarkProgram,
         )
 
     settings: _NastyElasticsearchSettings = Argument(
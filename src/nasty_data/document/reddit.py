@@ -15,7 +15,7 @@
 #
 
 from datetime import date, datetime
-from typing import Any, Mapping, MutableMapping, Union, cast
+from typing import Any, Mapping, MutableMapping, Type, Union, cast
 
 from elasticsearch_dsl import (
     Boolean,
@@ -558,7 +558,7 @@ class RedditLink(RedditBaseDocument):
     @overrides
     def prepare_doc_dict(cls, doc_dict: MutableMapping[str, object]) -> None:
         super().prepare_doc_dict(doc_dict)
-        doc_dict["_id"] = "t1_" + checked_cast(str, doc_dict["id"])
+        doc_dict["_id"] = cls.document_id(doc_dict)
 
         # "crosspost_parent_list" contains the whole JSON dict of the post this post
         # is cross-posting somewhere. For simplicity of the data model we discard this
@@ -566,6 +566,11 @@ class RedditLink(RedditBaseDocument):
         # later.
         doc_dict.pop("crosspost_parent_list", None)
 
+    @classmethod
+    @overrides
+    def document_id(cls, doc_dict: Mapping[str, object]) -> str:
+        return "t1_" + checked_cast(str, doc_dict["id"])
+
 
 class RedditComment(RedditBaseDocument):
     link_id = Keyword()
@@ -594,17 +599,31 @@ class RedditComment(RedditBaseDocument):
     @overrides
     def prepare_doc_dict(cls, doc_dict: MutableMapping[str, object]) -> None:
         super().prepare_doc_dict(doc_dict)
-        doc_dict["_id"] = "t3_" + checked_cast(str, doc_dict["id"])
+        doc_dict["_id"] = cls.document_id(doc_dict)
+
+    @classmethod
+    @overrides
+    def document_id(cls, doc_dict: Mapping[str, object]) -> str:
+        return "t3_" + checked_cast(str, doc_dict["id"])
 
 
 class RedditDocument(RedditLink, RedditComment):
     @classmethod
     @overrides
     def prepare_doc_dict(cls, doc_dict: MutableMapping[str, object]) -> None:
+        cls._post_cls(doc_dict).prepare_doc_dict(doc_dict)
+
+    @classmethod
+    @overrides
+    def document_id(cls, doc_dict: Mapping[str, object]) -> str:
+        return cls._post_cls(doc_dict).document_id(doc_dict)
+
+    @classmethod
+    def _post_cls(cls, doc_dict: Mapping[str, object]) -> Type[RedditBaseDocument]:
         if "title" in doc_dict and "body" in doc_dict:
             raise ValueError("Given post appears to be both link and comment.")
         elif "title" in doc_dict:
-            return RedditLink.prepare_doc_dict(doc_dict)
+            return RedditLink
         elif "body" in doc_dict:
-            return RedditComment.prepare_doc_dict(doc_dict)
+            return RedditComment
         raise ValueError("Could not determine whether given post is link or comment.")
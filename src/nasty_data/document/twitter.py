@@ -438,12 +438,40 @@ class TwitterDocument(BaseDocument):
         settings["index.mapping.nested_fields.limit"] = 100
         return settings
 
+    @classmethod
+    @overrides
+    def copy_doc_dict(
+        cls, doc_dict: Mapping[str, object]
+    ) -> MutableMapping[str, object]:
+        doc_dict = super().copy_doc_dict(doc_dict)
+
+        # prepare_doc_dict() modifies "additional_media_info" of each media.
+        extended_entities = cast(
+            Optional[Mapping[str, Sequence[Mapping[str, Dict[str, object]]]]],
+            doc_dict.get("extended_entities"),
+        )
+        if extended_entities and "media" in extended_entities:
+            media_copies = []
+            for media in extended_entities["media"]:
+                additional_media_info = media.get("additional_media_info")
+                if additional_media_info:
+                    media = {
+                        **media,
+                        "additional_media_info": dict(additional_media_info),
+                    }
+                media_copies.append(media)
+            doc_dict["extended_entities"] = {
+                **extended_entities,
+                "media": media_copies,
+            }
+        return doc_dict
+
     @classmethod
     @overrides
     def prepare_doc_dict(cls, doc_dict: MutableMapping[str, object]) -> None:
         super().prepare_doc_dict(doc_dict)
 
-        doc_dict["_id"] = doc_dict["id_str"]
+        doc_dict["_id"] = cls.document_id(doc_dict)
 
         # TODO: document this
         extended_entities = cast(
@@ -454,3 +482,8 @@ class TwitterDocument(BaseDocument):
             additional_media_info = media.get("additional_media_info")
             if additional_media_info:
                 additional_media_info.pop("source_user", None)
+
+    @classmethod
+    @overrides
+    def document_id(cls, doc_dict: Mapping[str, object]) -> str:
+        return cast(str, doc_dict["id_str"])
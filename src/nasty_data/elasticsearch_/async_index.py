@@ -0,0 +1,206 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from asyncio import Queue, ensure_future, gather, get_event_loop
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from logging import getLogger
+from os import cpu_count
+from typing import (
+    TYPE_CHECKING,
+    AsyncIterator,
+    Iterator,
+    Mapping,
+    Optional,
+    Sequence,
+    Type,
+    Union,
+)
+
+from elasticsearch.exceptions import ElasticsearchException
+from nasty_utils import ColoredBraceStyleAdapter
+
+from nasty_data.elasticsearch_.bulk import BULK_FILTER_PATH
+from nasty_data.elasticsearch_.index import (
+    BaseDocument,
+    DocumentLineBatch,
+    _make_upsert_ops,
+    _meta_field_script,
+)
+
+if TYPE_CHECKING:
+    # Requires aiohttp, see the "async" extra of this package.
+    from elasticsearch import AsyncElasticsearch
+
+_LOGGER = ColoredBraceStyleAdapter(getLogger(__name__))
+
+_T_Item = Union[Mapping[str, object], DocumentLineBatch]
+
+
+async def add_documents_to_index_async(
+    client: "AsyncElasticsearch",
+    index_name: str,
+    document_cls: Type[BaseDocument],
+    document_dicts: Union[Iterator[Mapping[str, object]], Iterator[DocumentLineBatch]],
+    *,
+    max_retries: int = 5,
+    num_procs: Optional[int] = None,
+    bulk_concurrency: int = 1,
+    queue_size: int = 16,
+) -> int:
+    """asyncio-based alternative to `add_documents_to_index()`.
+
+    Documents pass through three stages that are connected by queues of at most
+    `queue_size` items each: reading from `document_dicts` (in a separate thread,
+    because reading usually means blocking decompression), transforming to upsert
+    actions (in `num_procs` worker processes), and sending bulk requests
+    (`bulk_concurrency` concurrent `async_streaming_bulk()` calls sharing `client`).
+    If a stage falls behind, the queue in front of it fills up and all previous stages
+    wait, so memory usage stays bounded no matter how slow the cluster responds.
+    """
+
+    if bulk_concurrency < 1:
+        raise ValueError(
+            f"Bulk concurrency must be positive, but is {bulk_concurrency}."
+        )
+
+    if not await client.indices.exists(index=index_name):
+        raise Exception(f"Elasticsearch index '{index_name}' does not exist.")
+    script = _meta_field_script(document_cls)
+    if script is not None:
+        script_id, script_body = script
+        await client.put_script(id=script_id, body=script_body)
+    _LOGGER.debug("Indexing documents to index '{}' (asyncio).", index_name)
+
+    pipeline = _AsyncIngestPipeline(
+        client,
+        index_name,
+        document_cls,
+        document_dicts,
+        max_retries=max_retries,
+        num_procs=num_procs or cpu_count() or 1,
+        bulk_concurrency=bulk_concurrency,
+        queue_size=queue_size,
+    )
+    await pipeline.run()
+
+    _LOGGER.debug("Successfully indexed {} documents.", pipeline.num_indexed)
+    return pipeline.num_indexed
+
+
+class _AsyncIngestPipeline:
+    def __init__(
+        self,
+        client: "AsyncElasticsearch",
+        index_name: str,
+        document_cls: Type[BaseDocument],
+        document_dicts: Union[
+            Iterator[Mapping[str, object]], Iterator[DocumentLineBatch]
+        ],
+        *,
+        max_retries: int,
+        num_procs: int,
+        bulk_concurrency: int,
+        queue_size: int,
+    ):
+        self._client = client
+        self._make_upsert_ops = partial(
+            _make_upsert_ops, index_name=index_name, document_cls=document_cls
+        )
+        self._document_dicts: Iterator[_T_Item] = document_dicts
+        self._max_retries = max_retries
+        self._num_procs = num_procs
+        self._bulk_concurrency = bulk_concurrency
+
+        # None is used to signal the end of input to the next stage.
+        self._read_queue: "Queue[Optional[_T_Item]]" = Queue(maxsize=queue_size)
+        self._send_queue: "Queue[Optional[Sequence[Mapping[str, object]]]]" = Queue(
+            maxsize=queue_size
+        )
+
+        self.num_indexed = 0
+
+    async def run(self) -> None:
+        with ProcessPoolExecutor(max_workers=self._num_procs) as executor:
+            tasks = [
+                ensure_future(self._read()),
+                ensure_future(self._transform_all(executor)),
+                *(ensure_future(self._send()) for _ in range(self._bulk_concurrency)),
+            ]
+            try:
+                await gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                raise
+
+    async def _read(self) -> None:
+        loop = get_event_loop()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            while True:
+                item = await loop.run_in_executor(
+                    executor, next, self._document_dicts, None
+                )
+                if item is None:
+                    break
+                await self._read_queue.put(item)
+
+        for _ in range(self._num_procs):
+            await self._read_queue.put(None)
+
+    async def _transform_all(self, executor: ProcessPoolExecutor) -> None:
+        await gather(*(self._transform(executor) for _ in range(self._num_procs)))
+        for _ in range(self._bulk_concurrency):
+            await self._send_queue.put(None)
+
+    async def _transform(self, executor: ProcessPoolExecutor) -> None:
+        loop = get_event_loop()
+        while True:
+            item = await self._read_queue.get()
+            if item is None:
+                break
+            await self._send_queue.put(
+                await loop.run_in_executor(executor, self._make_upsert_ops, item)
+            )
+
+    async def _upsert_ops(self) -> AsyncIterator[Mapping[str, object]]:
+        while True:
+            ops = await self._send_queue.get()
+            if ops is None:
+                break
+            for op in ops:
+                yield op
+
+    async def _send(self) -> None:
+        from elasticsearch.helpers import async_streaming_bulk
+
+        async for ok, result in async_streaming_bulk(
+            self._client,
+            self._upsert_ops(),
+            max_retries=self._max_retries,
+            raise_on_error=False,
+            filter_path=BULK_FILTER_PATH,
+        ):
+            if ok:
+                self.num_indexed += 1
+            else:
+                _LOGGER.debug(
+                    "Indexed {} documents before the following error.",
+                    self.num_indexed,
+                )
+                raise ElasticsearchException(
+                    f"An error occurred when indexing documents: {result}"
+                )
@@ -0,0 +1,153 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from logging import getLogger
+from threading import Condition
+from time import monotonic
+from typing import Optional
+
+from nasty_utils import ColoredBraceStyleAdapter
+from tqdm import tqdm
+
+_LOGGER = ColoredBraceStyleAdapter(getLogger(__name__))
+
+
+class InFlightWindow:
+    """Bounds the documents that were read but have not been transformed yet.
+
+    `Pool.imap_unordered()` reads its input as fast as possible, independent of how
+    fast results are consumed. If transforming or sending falls behind, documents would
+    pile up in the queues of the pool without limit. Instead, reading a batch blocks in
+    `acquire()` until the number of documents (and raw bytes, if known) in flight is
+    below the given maximums again, which happens whenever a transformed batch is
+    consumed and `release()`d. A single batch is always admitted if nothing is in
+    flight, even if it exceeds the maximums on its own.
+
+    The current number of documents in flight (the queue depth) is shown in its own
+    progress bar, if `progress_bar` is true, and logged when the window is closed.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_documents: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        progress_bar: bool = False,
+    ):
+        if max_documents is not None and max_documents < 1:
+            raise ValueError(
+                f"Maximum documents in flight must be positive, but is "
+                f"{max_documents}."
+            )
+        if max_bytes is not None and max_bytes < 1:
+            raise ValueError(
+                f"Maximum bytes in flight must be positive, but is {max_bytes}."
+            )
+
+        self.max_documents = max_documents
+        self.max_bytes = max_bytes
+        self.num_documents = 0
+        self.num_bytes = 0
+        self.max_num_documents_seen = 0
+        self.num_waits = 0
+        self._closed = False
+        self._condition = Condition()
+
+        self._progress_bar: Optional["tqdm[None]"] = None
+        self._last_refresh = 0.0
+        if progress_bar:
+            self._progress_bar = tqdm(
+                desc="In flight",
+                total=max_documents,
+                # A rate would be meaningless, as this is a gauge.
+                bar_format=(
+                    "{l_bar}{bar}| {n_fmt}/{total_fmt} docs{postfix}"
+                    if max_documents is not None
+                    else "{desc}: {n_fmt} docs{postfix}"
+                ),
+                dynamic_ncols=True,
+                leave=False,
+            )
+
+    def acquire(self, num_documents: int, num_bytes: int = 0) -> bool:
+        """Blocks until the given documents fit into the window.
+
+        :return: False if the window was closed in the meantime, in which case nothing
+            should be read anymore.
+        """
+
+        with self._condition:
+            if not self._closed and not self._fits(num_documents, num_bytes):
+                self.num_waits += 1
+                self._condition.wait_for(
+                    lambda: self._closed or self._fits(num_documents, num_bytes)
+                )
+            if self._closed:
+                return False
+
+            self.num_documents += num_documents
+            self.num_bytes += num_bytes
+            self.max_num_documents_seen = max(
+                self.max_num_documents_seen, self.num_documents
+            )
+            self._update_progress_bar()
+            return True
+
+    def release(self, num_documents: int, num_bytes: int = 0) -> None:
+        with self._condition:
+            self.num_documents -= num_documents
+            self.num_bytes -= num_bytes
+            self._update_progress_bar()
+            self._condition.notify_all()
+
+    def close(self) -> None:
+        """Wakes up and rejects all current and future `acquire()` calls."""
+
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+
+        if self._progress_bar is not None:
+            self._progress_bar.close()
+        _LOGGER.debug(
+            "At most {} documents were in flight, reading waited {} times.",
+            self.max_num_documents_seen,
+            self.num_waits,
+        )
+
+    def _fits(self, num_documents: int, num_bytes: int) -> bool:
+        if self.num_documents == 0:
+            return True
+        if (
+            self.max_documents is not None
+            and self.num_documents + num_documents > self.max_documents
+        ):
+            return False
+        if self.max_bytes is not None and self.num_bytes + num_bytes > self.max_bytes:
+            return False
+        return True
+
+    def _update_progress_bar(self) -> None:
+        # The window changes once per batch or even per document, so throttle redraws.
+        if self._progress_bar is not None and monotonic() - self._last_refresh > 0.1:
+            self._last_refresh = monotonic()
+            self._progress_bar.n = self.num_documents
+            self._progress_bar.set_postfix_str(
+                f"{self.num_bytes / (1024 * 1024):.1f} MiB", refresh=False
+            )
+            self._progress_bar.refresh()
@@ -0,0 +1,458 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import gzip
+import json
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from functools import partial
+from itertools import islice
+from logging import getLogger
+from threading import Lock
+from time import monotonic, sleep
+from typing import (
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    TypeVar,
+    cast,
+)
+from urllib.parse import quote
+
+from elasticsearch import Elasticsearch
+from elasticsearch.exceptions import TransportError
+from elasticsearch.helpers import expand_action, streaming_bulk
+from elasticsearch.serializer import Serializer
+from nasty_utils import ColoredBraceStyleAdapter
+
+from nasty_data.elasticsearch_.metrics import IngestMetrics
+
+_LOGGER = ColoredBraceStyleAdapter(getLogger(__name__))
+
+_T_Tag = TypeVar("_T_Tag")
+_T_Chunk = TypeVar("_T_Chunk")
+_T_Result = TypeVar("_T_Result")
+
+# Default of streaming_bulk().
+_DEFAULT_MAX_CHUNK_BYTES = 100 * 1024 * 1024
+
+# Only the parts of bulk responses that the bulk helpers look at, which shrinks
+# responses considerably (most notably, no more "_shards" object per item).
+BULK_FILTER_PATH = "errors,items.*._id,items.*._index,items.*.status,items.*.error"
+
+
+class AdaptiveBulkSizer:
+    """Adapts the size of bulk requests so that they take about `target_latency`.
+
+    After each bulk request `record()` is called with its round-trip time. If the
+    request was notably faster than the target latency, the number of actions and the
+    number of bytes per request are scaled up, if it was notably slower they are
+    scaled down proportionally. If Elasticsearch rejected actions because its queues
+    were full (status 429), sizes are halved. Both sizes always stay within the given
+    bounds. Instances are thread-safe.
+    """
+
+    _TOLERANCE = 0.2
+    _MAX_GROWTH = 1.5
+    _REJECTION_FACTOR = 0.5
+
+    def __init__(
+        self,
+        *,
+        target_latency: float = 2.0,
+        chunk_size: int = 500,
+        min_chunk_size: int = 50,
+        max_chunk_size: int = 20000,
+        max_chunk_bytes: int = 10 * 1024 * 1024,
+        min_max_chunk_bytes: int = 1024 * 1024,
+        max_max_chunk_bytes: int = 100 * 1024 * 1024,
+    ):
+        if target_latency <= 0:
+            raise ValueError(
+                f"Target latency must be positive, but is {target_latency}."
+            )
+
+        self.target_latency = target_latency
+        self._chunk_size_bounds = (min_chunk_size, max_chunk_size)
+        self._max_chunk_bytes_bounds = (min_max_chunk_bytes, max_max_chunk_bytes)
+        self._chunk_size = float(chunk_size)
+        self._max_chunk_bytes = float(max_chunk_bytes)
+        self._lock = Lock()
+
+    @property
+    def chunk_size(self) -> int:
+        return int(self._chunk_size)
+
+    @property
+    def max_chunk_bytes(self) -> int:
+        return int(self._max_chunk_bytes)
+
+    def record(self, latency: float, *, rejected: bool = False) -> None:
+        if rejected:
+            factor = self._REJECTION_FACTOR
+        elif abs(latency - self.target_latency) <= (
+            self._TOLERANCE * self.target_latency
+        ):
+            return
+        else:
+            factor = min(self.target_latency / max(latency, 1e-3), self._MAX_GROWTH)
+
+        with self._lock:
+            old_chunk_size = self.chunk_size
+            self._chunk_size = _clamp(
+                self._chunk_size * factor, *self._chunk_size_bounds
+            )
+            self._max_chunk_bytes = _clamp(
+                self._max_chunk_bytes * factor, *self._max_chunk_bytes_bounds
+            )
+
+            if self.chunk_size != old_chunk_size:
+                _LOGGER.debug(
+                    "Bulk request took {:.2f}s{}, adjusted bulk size to {} actions or "
+                    "{:.1f} MiB.",
+                    latency,
+                    " and was rejected" if rejected else "",
+                    self.chunk_size,
+                    self.max_chunk_bytes / (1024 * 1024),
+                )
+
+
+def _clamp(value: float, min_value: float, max_value: float) -> float:
+    return max(min_value, min(value, max_value))
+
+
+def _status(result: Mapping[str, object]) -> object:
+    return cast(Mapping[str, object], next(iter(result.values()))).get("status")
+
+
+def _bulk_chunk(
+    client: Elasticsearch,
+    chunk: Sequence[Tuple[_T_Tag, Mapping[str, object]]],
+    *,
+    bulk_sizer: Optional[AdaptiveBulkSizer],
+    max_retries: int,
+    metrics: IngestMetrics,
+    initial_backoff: float = 2,
+    max_backoff: float = 600,
+) -> List[Tuple[_T_Tag, bool, Mapping[str, object]]]:
+    # Mirrors the retry behavior of streaming_bulk(), i.e., actions rejected with
+    # status 429 are retried with exponential backoff. Retries are done here instead
+    # of in streaming_bulk() so that each result can be associated with the tag of its
+    # action and so that rejections and the round-trip time of each individual attempt
+    # can be passed to the bulk sizer.
+    results: List[Tuple[_T_Tag, bool, Mapping[str, object]]] = []
+    for attempt in range(max_retries + 1):
+        if attempt:
+            sleep(min(max_backoff, initial_backoff * 2 ** (attempt - 1)))
+
+        metrics.start_bulk()
+        start = monotonic()
+        rejected: List[Tuple[_T_Tag, Mapping[str, object], Mapping[str, object]]] = []
+        # Without retries, streaming_bulk() yields results in the order of actions.
+        for (tag, action), (ok, result) in zip(
+            chunk,
+            streaming_bulk(
+                client,
+                (action for _tag, action in chunk),
+                chunk_size=len(chunk),
+                max_chunk_bytes=(
+                    bulk_sizer.max_chunk_bytes
+                    if bulk_sizer
+                    else _DEFAULT_MAX_CHUNK_BYTES
+                ),
+                raise_on_error=False,
+                raise_on_exception=False,
+                filter_path=BULK_FILTER_PATH,
+            ),
+        ):
+            if not ok and _status(result) == 429:
+                rejected.append((tag, action, result))
+            else:
+                results.append((tag, ok, result))
+        latency = monotonic() - start
+        if bulk_sizer is not None:
+            bulk_sizer.record(latency, rejected=bool(rejected))
+        metrics.finish_bulk(
+            latency,
+            num_actions=len(chunk),
+            num_rejected=len(rejected),
+            retry=attempt > 0,
+        )
+
+        if not rejected:
+            break
+        if attempt == max_retries:
+            results.extend((tag, False, result) for tag, _action, result in rejected)
+        chunk = [(tag, action) for tag, action, _result in rejected]
+
+    return results
+
+
+def tagged_parallel_streaming_bulk(
+    client: Elasticsearch,
+    tagged_actions: Iterable[Tuple[_T_Tag, Mapping[str, object]]],
+    *,
+    concurrency: int = 1,
+    chunk_size: int = 500,
+    max_retries: int = 5,
+    bulk_sizer: Optional[AdaptiveBulkSizer] = None,
+    metrics: Optional[IngestMetrics] = None,
+) -> Iterator[Tuple[_T_Tag, bool, Mapping[str, object]]]:
+    """Like `streaming_bulk()`, but keeps multiple bulk requests in flight at once.
+
+    Each chunk of actions is sent inside a worker thread, with the same retry and
+    error reporting behavior per action as `streaming_bulk()`. At most `concurrency`
+    chunks are taken from `tagged_actions` and not yet acknowledged at any time.
+    Results are yielded per chunk in order of completion, not in order of the actions.
+
+    Each action comes with a tag, which can be an arbitrary object that is not sent to
+    Elasticsearch, and is passed to its result. Tags are useful to find out which input
+    an acknowledged or failed action corresponds to, because results are not yielded
+    in order.
+
+    If `bulk_sizer` is given, it determines the number of actions and bytes per bulk
+    request instead of `chunk_size`, and is updated after each request. Each request is
+    recorded in `metrics`, if given.
+    """
+
+    tagged_actions = iter(tagged_actions)
+
+    def chunks() -> Iterator[List[Tuple[_T_Tag, Mapping[str, object]]]]:
+        while True:
+            chunk = list(
+                islice(
+                    tagged_actions, bulk_sizer.chunk_size if bulk_sizer else chunk_size
+                )
+            )
+            if not chunk:
+                break
+            yield chunk
+
+    return _in_parallel(
+        partial(
+            _bulk_chunk,
+            client,
+            bulk_sizer=bulk_sizer,
+            max_retries=max_retries,
+            metrics=metrics or IngestMetrics(),
+        ),
+        chunks(),
+        concurrency=concurrency,
+    )
+
+
+class SerializedBulk(NamedTuple):
+    """Bulk actions that were already serialized to NDJSON, e.g., in a worker process.
+
+    Each item of `actions` holds the complete lines of one action, i.e., the action
+    line and, unless it is a delete, the source line. `tags` holds one object per
+    action, see `tagged_parallel_streaming_bulk()`. If `compressed_body` is given, it
+    is sent instead of the actions, see `compress_bulk_actions()`.
+    """
+
+    tags: Sequence[Any]
+    actions: Sequence[bytes]
+    compressed_body: Optional[bytes] = None
+
+
+def serialize_bulk_actions(
+    actions: Iterable[Mapping[str, object]], serializer: Serializer
+) -> List[bytes]:
+    """Serializes actions exactly like `streaming_bulk()` would send them."""
+
+    serialized_actions = []
+    for action in actions:
+        action_line, source = expand_action(action)
+        lines = [serializer.dumps(action_line)]
+        if source is not None:
+            lines.append(serializer.dumps(source))
+        serialized_actions.append(("\n".join(lines) + "\n").encode("UTF-8"))
+    return serialized_actions
+
+
+def compress_bulk_actions(actions: Sequence[bytes], *, level: int = 6) -> bytes:
+    """Compresses serialized actions into a gzip-encoded bulk request body.
+
+    Compressing the body where the actions are serialized, e.g., in a worker process,
+    takes that work off the thread that sends the requests. The Elasticsearch client
+    must not compress requests itself then (`http_compress=False`).
+
+    :param level: From 1 (fastest) to 9 (smallest, what the client uses).
+    """
+
+    if not 1 <= level <= 9:
+        raise ValueError(f"Compression level must be in [1, 9], but is {level}.")
+    return gzip.compress(b"".join(actions), compresslevel=level)
+
+
+def tagged_parallel_serialized_bulk(
+    client: Elasticsearch,
+    bulks: Iterable[SerializedBulk],
+    *,
+    index: Optional[str] = None,
+    concurrency: int = 1,
+    max_retries: int = 5,
+    metrics: Optional[IngestMetrics] = None,
+) -> Iterator[Tuple[Any, bool, Mapping[str, object]]]:
+    """Like `tagged_parallel_streaming_bulk()`, but for already serialized bulks.
+
+    Each bulk is sent as a single request, so the calling thread only does network
+    I/O and response handling. Compressed bodies are sent as they are, while retries
+    of rejected actions are sent uncompressed. Actions without an index name go to
+    `index`. Results have the same form as those of `streaming_bulk()`.
+    """
+
+    return _in_parallel(
+        partial(
+            _bulk_serialized,
+            client,
+            index=index,
+            max_retries=max_retries,
+            metrics=metrics or IngestMetrics(),
+        ),
+        iter(bulks),
+        concurrency=concurrency,
+    )
+
+
+def _bulk_serialized(
+    client: Elasticsearch,
+    bulk: SerializedBulk,
+    *,
+    index: Optional[str],
+    max_retries: int,
+    metrics: IngestMetrics,
+    initial_backoff: float = 2,
+    max_backoff: float = 600,
+) -> List[Tuple[Any, bool, Mapping[str, object]]]:
+    # Same retry behavior as _bulk_chunk().
+    results: List[Tuple[Any, bool, Mapping[str, object]]] = []
+    tags, actions, compressed_body = bulk
+    for attempt in range(max_retries + 1):
+        if attempt:
+            sleep(min(max_backoff, initial_backoff * 2 ** (attempt - 1)))
+
+        metrics.start_bulk()
+        start = monotonic()
+        try:
+            response = _bulk_request(
+                client, actions, compressed_body=compressed_body, index=index
+            )
+        except TransportError as e:
+            metrics.finish_bulk(
+                monotonic() - start,
+                num_actions=len(actions),
+                num_rejected=len(actions) if e.status_code == 429 else 0,
+                retry=attempt > 0,
+            )
+            if e.status_code == 429 and attempt < max_retries:
+                continue
+            results.extend(
+                (tag, False, _transport_error_result(action, e))
+                for tag, action in zip(tags, actions)
+            )
+            break
+
+        rejected: List[Tuple[Any, bytes, Mapping[str, object]]] = []
+        for tag, action, result in zip(tags, actions, response["items"]):
+            status = cast(int, _status(result))
+            if status == 429:
+                rejected.append((tag, action, result))
+            else:
+                results.append((tag, 200 <= status < 300, result))
+        metrics.finish_bulk(
+            monotonic() - start,
+            num_actions=len(actions),
+            num_rejected=len(rejected),
+            retry=attempt > 0,
+        )
+
+        if not rejected:
+            break
+        if attempt == max_retries:
+            results.extend((tag, False, result) for tag, _action, result in rejected)
+        tags = [tag for tag, _action, _result in rejected]
+        actions = [action for _tag, action, _result in rejected]
+        compressed_body = None
+
+    return results
+
+
+def _bulk_request(
+    client: Elasticsearch,
+    actions: Sequence[bytes],
+    *,
+    compressed_body: Optional[bytes],
+    index: Optional[str],
+) -> Mapping[str, Any]:
+    if compressed_body is None:
+        return cast(
+            Mapping[str, Any],
+            client.bulk(
+                body=b"".join(actions), index=index, filter_path=BULK_FILTER_PATH
+            ),
+        )
+
+    # Client.bulk() would append a newline to the compressed body.
+    return cast(
+        Mapping[str, Any],
+        client.transport.perform_request(
+            "POST",
+            f"/{quote(index, safe='')}/_bulk" if index else "/_bulk",
+            headers={
+                "content-type": "application/x-ndjson",
+                "content-encoding": "gzip",
+            },
+            params={"filter_path": BULK_FILTER_PATH},
+            body=compressed_body,
+        ),
+    )
+
+
+def _transport_error_result(action: bytes, e: TransportError) -> Mapping[str, object]:
+    # Only parsed in the rare case of errors, to get the same form as results from
+    # streaming_bulk().
+    action_line = json.loads(action[: action.index(b"\n")])
+    op_type, meta = next(iter(action_line.items()))
+    return {op_type: {**meta, "status": e.status_code, "error": str(e)}}
+
+
+def _in_parallel(
+    func: Callable[[_T_Chunk], List[_T_Result]],
+    chunks: Iterator[_T_Chunk],
+    *,
+    concurrency: int,
+) -> Iterator[_T_Result]:
+    # At most `concurrency` chunks are taken from `chunks` and not yet processed at
+    # any time. Results are yielded per chunk in order of completion.
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending: Set[Future[List[_T_Result]]] = set()
+        for chunk in chunks:
+            if len(pending) >= concurrency:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+            pending.add(executor.submit(func, chunk))
+
+        for future in pending:
+            yield from future.result()
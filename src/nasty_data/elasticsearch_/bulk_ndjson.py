@@ -0,0 +1,276 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+from contextlib import ExitStack
+from glob import escape
+from io import BufferedReader, RawIOBase
+from logging import getLogger
+from pathlib import Path
+from typing import (
+    BinaryIO,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    cast,
+)
+
+from elasticsearch.exceptions import ElasticsearchException
+from elasticsearch_dsl import connections
+from nasty_utils import (
+    ColoredBraceStyleAdapter,
+    get_qualified_name,
+    lookup_qualified_name,
+    safe_issubclass,
+)
+from tqdm import tqdm
+from zstandard import ZstdCompressor, ZstdDecompressor
+
+from nasty_data.elasticsearch_.bulk import (
+    SerializedBulk,
+    tagged_parallel_serialized_bulk,
+)
+from nasty_data.elasticsearch_.index import (
+    BaseDocument,
+    ensure_index_exists,
+    put_meta_field_script,
+)
+from nasty_data.elasticsearch_.metrics import IngestMetrics
+
+_LOGGER = ColoredBraceStyleAdapter(getLogger(__name__))
+
+_MANIFEST_SUFFIX = ".bulk.json"
+_SEGMENT_INFIX = ".bulk-"
+_SEGMENT_SUFFIX = ".ndjson.zst"
+
+
+class BulkNdjsonManifest(NamedTuple):
+    """Describes the bulk NDJSON segments written for one dump file.
+
+    Segments are zstd-compressed files of bulk actions exactly as they are sent to the
+    `_bulk` endpoint, in the same directory as the manifest. Actions contain no index
+    name. Because actions span a different number of lines (e.g., deletes have no source
+    line), `segment_action_lines` holds for each segment runs of `[num_lines,
+    num_actions]`, i.e., `num_actions` consecutive actions of `num_lines` lines each.
+    The manifest is only written once all segments are complete.
+    """
+
+    dump_file: str
+    document_cls: str
+    segments: Sequence[str]
+    segment_action_lines: Sequence[Sequence[Tuple[int, int]]]
+    num_actions: int
+
+    @classmethod
+    def file_for(cls, directory: Path, dump_file: Path) -> Path:
+        return directory / (dump_file.name + _MANIFEST_SUFFIX)
+
+    @classmethod
+    def load(cls, file: Path) -> "BulkNdjsonManifest":
+        with file.open(encoding="UTF-8") as fin:
+            manifest = json.load(fin)
+        return cls(**{field: manifest[field] for field in cls._fields})
+
+    def save(self, file: Path) -> None:
+        file_tmp = file.with_name(file.name + ".tmp")
+        with file_tmp.open("w", encoding="UTF-8") as fout:
+            json.dump(self._asdict(), fout, indent=2)
+        file_tmp.replace(file)
+
+
+def write_bulk_ndjson(
+    directory: Path,
+    dump_file: Path,
+    document_cls: Type[BaseDocument],
+    actions: Iterable[Sequence[bytes]],
+    *,
+    segment_size: int = 1000000,
+    level: int = 3,
+) -> int:
+    """Writes serialized bulk actions to segments and a manifest in `directory`.
+
+    Segments and manifest are named after `dump_file`, previous ones of the same dump
+    file are replaced. Each segment holds up to `segment_size` actions, compressed at
+    zstd `level` using all processors.
+
+    :param actions: Batches of serialized actions, e.g., from `serialize_documents()`.
+    :return: The number of written actions.
+    """
+
+    if segment_size < 1:
+        raise ValueError(f"Segment size must be positive, but is {segment_size}.")
+
+    directory.mkdir(parents=True, exist_ok=True)
+    manifest_file = BulkNdjsonManifest.file_for(directory, dump_file)
+    if manifest_file.exists():
+        manifest_file.unlink()
+    for stale_segment in directory.glob(
+        escape(dump_file.name) + _SEGMENT_INFIX + "*" + _SEGMENT_SUFFIX
+    ):
+        stale_segment.unlink()
+
+    compressor = ZstdCompressor(level=level, threads=-1)
+    segments: List[str] = []
+    segment_action_lines: List[List[Tuple[int, int]]] = []
+    num_actions = 0
+    with ExitStack() as stack:
+        fout: Optional[BinaryIO] = None
+        for batch in actions:
+            for action in batch:
+                if fout is None or num_actions % segment_size == 0:
+                    stack.close()
+                    segments.append(
+                        f"{dump_file.name}{_SEGMENT_INFIX}{len(segments):05d}"
+                        f"{_SEGMENT_SUFFIX}"
+                    )
+                    segment_action_lines.append([])
+                    _LOGGER.debug("Writing segment '{}'.", directory / segments[-1])
+                    fout = stack.enter_context(
+                        compressor.stream_writer(
+                            stack.enter_context((directory / segments[-1]).open("wb"))
+                        )
+                    )
+                fout.write(action)
+                _append_action_lines(segment_action_lines[-1], action.count(b"\n"))
+                num_actions += 1
+
+    BulkNdjsonManifest(
+        dump_file.name,
+        get_qualified_name(document_cls),
+        segments,
+        segment_action_lines,
+        num_actions,
+    ).save(manifest_file)
+    _LOGGER.info(
+        "Wrote {} bulk actions in {} segments to '{}'.",
+        num_actions,
+        len(segments),
+        directory,
+    )
+    return num_actions
+
+
+def _append_action_lines(action_lines: List[Tuple[int, int]], num_lines: int) -> None:
+    if action_lines and action_lines[-1][0] == num_lines:
+        action_lines[-1] = (num_lines, action_lines[-1][1] + 1)
+    else:
+        action_lines.append((num_lines, 1))
+
+
+def find_bulk_ndjson_manifests(path: Path) -> Sequence[Path]:
+    """Resolves a manifest file or a directory of manifests."""
+
+    files = sorted(path.glob("*" + _MANIFEST_SUFFIX)) if path.is_dir() else [path]
+    if not files or not files[0].exists():
+        raise FileNotFoundError(
+            f"Could not find any bulk NDJSON manifests at '{path}'."
+        )
+    return files
+
+
+def read_bulk_ndjson(
+    manifest: BulkNdjsonManifest, directory: Path, *, bulk_size: int = 1000
+) -> Iterator[SerializedBulk]:
+    """Reads the segments of a manifest as bulks of `bulk_size` actions each.
+
+    `directory` is the one the manifest was loaded from, which contains its segments.
+    """
+
+    if bulk_size < 1:
+        raise ValueError(f"Bulk size must be positive, but is {bulk_size}.")
+
+    decompressor = ZstdDecompressor()
+    actions: List[bytes] = []
+    for segment, action_lines in zip(manifest.segments, manifest.segment_action_lines):
+        with (directory / segment).open("rb") as fin_raw:
+            with decompressor.stream_reader(fin_raw) as fin:
+                lines = BufferedReader(cast(RawIOBase, fin))
+                for num_lines, num_actions in action_lines:
+                    for _ in range(num_actions):
+                        actions.append(
+                            b"".join(lines.readline() for _ in range(num_lines))
+                        )
+                        if len(actions) == bulk_size:
+                            yield SerializedBulk([None] * len(actions), actions)
+                            actions = []
+    if actions:
+        yield SerializedBulk([None] * len(actions), actions)
+
+
+def replay_bulk_ndjson(
+    index_name: str,
+    manifest_file: Path,
+    *,
+    bulk_size: int = 1000,
+    bulk_concurrency: int = 4,
+    max_retries: int = 5,
+    metrics: Optional[IngestMetrics] = None,
+    progress_bar: bool = True,
+) -> int:
+    """Sends the bulk actions of a manifest to an index, without transforming them.
+
+    Reading and decompressing happens in this thread, while up to `bulk_concurrency`
+    bulk requests are in flight. Rejected actions are retried like in
+    `add_documents_to_index()`, all other errors abort the replay.
+
+    :return: The number of indexed actions.
+    """
+
+    manifest = BulkNdjsonManifest.load(manifest_file)
+    document_cls = lookup_qualified_name(manifest.document_cls)
+    if not safe_issubclass(document_cls, BaseDocument):
+        raise ValueError(
+            f"Document class {manifest.document_cls} of manifest '{manifest_file}' "
+            "is not a subclass of BaseDocument."
+        )
+    ensure_index_exists(index_name)
+    put_meta_field_script(cast(Type[BaseDocument], document_cls))
+
+    num_indexed = 0
+    with tqdm(
+        desc=manifest.dump_file,
+        total=manifest.num_actions,
+        unit="docs",
+        unit_scale=True,
+        dynamic_ncols=True,
+        disable=not progress_bar,
+    ) as progress:
+        for _tag, ok, result in tagged_parallel_serialized_bulk(
+            connections.get_connection(),
+            read_bulk_ndjson(manifest, manifest_file.parent, bulk_size=bulk_size),
+            index=index_name,
+            concurrency=bulk_concurrency,
+            max_retries=max_retries,
+            metrics=metrics,
+        ):
+            if metrics is not None:
+                (metrics.indexed_documents if ok else metrics.index_errors).inc()
+            if not ok:
+                _LOGGER.debug(
+                    "Replayed {} actions before the following error.", num_indexed
+                )
+                raise ElasticsearchException(
+                    f"An error occurred when indexing documents: {result}"
+                )
+            num_indexed += 1
+            progress.update()
+
+    return num_indexed
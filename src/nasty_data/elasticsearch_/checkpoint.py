@@ -0,0 +1,116 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+from heapq import heappop, heappush
+from logging import getLogger
+from pathlib import Path
+from typing import List, Mapping
+
+from nasty_utils import ColoredBraceStyleAdapter
+
+_LOGGER = ColoredBraceStyleAdapter(getLogger(__name__))
+
+
+class DumpCheckpoint:
+    """Contiguous high-water mark of the acknowledged lines of a dump file.
+
+    Documents are transformed and sent out of order. Therefore, `line_no` is the number
+    of lines from the start of the dump that have all been acknowledged by
+    Elasticsearch, i.e., every line before it is indexed but lines after it might be
+    as well. Lines acknowledged past the mark are kept in a heap, from which they are
+    popped as soon as the mark reaches them. The mark is saved to a sidecar file next
+    to the dump every `interval` acknowledged lines and whenever `save()` is called, so
+    that an interrupted run can be resumed from it. The size and modification time of
+    the dump are saved with it, so that a checkpoint of a dump that was replaced since
+    is not applied to the new one.
+    """
+
+    FILE_SUFFIX = ".checkpoint.json"
+
+    def __init__(self, dump_file: Path, *, interval: int = 100000):
+        if interval < 1:
+            raise ValueError(
+                f"Checkpoint interval must be positive, but is {interval}."
+            )
+
+        self.dump_file = dump_file
+        self.file = dump_file.with_name(dump_file.name + self.FILE_SUFFIX)
+        self.line_no = 0
+        self._interval = interval
+        self._acknowledged: List[int] = []
+        self._num_unsaved = 0
+
+    @classmethod
+    def is_checkpoint_file(cls, file: Path) -> bool:
+        return file.name.endswith((cls.FILE_SUFFIX, cls.FILE_SUFFIX + ".tmp"))
+
+    def load(self) -> int:
+        """Loads the high-water mark from the sidecar file, if one exists.
+
+        :raises ValueError: If the checkpoint was saved for a different version of the
+            dump file.
+        """
+
+        self.line_no = 0
+        self._acknowledged.clear()
+        if self.file.exists():
+            with self.file.open(encoding="UTF-8") as fin:
+                checkpoint = json.load(fin)
+            identity = self._dump_identity()
+            if any(checkpoint.get(key) != value for key, value in identity.items()):
+                raise ValueError(
+                    f"Checkpoint '{self.file}' was saved for a dump file of a "
+                    "different size or modification time than the current one. Delete "
+                    "it to index the dump from the start."
+                )
+            self.line_no = checkpoint["line_no"]
+        return self.line_no
+
+    def acknowledge(self, line_no: int) -> None:
+        if line_no >= self.line_no:
+            heappush(self._acknowledged, line_no)
+        # Lines can be acknowledged more than once, e.g., create conflicts that are
+        # upserted afterwards.
+        while self._acknowledged and self._acknowledged[0] <= self.line_no:
+            if heappop(self._acknowledged) == self.line_no:
+                self.line_no += 1
+
+        self._num_unsaved += 1
+        if self._num_unsaved >= self._interval:
+            self.save()
+
+    def save(self) -> None:
+        _LOGGER.debug(
+            "Saving checkpoint at line {} of '{}'.", self.line_no, self.dump_file
+        )
+
+        file_tmp = self.file.with_name(self.file.name + ".tmp")
+        with file_tmp.open("w", encoding="UTF-8") as fout:
+            json.dump(
+                {
+                    "dump_file": self.dump_file.name,
+                    **self._dump_identity(),
+                    "line_no": self.line_no,
+                },
+                fout,
+            )
+        file_tmp.replace(self.file)
+        self._num_unsaved = 0
+
+    def _dump_identity(self) -> Mapping[str, int]:
+        stat = self.dump_file.stat()
+        return {"dump_size": stat.st_size, "dump_mtime_ns": stat.st_mtime_ns}
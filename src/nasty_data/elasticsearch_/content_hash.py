@@ -0,0 +1,174 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+import sqlite3
+from hashlib import blake2b
+from logging import getLogger
+from pathlib import Path
+from threading import Lock
+from types import TracebackType
+from typing import Dict, List, Mapping, Optional, Set, Tuple, Type
+
+from nasty_utils import ColoredBraceStyleAdapter
+
+_LOGGER = ColoredBraceStyleAdapter(getLogger(__name__))
+
+# Stays below the limit of variables per statement of older SQLite versions.
+_MAX_LOOKUP_SIZE = 900
+
+
+def content_hash(upsert_op: Mapping[str, object]) -> bytes:
+    """Hashes everything an upsert op would write, except the index it goes to.
+
+    The op is serialized as JSON with sorted keys, so that the hash only changes if
+    the transformed document (or the meta field data merged into it) changes.
+    """
+
+    data = json.dumps(
+        {key: value for key, value in upsert_op.items() if key != "_index"},
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return blake2b(data.encode("UTF-8"), digest_size=16).digest()
+
+
+class ContentHashStore:
+    """SQLite file of the content hashes of documents indexed into an index before.
+
+    `changed()` tells which of the given documents are new or differ from when they
+    were last indexed, and remembers their hashes until `acknowledge()` is called for
+    their IDs, i.e., once Elasticsearch indexed them. Only then the hashes are written,
+    so that documents that failed to index are sent again on the next run. Writes are
+    committed every `commit_interval` documents and on `flush()` or `close()`.
+
+    Hashes are kept per index name, but the store can not know if an index was deleted
+    and created again under the same name. Call `clear()` in that case. Methods may be
+    called from different threads. Use as a context manager or call `close()`.
+    """
+
+    def __init__(self, file: Path, *, index_name: str, commit_interval: int = 10000):
+        if commit_interval < 1:
+            raise ValueError(
+                f"Commit interval must be positive, but is {commit_interval}."
+            )
+
+        self.file = file
+        self.index_name = index_name
+        self.commit_interval = commit_interval
+        self.num_unchanged = 0
+        self._pending: Dict[str, bytes] = {}
+        self._acknowledged: List[Tuple[str, str, bytes]] = []
+        self._lock = Lock()
+
+        file.parent.mkdir(parents=True, exist_ok=True)
+        # Other processes may index into the same index, so wait for their writes.
+        self._connection = sqlite3.connect(
+            str(file), timeout=600, check_same_thread=False
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS content_hashes ("
+            "index_name TEXT NOT NULL, "
+            "id TEXT NOT NULL, "
+            "hash BLOB NOT NULL, "
+            "PRIMARY KEY (index_name, id)"
+            ") WITHOUT ROWID"
+        )
+        self._connection.commit()
+
+    def __enter__(self) -> "ContentHashStore":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.close()
+
+    def changed(self, hashes: Mapping[str, bytes]) -> Set[str]:
+        """Returns the IDs whose hashes are not stored or differ from the given ones."""
+
+        ids = list(hashes.keys())
+        with self._lock:
+            stored: Dict[str, bytes] = {}
+            for i in range(0, len(ids), _MAX_LOOKUP_SIZE):
+                chunk = ids[i : i + _MAX_LOOKUP_SIZE]
+                placeholders = ",".join("?" * len(chunk))
+                stored.update(
+                    self._connection.execute(
+                        "SELECT id, hash FROM content_hashes "
+                        f"WHERE index_name = ? AND id IN ({placeholders})",
+                        [self.index_name, *chunk],
+                    )
+                )
+
+            changed = {id_ for id_, hash_ in hashes.items() if stored.get(id_) != hash_}
+            self.num_unchanged += len(hashes) - len(changed)
+            for id_ in changed:
+                self._pending[id_] = hashes[id_]
+            return changed
+
+    def acknowledge(self, id_: str, *, ok: bool = True) -> None:
+        """Stores the hash of an ID passed to `changed()`, if it was indexed (`ok`)."""
+
+        with self._lock:
+            hash_ = self._pending.pop(id_, None)
+            if hash_ is None or not ok:
+                return
+            self._acknowledged.append((self.index_name, id_, hash_))
+            if len(self._acknowledged) >= self.commit_interval:
+                self._flush()
+
+    def clear(self) -> None:
+        """Forgets all hashes of the index."""
+
+        with self._lock:
+            self._pending.clear()
+            self._acknowledged.clear()
+            self._connection.execute(
+                "DELETE FROM content_hashes WHERE index_name = ?", [self.index_name]
+            )
+            self._connection.commit()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+    def close(self) -> None:
+        self.flush()
+        self._connection.close()
+        if self.num_unchanged:
+            _LOGGER.info(
+                "Skipped {} documents that did not change since they were indexed.",
+                self.num_unchanged,
+            )
+
+    def _flush(self) -> None:
+        # Needs to be called while holding the lock.
+        if not self._acknowledged:
+            return
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO content_hashes (index_name, id, hash) "
+            "VALUES (?, ?, ?)",
+            self._acknowledged,
+        )
+        self._connection.commit()
+        self._acknowledged = []
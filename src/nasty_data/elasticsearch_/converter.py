@@ -0,0 +1,273 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from logging import getLogger
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Mapping,
+    MutableMapping,
+    Optional,
+    Tuple,
+    Type,
+    cast,
+)
+
+if TYPE_CHECKING:
+    from nasty_data.elasticsearch_.index import BaseDocument
+
+from elasticsearch_dsl import Boolean, Document, Field, InnerDoc, Object
+from elasticsearch_dsl.exceptions import ValidationException
+from elasticsearch_dsl.utils import META_FIELDS, ObjectBase
+from nasty_utils import ColoredBraceStyleAdapter
+
+_LOGGER = ColoredBraceStyleAdapter(getLogger(__name__))
+
+_T_Converter = Callable[[MutableMapping[str, object]], Tuple[object, Dict[str, object]]]
+_T_ValueConverter = Callable[[object], object]
+
+_EMPTY_VALUES: Tuple[object, ...] = ([], {}, None)
+_META_KEYS = frozenset("_" + name for name in META_FIELDS)
+
+# Methods that are reimplemented by the compiled converters. If a document class
+# overrides any of them, it is converted the slow way.
+_DOCUMENT_METHODS = ("__init__", "_from_dict", "clean", "full_clean", "to_dict")
+_FIELD_CLEAN_METHODS = (Field.clean, Boolean.clean, Object.clean)
+
+
+class _NotCompilableError(Exception):
+    pass
+
+
+# Keyed by document class. Not an lru_cache, because mypy does not consider classes
+# hashable.
+_DOCUMENT_CONVERTERS: Dict[Type["BaseDocument"], Optional[_T_Converter]] = {}
+
+
+def document_converter(document_cls: Type["BaseDocument"]) -> Optional[_T_Converter]:
+    """Compiles a converter from raw document dicts to what Elasticsearch receives.
+
+    The result is identical to
+    `document_cls.from_dict(document_dict).full_clean().to_dict()` (together with the
+    document's ID), but computed directly on dicts using the field mapping of the
+    document class instead of constructing elasticsearch-dsl objects. Only fields whose
+    (de)serialization actually changes values (custom fields like `RedditDate`, but also
+    builtin ones like `Float`) are touched, everything else is passed through as is,
+    and empty values are dropped.
+
+    Like `from_dict(copy=False)`, the converter modifies the given dict. Pass it
+    `document_cls.copy_doc_dict(document_dict)` if the dict is still needed.
+
+    Returns None if the document class or one of its inner documents customizes
+    elasticsearch-dsl behavior in a way the converter does not reproduce.
+    """
+
+    if document_cls not in _DOCUMENT_CONVERTERS:
+        converter: Optional[_T_Converter] = None
+        try:
+            converter = _compile_document_converter(document_cls)
+        except _NotCompilableError as e:
+            _LOGGER.debug(
+                "Falling back to elasticsearch-dsl conversion for {}: {}",
+                document_cls.__name__,
+                e,
+            )
+        _DOCUMENT_CONVERTERS[document_cls] = converter
+    return _DOCUMENT_CONVERTERS[document_cls]
+
+
+def verify_document_converter(
+    document_cls: Type["BaseDocument"], document_dicts: Iterable[Mapping[str, object]]
+) -> int:
+    """Checks that the compiled converter matches elasticsearch-dsl conversion.
+
+    :return: Number of checked documents.
+    :raises ValueError: If the outputs differ for any document.
+    """
+
+    converter = document_converter(document_cls)
+    if converter is None:
+        raise ValueError(f"Could not compile converter for {document_cls.__name__}.")
+
+    num_documents = 0
+    for document_dict in document_dicts:
+        document = document_cls.from_dict(document_dict)
+        document.full_clean()
+        expected = (document.meta.id, document.to_dict(include_meta=False))
+        actual = converter(document_cls.copy_doc_dict(document_dict))
+        if actual != expected:
+            raise ValueError(
+                f"Compiled converter output {actual!r} differs from "
+                f"elasticsearch-dsl output {expected!r}."
+            )
+        num_documents += 1
+    return num_documents
+
+
+def _compile_document_converter(document_cls: Type["BaseDocument"]) -> _T_Converter:
+    # Imported here, because the index module itself uses converters.
+    from nasty_data.elasticsearch_.index import BaseDocument  # noqa: F811
+
+    if not issubclass(document_cls, BaseDocument):
+        raise _NotCompilableError("not a BaseDocument")
+    if _defining_cls(document_cls, "from_dict") is not BaseDocument:
+        raise _NotCompilableError(f"{document_cls.__name__} overrides from_dict()")
+    if document_cls._index._mapping is not None:
+        raise _NotCompilableError("document class has an index-level mapping")
+
+    value_converters = _compile_value_converters(document_cls, inner=False, cache={})
+
+    def convert(
+        doc_dict: MutableMapping[str, object]
+    ) -> Tuple[object, Dict[str, object]]:
+        document_cls.prepare_doc_dict(doc_dict)
+
+        meta = {key: doc_dict.pop(key) for key in _META_KEYS if key in doc_dict}
+        if "_id" not in meta:
+            raise ValueError("Document has no ID.")
+
+        # Like Document.__init__(), keys of the top-level document that collide with
+        # class attributes are kept, unlike for inner documents.
+        return meta["_id"], _convert_object(doc_dict, value_converters, frozenset())
+
+    return convert
+
+
+def _convert_object(
+    doc_dict: Mapping[str, object],
+    value_converters: Mapping[str, _T_ValueConverter],
+    class_attributes: FrozenSet[str],
+) -> Dict[str, object]:
+    result: Dict[str, object] = {}
+    for key, value in doc_dict.items():
+        if key in class_attributes:
+            # AttrDict.__setattr__() stores these as instance attributes instead,
+            # where to_dict() does not see them.
+            continue
+
+        value_converter = value_converters.get(key)
+        if value_converter is not None:
+            value = value_converter(value)
+        if value not in _EMPTY_VALUES:
+            result[key] = value
+    return result
+
+
+def _compile_value_converters(
+    document_cls: Type[ObjectBase],
+    *,
+    inner: bool,
+    cache: MutableMapping[Type[ObjectBase], Dict[str, _T_ValueConverter]],
+) -> Dict[str, _T_ValueConverter]:
+    _check_overrides(document_cls)
+
+    value_converters: Dict[str, _T_ValueConverter] = {}
+    if inner:
+        # Register before recursing, so that self-referencing documents terminate.
+        cache[document_cls] = value_converters
+
+    mapping = document_cls._doc_type.mapping
+    for field_name in mapping:
+        field = mapping[field_name]
+        if field._required:
+            raise _NotCompilableError(f"field '{field_name}' is required")
+        if type(field).clean not in _FIELD_CLEAN_METHODS:
+            raise _NotCompilableError(f"field '{field_name}' has a custom clean()")
+
+        if isinstance(field, Object):
+            inner_cls: Type[ObjectBase] = field._doc_class
+            inner_value_converters = cache.get(inner_cls)
+            if inner_value_converters is None:
+                inner_value_converters = _compile_value_converters(
+                    inner_cls, inner=True, cache=cache
+                )
+            value_converters[field_name] = _object_value_converter(
+                inner_value_converters, frozenset(dir(inner_cls))
+            )
+        else:
+            value_converter = _field_value_converter(field, inner=inner)
+            if value_converter is not None:
+                value_converters[field_name] = value_converter
+
+    return value_converters
+
+
+def _check_overrides(document_cls: Type[ObjectBase]) -> None:
+    base_cls: Type[ObjectBase] = (
+        Document if issubclass(document_cls, Document) else InnerDoc
+    )
+    for method in _DOCUMENT_METHODS:
+        defining_cls = _defining_cls(document_cls, method)
+        if defining_cls not in base_cls.__mro__:
+            raise _NotCompilableError(f"{defining_cls.__name__} overrides {method}()")
+
+
+def _defining_cls(cls: Type[object], method: str) -> Type[object]:
+    return next(c for c in cls.__mro__ if method in vars(c))
+
+
+def _object_value_converter(
+    value_converters: Mapping[str, _T_ValueConverter],
+    class_attributes: FrozenSet[str],
+) -> _T_ValueConverter:
+    def convert_inner_doc(value: object) -> object:
+        if value is None:
+            # Object.clean() calls full_clean() on each list element.
+            raise ValidationException("Object list contains None.")
+        return _convert_object(
+            cast(Mapping[str, object], value), value_converters, class_attributes
+        )
+
+    def convert(value: object) -> object:
+        if value is None:
+            return None
+        if isinstance(value, (list, tuple)):
+            return [convert_inner_doc(v) for v in value]
+        return convert_inner_doc(value)
+
+    return convert
+
+
+def _field_value_converter(field: Field, *, inner: bool) -> Optional[_T_ValueConverter]:
+    deserialize: Optional[_T_ValueConverter] = (
+        field.deserialize
+        if type(field)._deserialize is not Field._deserialize
+        else None
+    )
+    serialize: Optional[_T_ValueConverter] = (
+        field.serialize
+        if field._coerce and type(field)._serialize is not Field._serialize
+        else None
+    )
+    if deserialize is None and serialize is None:
+        return None
+
+    # Inside inner documents, elasticsearch-dsl deserializes coerced fields twice:
+    # once when wrapping the dict in the inner document, and again in full_clean().
+    num_deserializations = 2 if inner and field._coerce else 1
+
+    def convert(value: object) -> object:
+        if deserialize is not None:
+            for _ in range(num_deserializations):
+                value = deserialize(value)
+        if serialize is not None:
+            value = serialize(value)
+        return value
+
+    return convert
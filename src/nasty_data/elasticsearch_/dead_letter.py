@@ -0,0 +1,149 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import gzip
+import json
+from logging import getLogger
+from pathlib import Path
+from typing import Mapping, NamedTuple, Optional, TextIO
+
+from nasty_utils import ColoredBraceStyleAdapter
+
+_LOGGER = ColoredBraceStyleAdapter(getLogger(__name__))
+
+
+class DeadLetter(NamedTuple):
+    """A line of a dump file that could not be transformed into an upsert action."""
+
+    line_no: int
+    line: str
+    error: str
+
+
+class DeadLetterFile:
+    """Gzip-compressed NDJSON file collecting everything that could not be indexed.
+
+    Each line is a JSON object with the dump file, the line number in it, the stage at
+    which the error occurred ("parse" or "index"), the error, and either the raw line or
+    the bulk item result and the upsert op that failed. Upsert ops are included as
+    objects, or as the NDJSON lines of the bulk action if they were serialized in a
+    worker process. Either way, they can be sent again without the dump. The file is
+    appended to, so that resumed runs keep the dead letters of previous runs, and only
+    created once the first error occurs.
+
+    To not silently dead-letter large parts of a dump because of a systematic problem,
+    an exception is raised once more than `max_error_rate` of all documents failed,
+    but only after at least `min_num_documents` were seen.
+    """
+
+    def __init__(
+        self,
+        file: Path,
+        *,
+        dump_file: Optional[Path] = None,
+        max_error_rate: float = 0.001,
+        min_num_documents: int = 10000,
+    ):
+        if not 0 <= max_error_rate <= 1:
+            raise ValueError(
+                f"Maximum error rate must be between 0 and 1, but is {max_error_rate}."
+            )
+
+        self.file = file
+        self.dump_file = dump_file
+        self.max_error_rate = max_error_rate
+        self.min_num_documents = min_num_documents
+        self.num_documents = 0
+        self.num_parse_errors = 0
+        self.num_index_errors = 0
+        self._fout: Optional[TextIO] = None
+
+    @property
+    def num_errors(self) -> int:
+        return self.num_parse_errors + self.num_index_errors
+
+    def record_success(self, num_documents: int = 1) -> None:
+        self.num_documents += num_documents
+
+    def write_parse_error(self, dead_letter: DeadLetter) -> None:
+        self.num_parse_errors += 1
+        self._write(
+            {
+                "stage": "parse",
+                "line_no": dead_letter.line_no,
+                "error": dead_letter.error,
+                "line": dead_letter.line,
+            }
+        )
+
+    def write_index_error(
+        self,
+        line_no: Optional[int],
+        result: Mapping[str, object],
+        *,
+        upsert_op: object = None,
+    ) -> None:
+        self.num_index_errors += 1
+        self._write(
+            {
+                "stage": "index",
+                "line_no": line_no,
+                "result": result,
+                "upsert_op": (
+                    upsert_op.decode("UTF-8")
+                    if isinstance(upsert_op, bytes)
+                    else upsert_op
+                ),
+            }
+        )
+
+    def close(self) -> None:
+        if self._fout is not None:
+            self._fout.close()
+            self._fout = None
+
+        if self.num_errors:
+            _LOGGER.warning(
+                "{} of {} documents could not be indexed ({} parse errors, {} index "
+                "errors), see dead letter file '{}'.",
+                self.num_errors,
+                self.num_documents,
+                self.num_parse_errors,
+                self.num_index_errors,
+                self.file,
+            )
+
+    def _write(self, record: Mapping[str, object]) -> None:
+        self.num_documents += 1
+        if self._fout is None:
+            self.file.parent.mkdir(parents=True, exist_ok=True)
+            self._fout = gzip.open(self.file, "at", encoding="UTF-8")
+
+        record = {
+            "dump_file": str(self.dump_file) if self.dump_file else None,
+            **record,
+        }
+        self._fout.write(json.dumps(record, default=str) + "\n")
+
+        if (
+            self.num_documents >= self.min_num_documents
+            and self.num_errors > self.max_error_rate * self.num_documents
+        ):
+            raise Exception(
+                f"Aborting because {self.num_errors} of {self.num_documents} "
+                f"documents could not be indexed, which exceeds the maximum error "
+                f"rate of {self.max_error_rate}."
+            )
@@ -0,0 +1,190 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from array import array
+from datetime import date, datetime
+from enum import Enum
+from functools import lru_cache
+from logging import getLogger
+from math import ceil
+from random import Random
+from typing import Dict, Iterable, Mapping, Sequence, Tuple
+
+from nasty_utils import ColoredBraceStyleAdapter
+
+_LOGGER = ColoredBraceStyleAdapter(getLogger(__name__))
+
+_UINT64 = (1 << 64) - 1
+
+
+class DuplicatePolicy(Enum):
+    """Which of the documents with the same ID in a dump is indexed.
+
+    FIRST and LAST go by the line in the dump. LATEST_RETRIEVED prefers the document
+    with the latest `retrieved_on` date, i.e., the most recently crawled version of a
+    Pushshift post. Ties and documents without that field are decided like LAST.
+    """
+
+    FIRST = "first"
+    LAST = "last"
+    LATEST_RETRIEVED = "latest-retrieved"
+
+    def prefers(
+        self,
+        line_no: int,
+        upsert_op: Mapping[str, object],
+        other_line_no: int,
+        other_upsert_op: Mapping[str, object],
+    ) -> bool:
+        """Whether the first document is preferred over the other one."""
+
+        if self == DuplicatePolicy.FIRST:
+            return line_no < other_line_no
+        elif self == DuplicatePolicy.LATEST_RETRIEVED:
+            retrieved_on = _retrieved_on(upsert_op)
+            other_retrieved_on = _retrieved_on(other_upsert_op)
+            if retrieved_on != other_retrieved_on:
+                return retrieved_on > other_retrieved_on
+        return line_no > other_line_no
+
+
+def _retrieved_on(upsert_op: Mapping[str, object]) -> datetime:
+    document_dict = upsert_op["doc"] if "doc" in upsert_op else upsert_op["upsert"]
+    value = document_dict.get("retrieved_on")  # type: ignore
+    if isinstance(value, datetime):
+        return value
+    elif isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    return datetime.min
+
+
+class BloomFilter:
+    """Set of strings that only stores a few bits per item.
+
+    Membership tests have no false negatives, but false positives. Each item sets six
+    bits in each of two 64-bit words, which is less accurate than spreading the bits
+    over the whole filter but much faster in Python. At the default of 24 bits per
+    item, about 1 in 10,000 items is a false positive once `capacity` items are added,
+    every 4 more bits per item about halve that.
+
+    Items are hashed with `hash()`, which differs between processes for strings, so
+    filters are only meaningful in the process they were filled in.
+    """
+
+    def __init__(self, *, capacity: int, bits_per_item: int = 24):
+        if capacity < 1:
+            raise ValueError(f"Capacity must be positive, but is {capacity}.")
+        if bits_per_item < 1:
+            raise ValueError(f"Bits per item must be positive, but is {bits_per_item}.")
+
+        self.capacity = capacity
+        self.bits_per_item = bits_per_item
+        self.num_items = 0
+        self._num_words = max(2, ceil(capacity * bits_per_item / 64))
+        self._words = array("Q", bytes(8 * self._num_words))
+
+    @property
+    def num_bytes(self) -> int:
+        return 8 * self._num_words
+
+    def __contains__(self, item: object) -> bool:
+        if not isinstance(item, str):
+            return False
+        word1, mask1, word2, mask2 = self._probes(item)
+        return (
+            self._words[word1] & mask1 == mask1 and self._words[word2] & mask2 == mask2
+        )
+
+    def add(self, item: str) -> bool:
+        """Adds an item and returns whether it (probably) was added before."""
+
+        word1, mask1, word2, mask2 = self._probes(item)
+        contained = True
+        for word, mask in ((word1, mask1), (word2, mask2)):
+            value = self._words[word]
+            if value & mask != mask:
+                self._words[word] = value | mask
+                contained = False
+        if not contained:
+            self.num_items += 1
+        return contained
+
+    def _probes(self, item: str) -> Tuple[int, int, int, int]:
+        # A second hash is derived by multiplying with a large odd constant, which
+        # mixes all bits into the high ones. Words are chosen by the low bits and
+        # masks by the high bits of the two hashes.
+        hash1 = hash(item) & _UINT64
+        hash2 = (hash1 * 0x9E3779B97F4A7C15) & _UINT64
+        masks = _bit_masks()
+        return (
+            hash1 % self._num_words,
+            masks[hash2 >> 52],
+            hash2 % self._num_words,
+            masks[hash1 >> 52],
+        )
+
+
+@lru_cache(maxsize=None)
+def _bit_masks() -> Sequence[int]:
+    # 4096 random 64-bit masks with six bits set each.
+    rng = Random(0)
+    return tuple(
+        sum(1 << bit for bit in rng.sample(range(64), 6)) for _ in range(1 << 12)
+    )
+
+
+def find_duplicate_ids(
+    ids: Iterable[str], *, capacity: int, bits_per_item: int = 24
+) -> Mapping[str, int]:
+    """Returns all IDs that occur more than once, and a few that do not.
+
+    Each returned ID is mapped to how often it occurs. The first occurrence of an ID
+    that is a false positive of the Bloom filters is counted twice, so a few counts are
+    one too high, but none are too low.
+
+    Only the returned IDs are stored exactly, all others are added to Bloom filters.
+    The first is sized for `capacity` IDs, e.g., estimated from the size of the dump.
+    If more IDs are found, filters of twice the capacity and 4 more bits per item are
+    added, so that a bad estimate costs some memory but only few more false positives.
+    """
+
+    filters = [BloomFilter(capacity=capacity, bits_per_item=bits_per_item)]
+    duplicate_ids: Dict[str, int] = {}
+    num_ids = 0
+    for id_ in ids:
+        num_ids += 1
+        if id_ in duplicate_ids:
+            duplicate_ids[id_] += 1
+            continue
+        if any(id_ in filter_ for filter_ in filters[:-1]) or filters[-1].add(id_):
+            duplicate_ids[id_] = 2
+        elif filters[-1].num_items == filters[-1].capacity:
+            filters.append(
+                BloomFilter(
+                    capacity=2 * filters[-1].capacity,
+                    bits_per_item=filters[-1].bits_per_item + 4,
+                )
+            )
+
+    _LOGGER.debug(
+        "Found {} of {} IDs that are (probably) duplicates, using {} Bloom filters "
+        "of {:.1f} MiB.",
+        len(duplicate_ids),
+        num_ids,
+        len(filters),
+        sum(filter_.num_bytes for filter_ in filters) / (1024 * 1024),
+    )
+    return duplicate_ids
@@ -0,0 +1,174 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from concurrent.futures import ProcessPoolExecutor
+from glob import glob
+from logging import getLogger
+from pathlib import Path
+from time import monotonic
+from typing import Callable, Iterable, List, NamedTuple, Optional, Sequence
+
+from nasty_utils import ColoredBraceStyleAdapter
+
+from nasty_data.elasticsearch_.checkpoint import DumpCheckpoint
+
+_LOGGER = ColoredBraceStyleAdapter(getLogger(__name__))
+
+
+class DumpFileSummary(NamedTuple):
+    file: Path
+    num_bytes: int
+    num_documents: int
+    seconds: float
+    error: Optional[str] = None
+
+
+def find_dump_files(
+    path: Path, *, is_dump_file: Optional[Callable[[Path], bool]] = None
+) -> Sequence[Path]:
+    """Resolves a dump file, a directory of dump files, or a glob pattern.
+
+    Files inside a directory or matching a glob pattern are only used if
+    `is_dump_file` accepts them, e.g., `is_pushshift_dump_file()` for the Pushshift
+    loaders, so that samples, partial downloads, or meta files next to the dumps are
+    skipped. Hidden files and checkpoint sidecar files are always skipped. A single
+    given file is used as is.
+    """
+
+    if path.is_dir():
+        candidates = list(path.iterdir())
+    elif path.exists():
+        return [path]
+    else:
+        candidates = [Path(file) for file in glob(str(path))]
+
+    files = []
+    for file in candidates:
+        if not file.is_file():
+            continue
+        if (
+            file.name.startswith(".")
+            or DumpCheckpoint.is_checkpoint_file(file)
+            or (is_dump_file is not None and not is_dump_file(file))
+        ):
+            _LOGGER.debug("Skipping '{}', which is not a dump file.", file)
+            continue
+        files.append(file)
+
+    if not files:
+        raise FileNotFoundError(f"Could not find any dump files at '{path}'.")
+    return sorted(files)
+
+
+def index_dump_files(
+    files: Iterable[Path],
+    index_dump_file: Callable[[Path], int],
+    *,
+    num_file_procs: int = 1,
+) -> Sequence[DumpFileSummary]:
+    """Calls `index_dump_file` for each file, in up to `num_file_procs` processes.
+
+    The processes share nothing, i.e., `index_dump_file` has to decompress, transform,
+    and index the given file on its own (including setting up its own Elasticsearch
+    connection) and return the number of indexed documents. It therefore needs to be
+    picklable. Files are started largest first, so that no process is left with a
+    single large file while all others are already done.
+
+    A failing file does not stop the others. After all files are done, a combined
+    summary is logged and an exception is raised if any file failed.
+    """
+
+    if num_file_procs < 1:
+        raise ValueError(
+            f"Number of file processes must be positive, but is {num_file_procs}."
+        )
+
+    files = sorted(files, key=lambda file: file.stat().st_size, reverse=True)
+    _LOGGER.info(
+        "Indexing {} dump files using {} processes.",
+        len(files),
+        min(num_file_procs, len(files)),
+    )
+
+    start = monotonic()
+    summaries: List[DumpFileSummary]
+    if num_file_procs == 1:
+        summaries = [_index_dump_file(index_dump_file, file) for file in files]
+    else:
+        # Pool workers are daemonic and therefore could not start their own worker
+        # processes for preprocessing, ProcessPoolExecutor workers can. Its call queue
+        # is FIFO, so files are started in the submitted order.
+        with ProcessPoolExecutor(max_workers=num_file_procs) as executor:
+            futures = [
+                executor.submit(_index_dump_file, index_dump_file, file)
+                for file in files
+            ]
+            summaries = [future.result() for future in futures]
+
+    _log_summary(summaries, monotonic() - start)
+
+    failed = [summary for summary in summaries if summary.error is not None]
+    if failed:
+        raise Exception(
+            f"Indexing failed for {len(failed)} of {len(summaries)} dump files: "
+            + ", ".join(f"'{summary.file}'" for summary in failed)
+        )
+    return summaries
+
+
+def _index_dump_file(
+    index_dump_file: Callable[[Path], int], file: Path
+) -> DumpFileSummary:
+    _LOGGER.info("Indexing dump file '{}'.", file)
+    start = monotonic()
+    num_bytes = file.stat().st_size
+    try:
+        num_documents = index_dump_file(file)
+    except Exception as e:
+        _LOGGER.exception("Indexing dump file '{}' failed.", file)
+        return DumpFileSummary(file, num_bytes, 0, monotonic() - start, repr(e))
+
+    seconds = monotonic() - start
+    _LOGGER.info(
+        "Indexed {} documents from '{}' in {:.1f}s.", num_documents, file, seconds
+    )
+    return DumpFileSummary(file, num_bytes, num_documents, seconds)
+
+
+def _log_summary(summaries: Sequence[DumpFileSummary], seconds: float) -> None:
+    for summary in summaries:
+        _LOGGER.debug(
+            "  {}: {} documents, {:.1f} MiB, {:.1f}s{}",
+            summary.file,
+            summary.num_documents,
+            summary.num_bytes / (1024 * 1024),
+            summary.seconds,
+            f", failed: {summary.error}" if summary.error is not None else "",
+        )
+
+    num_documents = sum(summary.num_documents for summary in summaries)
+    num_bytes = sum(summary.num_bytes for summary in summaries)
+    _LOGGER.info(
+        "Indexed {} documents from {} dump files ({:.1f} MiB, {} failed) in {:.1f}s "
+        "({:.0f} documents/s, {:.1f} MiB/s).",
+        num_documents,
+        len(summaries),
+        num_bytes / (1024 * 1024),
+        sum(summary.error is not None for summary in summaries),
+        seconds,
+        num_documents / max(seconds, 1e-3),
+        num_bytes / (1024 * 1024) / max(seconds, 1e-3),
+    )
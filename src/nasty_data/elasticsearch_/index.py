@@ -14,18 +14,28 @@
 # limitations under the License.
 #
 import json
-from copy import deepcopy
+from collections import deque
+from contextlib import contextmanager
 from datetime import datetime
-from functools import partial
+from functools import lru_cache, partial
+from hashlib import sha1
+from itertools import count, islice
+from json import JSONDecodeError
 from logging import getLogger
 from multiprocessing.pool import Pool
+from pathlib import Path
+from time import monotonic
 from typing import (
+    AbstractSet,
     Callable,
     Dict,
     Iterator,
+    List,
     Mapping,
     MutableMapping,
+    NamedTuple,
     Optional,
+    Sequence,
     Tuple,
     Type,
     TypeVar,
@@ -36,12 +46,38 @@ from typing import (
 
 from elasticsearch.exceptions import ElasticsearchException
 from elasticsearch.helpers import streaming_bulk
+from elasticsearch.serializer import Serializer
 from elasticsearch_dsl import Document, Field, Index, InnerDoc, Object, connections
-from nasty_utils import ColoredBraceStyleAdapter
+from nasty_utils import ColoredBraceStyleAdapter, DecompressingTextIOWrapper
+
+from nasty_data.elasticsearch_.backpressure import InFlightWindow
+from nasty_data.elasticsearch_.bulk import (
+    BULK_FILTER_PATH,
+    AdaptiveBulkSizer,
+    SerializedBulk,
+    _status,
+    compress_bulk_actions,
+    serialize_bulk_actions,
+    tagged_parallel_serialized_bulk,
+    tagged_parallel_streaming_bulk,
+)
+from nasty_data.elasticsearch_.checkpoint import DumpCheckpoint
+from nasty_data.elasticsearch_.content_hash import ContentHashStore, content_hash
+from nasty_data.elasticsearch_.converter import document_converter
+from nasty_data.elasticsearch_.dead_letter import DeadLetter, DeadLetterFile
+from nasty_data.elasticsearch_.dedupe import DuplicatePolicy, find_duplicate_ids
+from nasty_data.elasticsearch_.metrics import IngestMetrics
+from nasty_data.profiling import Profiler
 
 _LOGGER = ColoredBraceStyleAdapter(getLogger(__name__))
 
 _T_BaseDocument = TypeVar("_T_BaseDocument", bound="BaseDocument")
+_T_UpsertOp = TypeVar("_T_UpsertOp")
+_T_Transformed = TypeVar("_T_Transformed")
+
+# Bulk results are tagged with the line number of the document (if known) and the
+# upsert op it was transformed into, either as a mapping or serialized.
+_T_TaggedResult = Tuple[Tuple[Optional[int], object], bool, Mapping[str, object]]
 
 
 class BaseDocument(Document):
@@ -55,16 +91,51 @@ class BaseDocument(Document):
 
     @classmethod
     def from_dict(
-        cls: Type[_T_BaseDocument], doc_dict: Mapping[str, object]
+        cls: Type[_T_BaseDocument], doc_dict: Mapping[str, object], *, copy: bool = True
     ) -> _T_BaseDocument:
-        doc_dict = cast(MutableMapping[str, object], deepcopy(doc_dict))
+        """Constructs a document from its raw dict.
+
+        :param copy: Whether `doc_dict` needs to be left unmodified. Pass False if the
+            dict is not used afterwards, e.g., because it was just parsed, to not copy
+            anything.
+        """
+
+        doc_dict = (
+            cls.copy_doc_dict(doc_dict)
+            if copy
+            else cast(MutableMapping[str, object], doc_dict)
+        )
         cls.prepare_doc_dict(doc_dict)
         return cls(**doc_dict)
 
+    @classmethod
+    def copy_doc_dict(
+        cls, doc_dict: Mapping[str, object]
+    ) -> MutableMapping[str, object]:
+        """Copies as much of the raw dict as `prepare_doc_dict()` modifies.
+
+        That is only the top-level dict by default. Subclasses whose
+        `prepare_doc_dict()` modifies nested values need to copy those as well.
+        """
+
+        return dict(doc_dict)
+
     @classmethod
     def prepare_doc_dict(cls, doc_dict: MutableMapping[str, object]) -> None:
         pass
 
+    @classmethod
+    def document_id(cls, doc_dict: Mapping[str, object]) -> str:
+        """Returns the ID that `prepare_doc_dict()` assigns to the raw dict.
+
+        By default, this prepares a copy of the dict. Subclasses can override this to
+        only look at the fields that the ID is derived from.
+        """
+
+        prepared_doc_dict = cls.copy_doc_dict(doc_dict)
+        cls.prepare_doc_dict(prepared_doc_dict)
+        return cast(str, prepared_doc_dict["_id"])
+
     @classmethod
     def meta_field(cls) -> Optional[Tuple[str, str]]:
         return None
@@ -186,6 +257,7 @@ def new_index(
     # does not add `new_index` as a default index to `document_cls`.
     new_index._doc_types.append(document_cls)
     new_index.create()
+    put_meta_field_script(document_cls)
 
     if move_data:
         _LOGGER.info("Reindexing data from previous copy to newly created one...")
@@ -212,6 +284,186 @@ def new_index(
     return new_index_name
 
 
+class DocumentLineBatch(NamedTuple):
+    """Consecutive raw lines of a dump file that have not been parsed yet.
+
+    Parsing is deferred until `load_document_dicts()` is called, so that it can happen
+    inside the worker processes of `add_documents_to_index()` instead of in the process
+    that reads (and decompresses) the dump file. For this to work, `parse_line` needs to
+    be picklable, i.e., a module-level function or a `functools.partial` of one.
+    """
+
+    file: Path
+    first_line_no: int
+    lines: Sequence[str]
+    parse_line: Callable[[str], Mapping[str, object]]
+
+    def load_document_dicts(self) -> Iterator[Mapping[str, object]]:
+        for line_no, line in enumerate(self.lines, start=self.first_line_no):
+            try:
+                yield self.parse_line(line)
+            except JSONDecodeError:
+                _LOGGER.error("Error in line {} of file '{}'.", line_no, self.file)
+                raise
+
+
+def load_document_line_batches(
+    file: Path,
+    parse_line: Callable[[str], Mapping[str, object]],
+    *,
+    batch_size: int,
+    skip_lines: int = 0,
+    progress_bar: bool = True,
+) -> Iterator[DocumentLineBatch]:
+    if batch_size < 1:
+        raise ValueError(f"Batch size must be positive, but is {batch_size}.")
+
+    with DecompressingTextIOWrapper(
+        file, encoding="UTF-8", progress_bar=progress_bar, warn_uncompressed=False
+    ) as fin:
+        # Compressed streams can not be seeked, so skipped lines still need to be
+        # decompressed, but at least they are not parsed.
+        deque(islice(fin, skip_lines), maxlen=0)
+
+        for first_line_no in count(skip_lines, batch_size):
+            lines = list(islice(fin, batch_size))
+            if not lines:
+                break
+            yield DocumentLineBatch(file, first_line_no, lines, parse_line)
+
+
+_META_FIELD_SCRIPT_SOURCE = """
+    if (ctx._source.{meta_field} == null) {{
+        ctx._source.{meta_field} = params.meta_field;
+    }} else if (ctx._source.{meta_field} instanceof List) {{
+        boolean found = false;
+        for (meta_field in ctx._source.{meta_field}) {{
+            if (
+                meta_field.{meta_field_id}
+                == params.meta_field.{meta_field_id}
+            ) {{
+                found = true;
+                break;
+            }}
+        }}
+        if (!found) {{
+            ctx._source.{meta_field}.add(params.meta_field);
+        }}
+    }} else {{
+        if (
+            ctx._source.{meta_field}.{meta_field_id}
+            != params.meta_field.{meta_field_id}
+        ) {{
+            ctx._source.{meta_field} = [
+                ctx._source.{meta_field}, params.meta_field
+            ];
+        }}
+    }}
+"""
+
+
+def _meta_field_script_source(meta_field: str, meta_field_id: str) -> str:
+    return _META_FIELD_SCRIPT_SOURCE.format(
+        meta_field=meta_field, meta_field_id=meta_field_id
+    )
+
+
+@lru_cache(maxsize=None)
+def meta_field_script_id(meta_field: str, meta_field_id: str) -> str:
+    """ID of the stored script that merges `meta_field` into existing documents.
+
+    The ID contains a hash of the script source, so that changes to the script never
+    get mixed up with a version that was stored by an older version of this package.
+    """
+
+    source_hash = sha1(
+        _meta_field_script_source(meta_field, meta_field_id).encode("UTF-8")
+    ).hexdigest()
+    return f"nasty-data-merge-{meta_field}-{meta_field_id}-{source_hash[:8]}"
+
+
+def put_meta_field_script(document_cls: Type[BaseDocument]) -> Optional[str]:
+    """Stores the script used by upserts of `document_cls`, if it has a meta field.
+
+    Upsert actions only refer to the stored script by ID, instead of each containing
+    the full script source. Storing the same script again is a no-op, so this can be
+    called before every ingest.
+
+    :return: The ID of the stored script or None, if `document_cls` has no meta field.
+    """
+
+    script = _meta_field_script(document_cls)
+    if script is None:
+        return None
+
+    script_id, script_body = script
+    _LOGGER.debug("Storing script '{}'.", script_id)
+    connections.get_connection().put_script(id=script_id, body=script_body)
+    return script_id
+
+
+def _meta_field_script(
+    document_cls: Type[BaseDocument],
+) -> Optional[Tuple[str, Mapping[str, object]]]:
+    # ID and body of the stored script, shared with the asyncio ingest.
+    meta_field, meta_field_id = document_cls.meta_field() or (None, None)
+    if not (meta_field and meta_field_id):
+        return None
+
+    return (
+        meta_field_script_id(meta_field, meta_field_id),
+        {
+            "script": {
+                "lang": "painless",
+                "source": _meta_field_script_source(meta_field, meta_field_id),
+            }
+        },
+    )
+
+
+_BULK_LOAD_INDEX_SETTINGS: Mapping[str, object] = {
+    "index.refresh_interval": "-1",
+    "index.translog.durability": "async",
+    "index.number_of_replicas": 0,
+}
+
+
+@contextmanager
+def bulk_load_index_settings(index_name: str) -> Iterator[None]:
+    """Tunes the settings of an index for bulk loading for the duration of the context.
+
+    Disables refreshes, makes the translog only fsync periodically instead of after
+    each request, and drops all replicas. Afterwards, the original settings are
+    restored and the index is refreshed, regardless of whether loading succeeded.
+    Should only be used if nobody needs to search recent changes while loading, and
+    if the load can be repeated in case a node fails during it.
+
+    :param index_name: Name of the index or of an alias pointing to indices.
+    """
+
+    client = connections.get_connection()
+    original_settings = {
+        concrete_index_name: {
+            # Settings that are not explicitly set are restored by resetting to null.
+            setting: index_settings["settings"].get(setting)
+            for setting in _BULK_LOAD_INDEX_SETTINGS
+        }
+        for concrete_index_name, index_settings in client.indices.get_settings(
+            index=index_name, flat_settings=True
+        ).items()
+    }
+
+    _LOGGER.info("Applying bulk load settings to index '{}'.", index_name)
+    client.indices.put_settings(index=index_name, body=_BULK_LOAD_INDEX_SETTINGS)
+    try:
+        yield
+    finally:
+        _LOGGER.info("Restoring settings of index '{}'.", index_name)
+        for concrete_index_name, settings in original_settings.items():
+            client.indices.put_settings(index=concrete_index_name, body=settings)
+        client.indices.refresh(index=index_name)
+
+
 def ensure_index_exists(index_name: str) -> None:
     if not Index(index_name).exists():
         raise Exception(f"Elasticsearch index '{index_name}' does not exist.")
@@ -220,104 +472,955 @@ def ensure_index_exists(index_name: str) -> None:
 def _make_upsert_op(
     document_dict: Mapping[str, object],
     *,
-    index_name: str,
+    index_name: Optional[str],
     document_cls: Type[BaseDocument],
+    copy: bool = True,
 ) -> Mapping[str, object]:
     # Deserialize data and then serialize again. Needed so that our Python
     # conversion of some data types arrives in the JSON send to ElasticSearch.
-    document = document_cls.from_dict(document_dict)
-    document.full_clean()
-    document_dict = document.to_dict(include_meta=False)
+    converter = document_converter(document_cls)
+    if converter is not None:
+        document_id, document_dict = converter(
+            document_cls.copy_doc_dict(document_dict)
+            if copy
+            else cast(MutableMapping[str, object], document_dict)
+        )
+    else:
+        document = document_cls.from_dict(document_dict, copy=copy)
+        document.full_clean()
+        document_id, document_dict = (
+            document.meta.id,
+            document.to_dict(include_meta=False),
+        )
 
     meta_field, meta_field_id = document_cls.meta_field() or (None, None)
     meta_field_data = document_dict.get(meta_field) if meta_field else None
 
-    result: MutableMapping[str, object] = {
-        "_id": document.meta.id,
-        "_index": index_name,
-        "_op_type": "update",
-    }
+    # Without an index name, actions go to the index of the bulk request.
+    result: MutableMapping[str, object] = {"_id": document_id, "_op_type": "update"}
+    if index_name is not None:
+        result["_index"] = index_name
     if not (meta_field and meta_field_id and meta_field_data):
         result["doc_as_upsert"] = True
         result["doc"] = document_dict
     else:
         result["upsert"] = document_dict
         result["script"] = {
-            "lang": "painless",
-            "source": """
-                if (ctx._source.{meta_field} == null) {{
-                    ctx._source.{meta_field} = params.meta_field;
-                }} else if (ctx._source.{meta_field} instanceof List) {{
-                    boolean found = false;
-                    for (meta_field in ctx._source.{meta_field}) {{
-                        if (
-                            meta_field.{meta_field_id}
-                            == params.meta_field.{meta_field_id}
-                        ) {{
-                            found = true;
-                            break;
-                        }}
-                    }}
-                    if (!found) {{
-                        ctx._source.{meta_field}.add(params.meta_field);
-                    }}
-                }} else {{
-                    if (
-                        ctx._source.{meta_field}.{meta_field_id}
-                        != params.meta_field.{meta_field_id}
-                    ) {{
-                        ctx._source.{meta_field} = [
-                            ctx._source.{meta_field}, params.meta_field
-                        ];
-                    }}
-                }}
-            """.format(
-                meta_field=meta_field, meta_field_id=meta_field_id
-            ),
+            "id": meta_field_script_id(meta_field, meta_field_id),
             "params": {"meta_field": meta_field_data},
         }
     return result
 
 
+def _make_upsert_ops(
+    documents: Union[Mapping[str, object], DocumentLineBatch],
+    *,
+    index_name: Optional[str],
+    document_cls: Type[BaseDocument],
+) -> Sequence[Mapping[str, object]]:
+    if not isinstance(documents, DocumentLineBatch):
+        return [
+            _make_upsert_op(documents, index_name=index_name, document_cls=document_cls)
+        ]
+    # Freshly parsed dicts are not used anywhere else, so they need not be copied.
+    return [
+        _make_upsert_op(
+            document_dict,
+            index_name=index_name,
+            document_cls=document_cls,
+            copy=False,
+        )
+        for document_dict in documents.load_document_dicts()
+    ]
+
+
+def _make_numbered_upsert_ops(
+    numbered_documents: Tuple[int, Union[Mapping[str, object], DocumentLineBatch]],
+    *,
+    index_name: Optional[str],
+    document_cls: Type[BaseDocument],
+    tolerant: bool = False,
+) -> Tuple[Sequence[Tuple[int, Mapping[str, object]]], Sequence[DeadLetter]]:
+    first_line_no, documents = numbered_documents
+    if not tolerant:
+        upsert_ops = _make_upsert_ops(
+            documents, index_name=index_name, document_cls=document_cls
+        )
+        return list(enumerate(upsert_ops, start=first_line_no)), []
+
+    # Same as above, except that errors of single lines are returned as dead letters
+    # instead of failing the whole batch.
+    numbered_upsert_ops = []
+    dead_letters = []
+    lines: Sequence[Union[str, Mapping[str, object]]] = (
+        documents.lines if isinstance(documents, DocumentLineBatch) else [documents]
+    )
+    for line_no, line in enumerate(lines, start=first_line_no):
+        try:
+            document_dict = (
+                documents.parse_line(cast(str, line))
+                if isinstance(documents, DocumentLineBatch)
+                else cast(Mapping[str, object], line)
+            )
+            numbered_upsert_ops.append(
+                (
+                    line_no,
+                    _make_upsert_op(
+                        document_dict,
+                        index_name=index_name,
+                        document_cls=document_cls,
+                        copy=not isinstance(documents, DocumentLineBatch),
+                    ),
+                )
+            )
+        except Exception as e:
+            dead_letters.append(
+                DeadLetter(
+                    line_no,
+                    line if isinstance(line, str) else json.dumps(line, default=str),
+                    repr(e),
+                )
+            )
+    return numbered_upsert_ops, dead_letters
+
+
+def _make_hashed_upsert_ops(
+    numbered_documents: Tuple[int, Union[Mapping[str, object], DocumentLineBatch]],
+    *,
+    index_name: Optional[str],
+    document_cls: Type[BaseDocument],
+    tolerant: bool = False,
+) -> Tuple[
+    Sequence[Tuple[Sequence[Tuple[int, Mapping[str, object]]], Sequence[bytes]]],
+    Sequence[DeadLetter],
+]:
+    # Returns a single item per batch, so that its hashes can be looked up at once.
+    numbered_upsert_ops, dead_letters = _make_numbered_upsert_ops(
+        numbered_documents,
+        index_name=index_name,
+        document_cls=document_cls,
+        tolerant=tolerant,
+    )
+    hashes = [content_hash(upsert_op) for _line_no, upsert_op in numbered_upsert_ops]
+    return [(numbered_upsert_ops, hashes)], dead_letters
+
+
+def _document_ids(
+    numbered_documents: Tuple[int, Union[Mapping[str, object], DocumentLineBatch]],
+    *,
+    document_cls: Type[BaseDocument],
+) -> Tuple[Sequence[str], Sequence[DeadLetter]]:
+    _first_line_no, documents = numbered_documents
+    lines: Sequence[Union[str, Mapping[str, object]]] = (
+        documents.lines if isinstance(documents, DocumentLineBatch) else [documents]
+    )
+    ids = []
+    for line in lines:
+        # Lines that can not be parsed are skipped here, they are reported when the
+        # documents are actually transformed.
+        try:
+            document_dict = (
+                cast(DocumentLineBatch, documents).parse_line(line)
+                if isinstance(line, str)
+                else line
+            )
+            ids.append(document_cls.document_id(document_dict))
+        except Exception:
+            continue
+    return ids, []
+
+
+def _number_documents(
+    document_dicts: Union[Iterator[Mapping[str, object]], Iterator[DocumentLineBatch]],
+    first_line_no: int,
+) -> Iterator[Tuple[int, Union[Mapping[str, object], DocumentLineBatch]]]:
+    # Single document dicts are assumed to correspond to one line each, batches know
+    # their own line numbers.
+    items: Iterator[Union[Mapping[str, object], DocumentLineBatch]] = document_dicts
+    for line_no, documents in enumerate(items, start=first_line_no):
+        if isinstance(documents, DocumentLineBatch):
+            line_no = documents.first_line_no
+        yield line_no, documents
+
+
+def _make_create_op(upsert_op: Mapping[str, object]) -> Mapping[str, object]:
+    return {
+        "_id": upsert_op["_id"],
+        "_index": upsert_op["_index"],
+        "_op_type": "create",
+        "_source": upsert_op["doc"] if "doc" in upsert_op else upsert_op["upsert"],
+    }
+
+
+def _create_or_upsert(
+    numbered_upsert_ops: Iterator[Tuple[int, Mapping[str, object]]],
+    *,
+    upsert_ids: AbstractSet[str],
+    concurrency: int,
+    max_retries: int,
+    bulk_sizer: Optional[AdaptiveBulkSizer],
+    metrics: Optional[IngestMetrics],
+) -> Iterator[Tuple[Tuple[int, Mapping[str, object]], bool, Mapping[str, object]]]:
+    client = connections.get_connection()
+    return _upsert_create_conflicts(
+        tagged_parallel_streaming_bulk(
+            client,
+            (
+                (
+                    (line_no, upsert_op),
+                    upsert_op
+                    if upsert_op["_id"] in upsert_ids
+                    else _make_create_op(upsert_op),
+                )
+                for line_no, upsert_op in numbered_upsert_ops
+            ),
+            concurrency=concurrency,
+            max_retries=max_retries,
+            bulk_sizer=bulk_sizer,
+            metrics=metrics,
+        ),
+        lambda conflicts: tagged_parallel_streaming_bulk(
+            client,
+            ((conflict, conflict[1]) for conflict in conflicts),
+            concurrency=concurrency,
+            max_retries=max_retries,
+            bulk_sizer=bulk_sizer,
+            metrics=metrics,
+        ),
+    )
+
+
+def _upsert_create_conflicts(
+    create_results: Iterator[
+        Tuple[Tuple[int, _T_UpsertOp], bool, Mapping[str, object]]
+    ],
+    upsert: Callable[
+        [Sequence[Tuple[int, _T_UpsertOp]]],
+        Iterator[Tuple[Tuple[int, _T_UpsertOp], bool, Mapping[str, object]]],
+    ],
+    *,
+    max_conflicts: int = 500,
+) -> Iterator[Tuple[Tuple[int, _T_UpsertOp], bool, Mapping[str, object]]]:
+    # Creating a document is much cheaper for Elasticsearch than an update, which
+    # needs to get the existing document first. Creating fails with a version conflict
+    # if a document with the same ID exists, i.e., if it already was in the index or
+    # occurs multiple times in the dump (unless it was sent as an upsert because it
+    # was known to). These documents are upserted instead, which gives the same result
+    # as upserting them in the first place. For this, each create action is tagged
+    # with its line number and its upsert op. Conflicts are upserted whenever
+    # `max_conflicts` of them are collected, so that they neither pile up in memory
+    # nor hold back the checkpoint if most documents already exist.
+    conflicts: List[Tuple[int, _T_UpsertOp]] = []
+    num_conflicts = 0
+    for (line_no, upsert_op), ok, result in create_results:
+        if ok or _status(result) != 409:
+            yield (line_no, upsert_op), ok, result
+            continue
+
+        conflicts.append((line_no, upsert_op))
+        num_conflicts += 1
+        if len(conflicts) >= max_conflicts:
+            yield from upsert(conflicts)
+            conflicts = []
+
+    if conflicts:
+        yield from upsert(conflicts)
+    if num_conflicts:
+        _LOGGER.debug("Upserted {} documents whose IDs already existed.", num_conflicts)
+
+
+def _make_serialized_bulks(
+    numbered_documents: Tuple[int, Union[Mapping[str, object], DocumentLineBatch]],
+    *,
+    index_name: Optional[str],
+    document_cls: Type[BaseDocument],
+    tolerant: bool,
+    create_only: bool,
+    serializer: Serializer,
+    compress_level: Optional[int] = None,
+) -> Tuple[Sequence[SerializedBulk], Sequence[DeadLetter]]:
+    if not isinstance(numbered_documents[1], DocumentLineBatch):
+        raise ValueError(
+            "Serializing bulk requests in worker processes requires batches of lines."
+        )
+
+    numbered_upsert_ops, dead_letters = _make_numbered_upsert_ops(
+        numbered_documents,
+        index_name=index_name,
+        document_cls=document_cls,
+        tolerant=tolerant,
+    )
+    if not numbered_upsert_ops:
+        return [], dead_letters
+
+    line_nos = [line_no for line_no, _upsert_op in numbered_upsert_ops]
+    upsert_actions = serialize_bulk_actions(
+        (upsert_op for _line_no, upsert_op in numbered_upsert_ops), serializer
+    )
+    if not create_only:
+        return (
+            [
+                SerializedBulk(
+                    list(zip(line_nos, upsert_actions)),
+                    upsert_actions,
+                    _compress(upsert_actions, level=compress_level),
+                )
+            ],
+            dead_letters,
+        )
+
+    create_actions = serialize_bulk_actions(
+        (_make_create_op(upsert_op) for _line_no, upsert_op in numbered_upsert_ops),
+        serializer,
+    )
+    return (
+        [
+            SerializedBulk(
+                list(zip(line_nos, upsert_actions)),
+                create_actions,
+                _compress(create_actions, level=compress_level),
+            )
+        ],
+        dead_letters,
+    )
+
+
+def _compress(actions: Sequence[bytes], *, level: Optional[int]) -> Optional[bytes]:
+    return compress_bulk_actions(actions, level=level) if level is not None else None
+
+
+def _send_serialized_bulks(
+    bulks: Iterator[SerializedBulk],
+    *,
+    max_retries: int,
+    bulk_concurrency: int,
+    create_only: bool,
+    metrics: Optional[IngestMetrics],
+) -> Iterator[Tuple[Tuple[int, bytes], bool, Mapping[str, object]]]:
+    client = connections.get_connection()
+    results = tagged_parallel_serialized_bulk(
+        client,
+        bulks,
+        concurrency=bulk_concurrency,
+        max_retries=max_retries,
+        metrics=metrics,
+    )
+    if not create_only:
+        return results
+
+    def upsert(
+        conflicts: Sequence[Tuple[int, bytes]]
+    ) -> Iterator[Tuple[Tuple[int, bytes], bool, Mapping[str, object]]]:
+        return tagged_parallel_serialized_bulk(
+            client,
+            [SerializedBulk(conflicts, [action for _line_no, action in conflicts])],
+            max_retries=max_retries,
+            metrics=metrics,
+        )
+
+    return _upsert_create_conflicts(results, upsert)
+
+
+def _send_upsert_ops(
+    numbered_upsert_ops: Iterator[Tuple[int, Mapping[str, object]]],
+    *,
+    max_retries: int,
+    bulk_concurrency: int,
+    bulk_sizer: Optional[AdaptiveBulkSizer],
+    need_line_nos: bool,
+    create_only: bool,
+    upsert_ids: AbstractSet[str],
+    metrics: Optional[IngestMetrics],
+) -> Iterator[_T_TaggedResult]:
+    if create_only:
+        return _create_or_upsert(
+            numbered_upsert_ops,
+            upsert_ids=upsert_ids,
+            concurrency=bulk_concurrency,
+            max_retries=max_retries,
+            bulk_sizer=bulk_sizer,
+            metrics=metrics,
+        )
+    elif (
+        bulk_concurrency == 1
+        and bulk_sizer is None
+        and not need_line_nos
+        and metrics is None
+    ):
+        return (
+            ((None, None), ok, result)
+            for ok, result in streaming_bulk(
+                connections.get_connection(),
+                (upsert_op for _line_no, upsert_op in numbered_upsert_ops),
+                max_retries=max_retries,
+                raise_on_error=False,
+                filter_path=BULK_FILTER_PATH,
+            )
+        )
+    return tagged_parallel_streaming_bulk(
+        connections.get_connection(),
+        (
+            ((line_no, upsert_op), upsert_op)
+            for line_no, upsert_op in numbered_upsert_ops
+        ),
+        concurrency=bulk_concurrency,
+        max_retries=max_retries,
+        bulk_sizer=bulk_sizer,
+        metrics=metrics,
+    )
+
+
+def _transform_in_pool(
+    transform: Callable[
+        [Tuple[int, Union[Mapping[str, object], DocumentLineBatch]]],
+        Tuple[Sequence[_T_Transformed], Sequence[DeadLetter]],
+    ],
+    document_dicts: Union[Iterator[Mapping[str, object]], Iterator[DocumentLineBatch]],
+    *,
+    num_procs: Optional[int],
+    checkpoint: Optional[DumpCheckpoint],
+    dead_letters: Optional[DeadLetterFile],
+    in_flight_window: Optional[InFlightWindow],
+    metrics: Optional[IngestMetrics],
+    profiler: Optional[Profiler],
+) -> Iterator[_T_Transformed]:
+    # Items of document_dicts are either single already parsed document dicts or
+    # batches of raw lines. In the latter case the parsing also happens in the worker
+    # processes and only one message per batch has to be passed between processes.
+    # Each item is numbered with the line it originates from. When resuming from a
+    # checkpoint, document_dicts is expected to start at the checkpoint's line.
+    sizes: Dict[int, Tuple[int, int]] = {}
+    numbered_documents = _measure_documents(
+        _number_documents(document_dicts, checkpoint.line_no if checkpoint else 0),
+        sizes,
+        in_flight_window=in_flight_window,
+        metrics=metrics,
+    )
+
+    with Pool(
+        processes=num_procs,
+        initializer=profiler.start_worker if profiler is not None else None,
+    ) as pool:
+        try:
+            for (
+                line_no,
+                seconds,
+                (
+                    transformed,
+                    batch_dead_letters,
+                ),
+            ) in pool.imap_unordered(
+                partial(_transform_numbered, transform), numbered_documents
+            ):
+                num_documents, num_bytes = sizes.pop(line_no)
+                if in_flight_window is not None:
+                    in_flight_window.release(num_documents, num_bytes)
+                if metrics is not None:
+                    metrics.record_transform(
+                        seconds,
+                        num_documents=num_documents,
+                        num_bytes=num_bytes,
+                        num_errors=len(batch_dead_letters),
+                    )
+
+                for dead_letter in batch_dead_letters:
+                    cast(DeadLetterFile, dead_letters).write_parse_error(dead_letter)
+                    if checkpoint is not None:
+                        checkpoint.acknowledge(dead_letter.line_no)
+                yield from transformed
+
+            # Let the workers exit normally instead of terminating them, so that they
+            # run their exit handlers, e.g., to write their profiles.
+            pool.close()
+            pool.join()
+        finally:
+            # The pool's task handler thread might be blocked in acquire(), which would
+            # keep the pool from terminating.
+            if in_flight_window is not None:
+                in_flight_window.close()
+
+
+def _measure_documents(
+    numbered_documents: Iterator[
+        Tuple[int, Union[Mapping[str, object], DocumentLineBatch]]
+    ],
+    sizes: MutableMapping[int, Tuple[int, int]],
+    *,
+    in_flight_window: Optional[InFlightWindow],
+    metrics: Optional[IngestMetrics],
+) -> Iterator[Tuple[int, Union[Mapping[str, object], DocumentLineBatch]]]:
+    # Runs in the task handler thread of the pool. Remembers the number of documents
+    # and characters of each item, so that they can be released from the window and
+    # recorded once the item is transformed.
+    for line_no, documents in numbered_documents:
+        if isinstance(documents, DocumentLineBatch):
+            size = (len(documents.lines), sum(map(len, documents.lines)))
+        else:
+            size = (1, 0)
+        if in_flight_window is not None and not in_flight_window.acquire(*size):
+            return
+        if metrics is not None:
+            metrics.record_read(num_documents=size[0], num_bytes=size[1])
+        sizes[line_no] = size
+        yield line_no, documents
+
+
+def _transform_numbered(
+    transform: Callable[
+        [Tuple[int, Union[Mapping[str, object], DocumentLineBatch]]], _T_Transformed
+    ],
+    numbered_documents: Tuple[int, Union[Mapping[str, object], DocumentLineBatch]],
+) -> Tuple[int, float, _T_Transformed]:
+    # Returns the line number as key of the item, and how long transforming took.
+    start = monotonic()
+    transformed = transform(numbered_documents)
+    return numbered_documents[0], monotonic() - start, transformed
+
+
+def _skip_unchanged(
+    hashed_upsert_ops: Iterator[
+        Tuple[Sequence[Tuple[int, Mapping[str, object]]], Sequence[bytes]]
+    ],
+    content_hashes: ContentHashStore,
+    *,
+    duplicate_ids: Mapping[str, int],
+    checkpoint: Optional[DumpCheckpoint],
+    metrics: Optional[IngestMetrics],
+) -> Iterator[Tuple[int, Mapping[str, object]]]:
+    # Documents whose IDs occur more than once in the dump are always passed on, so
+    # that the preferred one of them is sent even if only another one changed.
+    for numbered_upsert_ops, hashes in hashed_upsert_ops:
+        changed = content_hashes.changed(
+            {
+                cast(str, upsert_op["_id"]): hash_
+                for (_line_no, upsert_op), hash_ in zip(numbered_upsert_ops, hashes)
+                if upsert_op["_id"] not in duplicate_ids
+            }
+        )
+        for line_no, upsert_op in numbered_upsert_ops:
+            if upsert_op["_id"] in changed or upsert_op["_id"] in duplicate_ids:
+                yield line_no, upsert_op
+                continue
+            if metrics is not None:
+                metrics.unchanged_documents.inc()
+            if checkpoint is not None:
+                checkpoint.acknowledge(line_no)
+
+
+def _collapse_duplicates(
+    numbered_upsert_ops: Iterator[Tuple[int, Mapping[str, object]]],
+    duplicate_ids: Mapping[str, int],
+    *,
+    policy: DuplicatePolicy,
+    checkpoint: Optional[DumpCheckpoint],
+    metrics: Optional[IngestMetrics],
+) -> Iterator[Tuple[int, Mapping[str, object]]]:
+    # Upsert ops whose ID might occur more than once are held back until as many
+    # documents with that ID are transformed as the dump contains, only the preferred
+    # one is sent then. The lines of the others are acknowledged as soon as they are
+    # known to lose, as if indexed. Documents whose count is too high (false positives,
+    # or documents that failed to transform) are sent at the end.
+    held: Dict[str, Tuple[int, Mapping[str, object], int]] = {}
+    for line_no, upsert_op in numbered_upsert_ops:
+        id_ = cast(str, upsert_op["_id"])
+        if id_ not in duplicate_ids:
+            yield line_no, upsert_op
+            continue
+
+        held_line_no, held_upsert_op, num_seen = held.pop(id_, (line_no, upsert_op, 0))
+        if held_line_no != line_no:
+            if policy.prefers(line_no, upsert_op, held_line_no, held_upsert_op):
+                held_line_no, held_upsert_op, line_no = line_no, upsert_op, held_line_no
+            if metrics is not None:
+                metrics.duplicate_documents.inc()
+            if checkpoint is not None:
+                checkpoint.acknowledge(line_no)
+
+        if num_seen + 1 == duplicate_ids[id_]:
+            yield held_line_no, held_upsert_op
+        else:
+            held[id_] = held_line_no, held_upsert_op, num_seen + 1
+
+    _LOGGER.debug("Sending {} documents that were held back until the end.", len(held))
+    for line_no, upsert_op, _num_seen in held.values():
+        yield line_no, upsert_op
+
+
+def _transform_to_upsert_ops(
+    document_dicts: Union[Iterator[Mapping[str, object]], Iterator[DocumentLineBatch]],
+    *,
+    index_name: str,
+    document_cls: Type[BaseDocument],
+    num_procs: Optional[int],
+    checkpoint: Optional[DumpCheckpoint],
+    dead_letters: Optional[DeadLetterFile],
+    content_hashes: Optional[ContentHashStore],
+    duplicate_ids: Optional[Mapping[str, int]],
+    duplicate_policy: Optional[DuplicatePolicy],
+    in_flight_window: Optional[InFlightWindow],
+    metrics: Optional[IngestMetrics],
+    profiler: Optional[Profiler],
+) -> Iterator[Tuple[int, Mapping[str, object]]]:
+    numbered_upsert_ops: Iterator[Tuple[int, Mapping[str, object]]]
+    if content_hashes is None:
+        numbered_upsert_ops = _transform_in_pool(
+            partial(
+                _make_numbered_upsert_ops,
+                index_name=index_name,
+                document_cls=document_cls,
+                tolerant=dead_letters is not None,
+            ),
+            document_dicts,
+            num_procs=num_procs,
+            checkpoint=checkpoint,
+            dead_letters=dead_letters,
+            in_flight_window=in_flight_window,
+            metrics=metrics,
+            profiler=profiler,
+        )
+    else:
+        numbered_upsert_ops = _skip_unchanged(
+            _transform_in_pool(
+                partial(
+                    _make_hashed_upsert_ops,
+                    index_name=index_name,
+                    document_cls=document_cls,
+                    tolerant=dead_letters is not None,
+                ),
+                document_dicts,
+                num_procs=num_procs,
+                checkpoint=checkpoint,
+                dead_letters=dead_letters,
+                in_flight_window=in_flight_window,
+                metrics=metrics,
+                profiler=profiler,
+            ),
+            content_hashes,
+            duplicate_ids=duplicate_ids or {},
+            checkpoint=checkpoint,
+            metrics=metrics,
+        )
+
+    if duplicate_ids is not None and duplicate_policy is not None:
+        numbered_upsert_ops = _collapse_duplicates(
+            numbered_upsert_ops,
+            duplicate_ids,
+            policy=duplicate_policy,
+            checkpoint=checkpoint,
+            metrics=metrics,
+        )
+    return numbered_upsert_ops
+
+
+def _consume_bulk_results(
+    results: Iterator[_T_TaggedResult],
+    *,
+    checkpoint: Optional[DumpCheckpoint],
+    dead_letters: Optional[DeadLetterFile],
+    content_hashes: Optional[ContentHashStore],
+    metrics: Optional[IngestMetrics],
+) -> int:
+    num_indexed = 0
+
+    try:
+        for (line_no, upsert_op), ok, result in results:
+            if metrics is not None:
+                (metrics.indexed_documents if ok else metrics.index_errors).inc()
+            if content_hashes is not None:
+                content_hashes.acknowledge(_result_id(result), ok=ok)
+            if ok:
+                num_indexed += 1
+                if dead_letters is not None:
+                    dead_letters.record_success()
+            elif dead_letters is not None:
+                dead_letters.write_index_error(line_no, result, upsert_op=upsert_op)
+            else:
+                _LOGGER.debug(
+                    "Indexed {} documents before the following error.", num_indexed
+                )
+                raise ElasticsearchException(
+                    f"An error occurred when indexing documents: {result}"
+                )
+
+            if checkpoint is not None and line_no is not None:
+                checkpoint.acknowledge(line_no)
+    finally:
+        if checkpoint is not None:
+            checkpoint.save()
+        if dead_letters is not None:
+            dead_letters.close()
+        if content_hashes is not None:
+            content_hashes.flush()
+
+    return num_indexed
+
+
+def _result_id(result: Mapping[str, object]) -> str:
+    return cast(str, cast(Mapping[str, object], next(iter(result.values())))["_id"])
+
+
 def add_documents_to_index(
     index_name: str,
     document_cls: Type[BaseDocument],
-    document_dicts: Iterator[Mapping[str, object]],
+    document_dicts: Union[Iterator[Mapping[str, object]], Iterator[DocumentLineBatch]],
     *,
     max_retries: int = 5,
     num_procs: Optional[int] = None,
-) -> None:
+    bulk_concurrency: int = 1,
+    bulk_sizer: Optional[AdaptiveBulkSizer] = None,
+    checkpoint: Optional[DumpCheckpoint] = None,
+    create_only: Optional[bool] = None,
+    dead_letters: Optional[DeadLetterFile] = None,
+    serialize_in_workers: bool = False,
+    compress_level: Optional[int] = None,
+    content_hashes: Optional[ContentHashStore] = None,
+    duplicate_ids: Optional[Mapping[str, int]] = None,
+    duplicate_policy: Optional[DuplicatePolicy] = DuplicatePolicy.LATEST_RETRIEVED,
+    in_flight_window: Optional[InFlightWindow] = None,
+    metrics: Optional[IngestMetrics] = None,
+    profiler: Optional[Profiler] = None,
+) -> int:
+    """Upserts documents into an index, transforming them in worker processes.
+
+    If `serialize_in_workers` is true, the worker processes also serialize each batch
+    of lines into the body of one bulk request, so that this process only has to send
+    them. This requires `document_dicts` to yield `DocumentLineBatch`es and can not be
+    combined with a `bulk_sizer`. If a `compress_level` is given as well, the worker
+    processes also gzip-compress each bulk request at that level, which requires a
+    connection without `http_compress`.
+
+    If `content_hashes` are given, only documents that are new or changed since they
+    were last indexed from any dump are sent (incremental mode). If the index is empty,
+    all previous hashes are forgotten. This can not be combined with
+    `serialize_in_workers` either.
+
+    Documents whose IDs are in `duplicate_ids`, e.g., as found by
+    `find_duplicate_document_ids()`, are held back until as many documents with that ID
+    are transformed as it maps to. Of each such ID, only the document preferred by
+    `duplicate_policy` is sent then. Because the lines of held documents are only
+    acknowledged then, the `checkpoint` does not advance past the first of them before
+    the last document with its ID. Without a
+    `duplicate_policy`, all of them are sent as upserts, even if documents are created
+    otherwise, so that their creates do not fail. This can not be combined with
+    `serialize_in_workers`.
+
+    Without an `in_flight_window`, `document_dicts` is read as fast as possible,
+    regardless of whether transforming and sending keep up. The throughput of each of
+    these stages is recorded in `metrics`, if given. If a `profiler` is given, the
+    worker processes are profiled with it.
+    """
+
+    if bulk_concurrency < 1:
+        raise ValueError(
+            f"Bulk concurrency must be positive, but is {bulk_concurrency}."
+        )
+    if serialize_in_workers:
+        _check_serialize_in_workers_arguments(
+            bulk_sizer=bulk_sizer,
+            duplicate_ids=duplicate_ids,
+            content_hashes=content_hashes,
+            compress_level=compress_level,
+        )
+    elif compress_level is not None:
+        raise ValueError("Compressing in workers requires serializing in workers.")
+
     ensure_index_exists(index_name)
-    _LOGGER.debug("Indexing documents to index '{}'.", index_name)
+    put_meta_field_script(document_cls)
+    if create_only is None or content_hashes is not None:
+        # Documents still waiting for a refresh are not counted, but that only means
+        # that some of them might be upserted after a failed create, see below, or
+        # that some hashes are forgotten.
+        index_empty = connections.get_connection().count(index=index_name)["count"] == 0
+        if create_only is None:
+            create_only = index_empty
+        if content_hashes is not None and index_empty:
+            content_hashes.clear()
+    _LOGGER.debug(
+        "Indexing documents to index '{}'{}.",
+        index_name,
+        " (create-only)" if create_only else "",
+    )
 
-    def make_upsert_ops() -> Iterator[Mapping[str, object]]:
-        with Pool(processes=num_procs) as pool:
-            yield from pool.imap_unordered(
+    results: Iterator[_T_TaggedResult]
+    if serialize_in_workers:
+        results = _send_serialized_bulks(
+            _transform_in_pool(
                 partial(
-                    _make_upsert_op, index_name=index_name, document_cls=document_cls
+                    _make_serialized_bulks,
+                    index_name=index_name,
+                    document_cls=document_cls,
+                    tolerant=dead_letters is not None,
+                    create_only=create_only,
+                    serializer=connections.get_connection().transport.serializer,
+                    compress_level=compress_level,
                 ),
                 document_dicts,
-            )
+                num_procs=num_procs,
+                checkpoint=checkpoint,
+                dead_letters=dead_letters,
+                in_flight_window=in_flight_window,
+                metrics=metrics,
+                profiler=profiler,
+            ),
+            max_retries=max_retries,
+            bulk_concurrency=bulk_concurrency,
+            create_only=create_only,
+            metrics=metrics,
+        )
+    else:
+        numbered_upsert_ops = _transform_to_upsert_ops(
+            document_dicts,
+            index_name=index_name,
+            document_cls=document_cls,
+            num_procs=num_procs,
+            checkpoint=checkpoint,
+            dead_letters=dead_letters,
+            content_hashes=content_hashes,
+            duplicate_ids=duplicate_ids,
+            duplicate_policy=duplicate_policy,
+            in_flight_window=in_flight_window,
+            metrics=metrics,
+            profiler=profiler,
+        )
+        results = _send_upsert_ops(
+            numbered_upsert_ops,
+            max_retries=max_retries,
+            bulk_concurrency=bulk_concurrency,
+            bulk_sizer=bulk_sizer,
+            need_line_nos=(
+                checkpoint is not None
+                or dead_letters is not None
+                or content_hashes is not None
+            ),
+            create_only=create_only,
+            upsert_ids=(
+                duplicate_ids.keys()
+                if duplicate_ids is not None and duplicate_policy is None
+                else frozenset()
+            ),
+            metrics=metrics,
+        )
 
-    num_indexed = 0
+    num_indexed = _consume_bulk_results(
+        results,
+        checkpoint=checkpoint,
+        dead_letters=dead_letters,
+        content_hashes=content_hashes,
+        metrics=metrics,
+    )
 
-    for ok, result in streaming_bulk(
-        connections.get_connection(),
-        make_upsert_ops(),
-        max_retries=max_retries,
-        raise_on_error=False,
+    _LOGGER.debug("Successfully indexed {} documents.", num_indexed)
+    if bulk_sizer is not None:
+        _LOGGER.debug(
+            "Final bulk size was {} actions or {:.1f} MiB.",
+            bulk_sizer.chunk_size,
+            bulk_sizer.max_chunk_bytes / (1024 * 1024),
+        )
+    return num_indexed
+
+
+def _check_serialize_in_workers_arguments(
+    *,
+    bulk_sizer: Optional[AdaptiveBulkSizer],
+    duplicate_ids: Optional[Mapping[str, int]],
+    content_hashes: Optional[ContentHashStore],
+    compress_level: Optional[int],
+) -> None:
+    if bulk_sizer is not None:
+        raise ValueError(
+            "Adaptive bulk sizing can not be used when serializing in workers."
+        )
+    if duplicate_ids is not None:
+        raise ValueError("Duplicate IDs can not be used when serializing in workers.")
+    if content_hashes is not None:
+        raise ValueError("Content hashes can not be used when serializing in workers.")
+    pool = connections.get_connection().transport.connection_pool
+    if compress_level is not None and any(
+        # Otherwise the compressed bodies would be compressed again.
+        getattr(connection, "http_compress", False)
+        for connection in pool.connections
     ):
-        if ok:
-            num_indexed += 1
-        else:
-            _LOGGER.debug(
-                "Indexed {} documents before the following error.", num_indexed
-            )
-            raise ElasticsearchException(
-                f"An error occurred when indexing documents: {result}"
-            )
+        raise ValueError(
+            "Compressing in workers requires a connection without http_compress."
+        )
 
-    _LOGGER.debug("Successfully indexed {} documents.", num_indexed)
+
+def find_duplicate_document_ids(
+    document_cls: Type[BaseDocument],
+    document_dicts: Union[Iterator[Mapping[str, object]], Iterator[DocumentLineBatch]],
+    *,
+    capacity: int,
+    bits_per_item: int = 24,
+    num_procs: Optional[int] = None,
+    in_flight_window: Optional[InFlightWindow] = None,
+) -> Mapping[str, int]:
+    """Finds the IDs that occur more than once, to pass to `add_documents_to_index()`.
+
+    This is an extra pass over the documents, that only parses them and gets their IDs
+    from `BaseDocument.document_id()` in worker processes. See `find_duplicate_ids()`
+    for `capacity` and `bits_per_item`.
+    """
+
+    return find_duplicate_ids(
+        _transform_in_pool(
+            partial(_document_ids, document_cls=document_cls),
+            document_dicts,
+            num_procs=num_procs,
+            checkpoint=None,
+            dead_letters=None,
+            in_flight_window=in_flight_window,
+            metrics=None,
+            profiler=None,
+        ),
+        capacity=capacity,
+        bits_per_item=bits_per_item,
+    )
+
+
+def serialize_documents(
+    document_cls: Type[BaseDocument],
+    document_dicts: Iterator[DocumentLineBatch],
+    *,
+    serializer: Serializer,
+    num_procs: Optional[int] = None,
+    dead_letters: Optional[DeadLetterFile] = None,
+    in_flight_window: Optional[InFlightWindow] = None,
+    metrics: Optional[IngestMetrics] = None,
+    profiler: Optional[Profiler] = None,
+) -> Iterator[Sequence[bytes]]:
+    """Transforms documents into bulk upsert actions without sending them anywhere.
+
+    Does the same work as `add_documents_to_index()` with `serialize_in_workers`, and
+    yields the serialized actions of each batch. The actions contain no index name, so
+    that they can be sent to any index with `tagged_parallel_serialized_bulk()`. Note
+    that upserts of documents with a meta field need the script stored by
+    `put_meta_field_script()`.
+    """
+
+    try:
+        for bulk in _transform_in_pool(
+            partial(
+                _make_serialized_bulks,
+                index_name=None,
+                document_cls=document_cls,
+                tolerant=dead_letters is not None,
+                create_only=False,
+                serializer=serializer,
+            ),
+            document_dicts,
+            num_procs=num_procs,
+            checkpoint=None,
+            dead_letters=dead_letters,
+            in_flight_window=in_flight_window,
+            metrics=metrics,
+            profiler=profiler,
+        ):
+            if dead_letters is not None:
+                dead_letters.record_success(len(bulk.actions))
+            yield bulk.actions
+    finally:
+        if dead_letters is not None:
+            dead_letters.close()
 
 
 def analyze_index(index_name: str, document_cls: Type[_T_BaseDocument]) -> None:
@@ -0,0 +1,365 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from logging import getLogger
+from pathlib import Path
+from socketserver import ThreadingMixIn
+from threading import Event, Lock, Thread
+from types import TracebackType
+from typing import List, Mapping, Optional, Sequence, Tuple, Type
+
+from nasty_utils import ColoredBraceStyleAdapter
+
+_LOGGER = ColoredBraceStyleAdapter(getLogger(__name__))
+
+_TRANSFORM_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_BULK_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _Metric:
+    type_ = ""
+
+    def __init__(self, name: str, help_: str):
+        self.name = name
+        self.help = help_
+        self._lock = Lock()
+
+    def samples(self) -> Sequence[Tuple[str, Mapping[str, str], float]]:
+        raise NotImplementedError()
+
+
+class _Counter(_Metric):
+    type_ = "counter"
+
+    def __init__(self, name: str, help_: str):
+        super().__init__(name, help_)
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def samples(self) -> Sequence[Tuple[str, Mapping[str, str], float]]:
+        return [(self.name, {}, self.value)]
+
+
+class _Gauge(_Metric):
+    type_ = "gauge"
+
+    def __init__(self, name: str, help_: str):
+        super().__init__(name, help_)
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.inc(-amount)
+
+    def samples(self) -> Sequence[Tuple[str, Mapping[str, str], float]]:
+        return [(self.name, {}, self.value)]
+
+
+class _Histogram(_Metric):
+    type_ = "histogram"
+
+    def __init__(self, name: str, help_: str, buckets: Sequence[float]):
+        super().__init__(name, help_)
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.bucket_counts[bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+
+    def samples(self) -> Sequence[Tuple[str, Mapping[str, str], float]]:
+        with self._lock:
+            bucket_counts = list(self.bucket_counts)
+            count, sum_ = self.count, self.sum
+
+        samples: List[Tuple[str, Mapping[str, str], float]] = []
+        cumulative_count = 0
+        for bound, bucket_count in zip(
+            [*map(_format_value, self.buckets), "+Inf"], bucket_counts
+        ):
+            cumulative_count += bucket_count
+            samples.append((self.name + "_bucket", {"le": bound}, cumulative_count))
+        samples.append((self.name + "_count", {}, count))
+        samples.append((self.name + "_sum", {}, sum_))
+        return samples
+
+
+class IngestMetrics:
+    """Counters, gauges, and histograms of each stage of an ingest.
+
+    The stages are reading the dump, transforming documents in worker processes, and
+    sending bulk requests, each with its own throughput counters, so that it is
+    possible to tell which stage bounds a slow ingest. All methods are thread-safe.
+    Metrics are rendered in the Prometheus text format, each sample carrying the given
+    `labels`, e.g., the name of the dump file. See `MetricsExporter` for publishing
+    them.
+    """
+
+    def __init__(self, *, labels: Optional[Mapping[str, str]] = None):
+        self.labels = dict(labels or {})
+
+        self.read_lines = _Counter(
+            "nasty_data_read_lines_total",
+            "Lines (or already parsed documents) read from the dump.",
+        )
+        self.read_bytes = _Counter(
+            "nasty_data_read_bytes_total",
+            "Decompressed characters of lines read from the dump (bytes for ASCII).",
+        )
+        self.parsed_lines = _Counter(
+            "nasty_data_parsed_lines_total",
+            "Lines (or documents) processed by worker processes, including failed "
+            "ones.",
+        )
+        self.parse_errors = _Counter(
+            "nasty_data_parse_errors_total",
+            "Lines that could not be transformed into an action.",
+        )
+        self.transformed_documents = _Counter(
+            "nasty_data_transformed_documents_total",
+            "Documents transformed into bulk actions.",
+        )
+        self.transform_seconds = _Histogram(
+            "nasty_data_transform_batch_seconds",
+            "Time a worker process took to transform one batch.",
+            _TRANSFORM_BUCKETS,
+        )
+        self.bulk_requests = _Counter(
+            "nasty_data_bulk_requests_total",
+            "Bulk requests sent, including retries.",
+        )
+        self.bulk_actions = _Counter(
+            "nasty_data_bulk_actions_total", "Actions sent, including retries."
+        )
+        self.bulk_retries = _Counter(
+            "nasty_data_bulk_retries_total",
+            "Bulk requests that retried rejected actions.",
+        )
+        self.bulk_rejections = _Counter(
+            "nasty_data_bulk_rejections_total",
+            "Actions rejected by Elasticsearch because its queues were full.",
+        )
+        self.bulk_seconds = _Histogram(
+            "nasty_data_bulk_request_seconds",
+            "Round-trip time of bulk requests.",
+            _BULK_BUCKETS,
+        )
+        self.unchanged_documents = _Counter(
+            "nasty_data_unchanged_documents_total",
+            "Documents not sent because they did not change since they were last "
+            "indexed.",
+        )
+        self.duplicate_documents = _Counter(
+            "nasty_data_duplicate_documents_total",
+            "Documents not sent because a document with the same ID in the dump is "
+            "preferred.",
+        )
+        self.indexed_documents = _Counter(
+            "nasty_data_indexed_documents_total",
+            "Documents acknowledged by Elasticsearch.",
+        )
+        self.index_errors = _Counter(
+            "nasty_data_index_errors_total",
+            "Documents that Elasticsearch failed to index.",
+        )
+        self.in_flight_documents = _Gauge(
+            "nasty_data_in_flight_documents",
+            "Documents read but not yet transformed.",
+        )
+        self.in_flight_bytes = _Gauge(
+            "nasty_data_in_flight_bytes",
+            "Characters of lines read but not yet transformed.",
+        )
+        self.bulk_requests_in_flight = _Gauge(
+            "nasty_data_bulk_requests_in_flight",
+            "Bulk requests sent but not yet answered.",
+        )
+
+    def record_read(self, *, num_documents: int, num_bytes: int) -> None:
+        self.read_lines.inc(num_documents)
+        self.read_bytes.inc(num_bytes)
+        self.in_flight_documents.inc(num_documents)
+        self.in_flight_bytes.inc(num_bytes)
+
+    def record_transform(
+        self, seconds: float, *, num_documents: int, num_bytes: int, num_errors: int
+    ) -> None:
+        self.in_flight_documents.dec(num_documents)
+        self.in_flight_bytes.dec(num_bytes)
+        self.parsed_lines.inc(num_documents)
+        self.parse_errors.inc(num_errors)
+        self.transformed_documents.inc(num_documents - num_errors)
+        self.transform_seconds.observe(seconds)
+
+    def start_bulk(self) -> None:
+        self.bulk_requests_in_flight.inc()
+
+    def finish_bulk(
+        self, seconds: float, *, num_actions: int, num_rejected: int, retry: bool
+    ) -> None:
+        self.bulk_requests_in_flight.dec()
+        self.bulk_requests.inc()
+        self.bulk_actions.inc(num_actions)
+        self.bulk_rejections.inc(num_rejected)
+        if retry:
+            self.bulk_retries.inc()
+        self.bulk_seconds.observe(seconds)
+
+    def metrics(self) -> Sequence[_Metric]:
+        return [metric for metric in vars(self).values() if isinstance(metric, _Metric)]
+
+    def render(self) -> str:
+        """Renders all metrics in the Prometheus text format."""
+
+        lines = []
+        for metric in self.metrics():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type_}")
+            for name, labels, value in metric.samples():
+                lines.append(
+                    name
+                    + _format_labels({**self.labels, **labels})
+                    + " "
+                    + _format_value(value)
+                )
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: Mapping[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels.items()
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class MetricsExporter:
+    """Publishes ingest metrics while they are being collected.
+
+    If `file` is given, the metrics are written to it every `interval` seconds and
+    when exiting, e.g., for the textfile collector of the Prometheus node exporter. The
+    file is replaced atomically, so readers never see partial metrics. If `port` is
+    given, they are served over HTTP in the Prometheus format on that port of `host`
+    (any path). `host` defaults to localhost, pass an empty string to serve on all
+    interfaces. Use as a context manager.
+    """
+
+    def __init__(
+        self,
+        metrics: IngestMetrics,
+        *,
+        file: Optional[Path] = None,
+        port: Optional[int] = None,
+        host: str = "localhost",
+        interval: float = 10.0,
+    ):
+        self.metrics = metrics
+        self.file = file
+        self.port = port
+        self.host = host
+        self.interval = interval
+        self._stop = Event()
+        self._threads: List[Thread] = []
+        self._server: Optional[_ThreadingHTTPServer] = None
+
+    def __enter__(self) -> "MetricsExporter":
+        if self.file is not None:
+            self.file.parent.mkdir(parents=True, exist_ok=True)
+            self._threads.append(Thread(target=self._write_periodically, daemon=True))
+        if self.port is not None:
+            self._server = _ThreadingHTTPServer(
+                (self.host, self.port), self._request_handler()
+            )
+            self._threads.append(Thread(target=self._server.serve_forever, daemon=True))
+            _LOGGER.info(
+                "Serving metrics at http://{}:{}/metrics.",
+                self.host or "0.0.0.0",
+                self._server.server_port,
+            )
+
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        for thread in self._threads:
+            thread.join()
+        if self.file is not None:
+            self.write()
+
+    def write(self) -> None:
+        assert self.file is not None
+        file_tmp = self.file.with_name(self.file.name + ".tmp")
+        file_tmp.write_text(self.metrics.render(), encoding="UTF-8")
+        file_tmp.replace(self.file)
+
+    def _write_periodically(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except OSError:
+                _LOGGER.exception("Could not write metrics to '{}'.", self.file)
+
+    def _request_handler(self) -> Type[BaseHTTPRequestHandler]:
+        metrics = self.metrics
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:  # noqa: N802
+                body = metrics.render().encode("UTF-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: object) -> None:  # noqa: A002
+                pass
+
+        return RequestHandler
@@ -0,0 +1,111 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+from enum import Enum
+from json import JSONDecodeError
+from typing import Any, Callable
+
+from elasticsearch.exceptions import SerializationError
+from elasticsearch.serializer import JSONSerializer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore
+
+
+class JsonBackend(Enum):
+    """Library used to encode and decode JSON.
+
+    AUTO uses orjson if it is installed (e.g., via the "orjson" extra of this package)
+    and the standard library otherwise. Both produce the same JSON, except for NaN and
+    infinite floats, see `OrjsonSerializer`.
+    """
+
+    AUTO = "auto"
+    STDLIB = "stdlib"
+    ORJSON = "orjson"
+
+    def resolve(self) -> "JsonBackend":
+        if self == JsonBackend.AUTO:
+            return JsonBackend.ORJSON if orjson is not None else JsonBackend.STDLIB
+        if self == JsonBackend.ORJSON and orjson is None:
+            raise ImportError(
+                "JSON backend orjson was selected but orjson is not installed."
+            )
+        return self
+
+
+def json_loads_func(json_backend: JsonBackend) -> Callable[[str], Any]:
+    """Returns a picklable function that decodes JSON with the given backend."""
+
+    if json_backend.resolve() == JsonBackend.ORJSON:
+        return _orjson_loads
+    return json.loads
+
+
+def _orjson_loads(s: str) -> Any:
+    try:
+        return orjson.loads(s)
+    except JSONDecodeError:
+        # orjson is stricter than the standard library, e.g., it rejects NaN and
+        # integers that do not fit into 64 bits. Let the standard library decide
+        # whether the input is actually invalid.
+        return json.loads(s)
+
+
+class OrjsonSerializer(JSONSerializer):
+    """Elasticsearch client serializer that uses orjson.
+
+    Produces the same output as the default `JSONSerializer`: values orjson does not
+    support natively (including dates, to format them exactly the same) are passed to
+    `JSONSerializer.default()` and anything orjson rejects falls back to the default
+    serializer. The only exception are NaN and infinite floats, which orjson writes as
+    `null`, while the default serializer writes `NaN` and `Infinity`, which is not
+    valid JSON and makes Elasticsearch reject the document. With orjson, documents
+    containing them are therefore indexed with those values missing instead.
+    """
+
+    _OPTIONS = (
+        orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if orjson is not None
+        else 0
+    )
+
+    def loads(self, s: str) -> Any:
+        try:
+            return _orjson_loads(s)
+        except (ValueError, TypeError) as e:
+            raise SerializationError(s, e)
+
+    def dumps(self, data: Any) -> str:
+        # Don't serialize strings, like the default serializer.
+        if isinstance(data, str):
+            return data
+
+        try:
+            return orjson.dumps(
+                data, default=self.default, option=self._OPTIONS
+            ).decode("UTF-8")
+        except TypeError:
+            return super().dumps(data)
+
+
+def elasticsearch_serializer(json_backend: JsonBackend) -> JSONSerializer:
+    if json_backend.resolve() == JsonBackend.ORJSON:
+        return OrjsonSerializer()
+    return JSONSerializer()
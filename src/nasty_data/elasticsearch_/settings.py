@@ -16,17 +16,29 @@
 
 from logging import getLogger
 from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Mapping, Optional, Sequence
+from urllib.parse import urlsplit
 
 from elasticsearch_dsl import connections
 from nasty_utils import ColoredBraceStyleAdapter, LoggingSettings, Settings
 from pydantic import SecretStr
 
+from nasty_data.elasticsearch_.serializer import JsonBackend, elasticsearch_serializer
+
+if TYPE_CHECKING:
+    # Requires aiohttp, see the "async" extra of this package.
+    from elasticsearch import AsyncElasticsearch
+
 _LOGGER = ColoredBraceStyleAdapter(getLogger(__name__))
 
 
 class _ElasticsearchSection(Settings):
     host: str = "localhost"
     port: int = 9200
+    # Takes precedence over host, entries are "HOST" or "HOST:PORT" (default: port).
+    hosts: List[str] = []
+    sniff: bool = False
+    sniff_interval: float = 60.0
     user: str = "elastic"
     password: SecretStr = SecretStr("")
     ca_crt_path: Path
@@ -34,34 +46,104 @@ class _ElasticsearchSection(Settings):
     retry_on_timeout: bool = True
     max_retries: int = 5
     http_compress: bool = True
+    json_backend: JsonBackend = JsonBackend.AUTO
 
 
 class ElasticsearchSettings(LoggingSettings):
     elasticsearch: _ElasticsearchSection
 
-    def setup_elasticsearch_connection(self) -> None:
+    def setup_elasticsearch_connection(
+        self, *, maxsize: Optional[int] = None, http_compress: Optional[bool] = None
+    ) -> None:
+        """Creates the default elasticsearch-dsl connection from these settings.
+
+        Requests are distributed round-robin over all configured hosts. If sniffing is
+        enabled, the client instead discovers all data and ingest nodes of the cluster
+        on start, every `sniff_interval` seconds, and whenever a node fails. TLS and
+        authentication apply to every node, so their certificates need to be valid for
+        the addresses they publish.
+
+        :param maxsize: Number of HTTP connections to keep open per node. Needs to be at
+            least the number of threads that use the connection concurrently, otherwise
+            connections are discarded and reopened (including TLS handshake) after each
+            request. Defaults to the default of the Elasticsearch client.
+        :param http_compress: Overrides the setting of the same name, e.g., to turn off
+            compression if bulk requests are already compressed in worker processes.
+        """
+
         _LOGGER.debug("Setting up Elasticsearch connection.")
+        kwargs = dict(self._elasticsearch_client_kwargs(maxsize))
+        if http_compress is not None:
+            kwargs["http_compress"] = http_compress
+        connections.create_connection(**kwargs)
+
+    def create_async_elasticsearch_client(
+        self, *, maxsize: Optional[int] = None
+    ) -> "AsyncElasticsearch":
+        """Creates an asyncio Elasticsearch client from these settings.
+
+        Requires aiohttp to be installed, e.g., via the "async" extra of this package.
+        The caller is responsible for closing the client.
 
+        :param maxsize: Number of HTTP connections to keep open per node, see
+            `setup_elasticsearch_connection()`.
+        """
+
+        from elasticsearch import AsyncElasticsearch
+
+        _LOGGER.debug("Setting up asyncio Elasticsearch client.")
+        return AsyncElasticsearch(**self._elasticsearch_client_kwargs(maxsize))
+
+    # Typed as Any like the **kwargs of the clients they are passed to, since the
+    # values are of different types.
+    def _elasticsearch_client_kwargs(self, maxsize: Optional[int]) -> Mapping[str, Any]:
         if not self.elasticsearch.ca_crt_path.exists():
             raise FileNotFoundError(
                 f"CA-Certificate '{self.elasticsearch.ca_crt_path}' could not be found."
                 " Configuration without a certificate is not supported at this time."
             )
 
-        connections.create_connection(
-            hosts=[{"host": self.elasticsearch.host, "port": self.elasticsearch.port}],
-            timeout=self.elasticsearch.timeout,
-            retry_on_timeout=self.elasticsearch.retry_on_timeout,
-            max_retries=self.elasticsearch.max_retries,
-            http_compress=self.elasticsearch.http_compress,
-            scheme="https",
-            use_ssl=True,
-            http_auth=(
+        kwargs: Dict[str, Any] = {
+            "hosts": self._hosts(),
+            "timeout": self.elasticsearch.timeout,
+            "retry_on_timeout": self.elasticsearch.retry_on_timeout,
+            "max_retries": self.elasticsearch.max_retries,
+            "http_compress": self.elasticsearch.http_compress,
+            "serializer": elasticsearch_serializer(self.elasticsearch.json_backend),
+            "scheme": "https",
+            "use_ssl": True,
+            "http_auth": (
                 self.elasticsearch.user,
                 self.elasticsearch.password.get_secret_value(),
             ),
-            verify_certs=True,
-            ssl_show_warn=True,
-            ca_certs=str(self.elasticsearch.ca_crt_path),
-            ssl_assert_hostname=self.elasticsearch.host,
-        )
+            "verify_certs": True,
+            "ssl_show_warn": True,
+            "ca_certs": str(self.elasticsearch.ca_crt_path),
+        }
+        if self.elasticsearch.sniff:
+            kwargs.update(
+                sniff_on_start=True,
+                sniff_on_connection_fail=True,
+                sniffer_timeout=self.elasticsearch.sniff_interval or None,
+                sniff_timeout=self.elasticsearch.timeout,
+            )
+        if maxsize is not None:
+            kwargs["maxsize"] = maxsize
+        return kwargs
+
+    def _hosts(self) -> Sequence[Mapping[str, object]]:
+        hosts = []
+        for entry in self.elasticsearch.hosts or [self.elasticsearch.host]:
+            # Also handles bracketed IPv6 addresses.
+            split = urlsplit("//" + entry)
+            if not split.hostname or split.path or split.query:
+                raise ValueError(f"Invalid Elasticsearch host '{entry}'.")
+            hosts.append(
+                {
+                    "host": split.hostname,
+                    "port": split.port or self.elasticsearch.port,
+                    # Sniffed nodes are checked against their own addresses instead.
+                    "ssl_assert_hostname": split.hostname,
+                }
+            )
+        return hosts
@@ -0,0 +1,184 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+from cProfile import Profile
+from datetime import datetime
+from io import StringIO
+from logging import getLogger
+from multiprocessing.util import Finalize
+from os import getpid
+from pathlib import Path
+from pstats import Stats
+from types import TracebackType
+from typing import Counter, Iterator, Mapping, Optional, Type
+
+from nasty_utils import ColoredBraceStyleAdapter
+
+_LOGGER = ColoredBraceStyleAdapter(getLogger(__name__))
+
+_TRACEMALLOC_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, cProfile.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+class Profiler:
+    """Profiles this process and the worker processes it starts.
+
+    Use as a context manager around the code to profile. Every profiled process writes
+    its own cProfile profile (and a tracemalloc snapshot, if `trace_memory` is true) to
+    `directory`, prefixed with an ID of the run. Workers of a `Pool` are profiled by
+    passing `start_worker` as its initializer, other child processes by wrapping their
+    work in `profile_process()`. On exit, the profiles of all processes of the run are
+    merged into `<run ID>.prof` (e.g., for snakeviz or `pstats`) and the top functions
+    by cumulative time are logged, as well as the lines that allocated the most memory.
+
+    Pool workers only write their profiles if they exit normally, i.e., if the pool is
+    closed and joined instead of terminated.
+    """
+
+    def __init__(self, directory: Path, *, trace_memory: bool = False, top: int = 30):
+        self.directory = directory
+        self.trace_memory = trace_memory
+        self.top = top
+        self.run_id = f"{datetime.now():%Y%m%d-%H%M%S}-{getpid()}"
+        self._pid: Optional[int] = None
+        self._profile: Optional[Profile] = None
+
+    def __getstate__(self) -> Mapping[str, object]:
+        # Profiles can not be pickled, child processes start their own anyway.
+        return {**vars(self), "_profile": None}
+
+    def __enter__(self) -> "Profiler":
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._pid = getpid()
+        self._profile = self._start()
+        _LOGGER.info("Profiling to '{}' as run {}.", self.directory, self.run_id)
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        if self._profile is not None:
+            self._stop(self._profile, "main")
+            self._profile = None
+        self.report()
+
+    @contextmanager
+    def profile_process(self, role: str) -> Iterator[None]:
+        """Profiles the wrapped code in a child process as its own profile.
+
+        Does nothing in the process that entered the profiler, which is profiled as a
+        whole already.
+        """
+
+        if getpid() == self._pid:
+            yield
+            return
+
+        profile = self._start()
+        try:
+            yield
+        finally:
+            self._stop(profile, role)
+
+    def start_worker(self) -> None:
+        """Profiles a `Pool` worker until it exits, pass as the pool's initializer."""
+
+        Finalize(None, self._stop, args=(self._start(), "worker"), exitpriority=100)
+
+    def report(self) -> None:
+        """Merges the profiles of all processes of the run and logs the results."""
+
+        files = sorted(self.directory.glob(f"{self.run_id}.*.prof"))
+        if not files:
+            _LOGGER.warning("No profiles of run {} were written.", self.run_id)
+            return
+
+        stream = StringIO()
+        stats = Stats(*map(str, files), stream=stream)
+        merged_file = self.directory / f"{self.run_id}.prof"
+        stats.dump_stats(str(merged_file))
+        stats.sort_stats("cumulative").print_stats(self.top)
+        _LOGGER.info(
+            "Merged profiles of {} processes into '{}'. Top {} functions by "
+            "cumulative time (summed over all processes):\n{}",
+            len(files),
+            merged_file,
+            self.top,
+            stream.getvalue().strip("\n"),
+        )
+
+        if self.trace_memory:
+            self._report_memory()
+
+    def _report_memory(self) -> None:
+        sizes = Counter[tracemalloc.Traceback]()
+        counts = Counter[tracemalloc.Traceback]()
+        for file in sorted(self.directory.glob(f"{self.run_id}.*.tracemalloc")):
+            snapshot = tracemalloc.Snapshot.load(str(file))
+            for statistic in snapshot.statistics("lineno"):
+                sizes[statistic.traceback] += statistic.size
+                counts[statistic.traceback] += statistic.count
+
+        _LOGGER.info(
+            "Top {} lines by memory still allocated when each process stopped "
+            "(summed over all processes):\n{}",
+            self.top,
+            "\n".join(
+                f"  {traceback}: {size / 1024:.1f} KiB in {counts[traceback]} blocks"
+                for traceback, size in sizes.most_common(self.top)
+            ),
+        )
+
+    def _start(self) -> Profile:
+        if self.trace_memory:
+            if tracemalloc.is_tracing():
+                # Forked processes inherit the traces of their parent.
+                tracemalloc.clear_traces()
+            else:
+                tracemalloc.start()
+
+        profile = Profile()
+        profile.enable()
+        return profile
+
+    def _stop(self, profile: Profile, role: str) -> None:
+        profile.disable()
+        file = self.directory / f"{self.run_id}.{role}-{getpid()}.prof"
+        profile.dump_stats(str(file))
+        _LOGGER.debug("Wrote profile of {} process to '{}'.", role, file)
+
+        if self.trace_memory:
+            snapshot = tracemalloc.take_snapshot().filter_traces(_TRACEMALLOC_FILTERS)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            snapshot.dump(str(file.with_suffix(".tracemalloc")))
+            _LOGGER.debug(
+                "Peak traced memory of {} process {} was {:.1f} MiB.",
+                role,
+                getpid(),
+                peak / (1024 * 1024),
+            )
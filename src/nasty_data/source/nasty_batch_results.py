@@ -15,18 +15,25 @@
 #
 
 import json
-from json import JSONDecodeError
+from functools import partial
 from logging import getLogger
 from pathlib import Path
-from typing import Iterator, Mapping, Optional, Tuple
+from typing import Any, Callable, Iterator, Mapping, Optional, Tuple, cast
 
 from elasticsearch_dsl import Date, InnerDoc, Integer, Keyword, Nested, Object
-from nasty_utils import ColoredBraceStyleAdapter, DecompressingTextIOWrapper
+from nasty_utils import ColoredBraceStyleAdapter
 
 from nasty_data.document.twitter import TwitterDocument
+from nasty_data.elasticsearch_.index import (
+    DocumentLineBatch,
+    load_document_line_batches,
+)
+from nasty_data.elasticsearch_.serializer import JsonBackend, json_loads_func
 
 _LOGGER = ColoredBraceStyleAdapter(getLogger(__name__))
 
+_DATA_FILE_SUFFIX = ".data.jsonl.xz"
+
 
 class NastyRequestMeta(InnerDoc):
     type = Keyword()
@@ -54,13 +61,38 @@ class NastyBatchResultsTwitterDocument(TwitterDocument):
         return "nasty_batch_meta", "id"
 
 
+def is_nasty_batch_results_file(file: Path) -> bool:
+    """Whether the file is the data file of a NASTY batch result."""
+
+    return file.name.endswith(_DATA_FILE_SUFFIX)
+
+
 def load_document_dicts_from_nasty_batch_results(
     data_file: Path,
     *,
+    skip_lines: int = 0,
     progress_bar: bool = True,
+    json_backend: JsonBackend = JsonBackend.AUTO,
 ) -> Iterator[Mapping[str, object]]:
+    for batch in load_document_batches_from_nasty_batch_results(
+        data_file,
+        skip_lines=skip_lines,
+        progress_bar=progress_bar,
+        json_backend=json_backend,
+    ):
+        yield from batch.load_document_dicts()
+
+
+def load_document_batches_from_nasty_batch_results(
+    data_file: Path,
+    *,
+    batch_size: int = 1000,
+    skip_lines: int = 0,
+    progress_bar: bool = True,
+    json_backend: JsonBackend = JsonBackend.AUTO,
+) -> Iterator[DocumentLineBatch]:
     meta_file = data_file.with_name(
-        data_file.name[: -len(".data.jsonl.xz")] + ".meta.json"
+        data_file.name[: -len(_DATA_FILE_SUFFIX)] + ".meta.json"
     )
 
     nasty_batch_meta: Optional[Mapping[str, object]] = None
@@ -68,15 +100,25 @@ def load_document_dicts_from_nasty_batch_results(
         with meta_file.open(encoding="UTF-8") as fin:
             nasty_batch_meta = json.load(fin)
 
-    with DecompressingTextIOWrapper(
-        data_file, encoding="UTF-8", progress_bar=progress_bar, warn_uncompressed=False
-    ) as fin:
-        for line_no, line in enumerate(fin):
-            try:
-                document_dict = json.loads(line)
-            except JSONDecodeError:
-                _LOGGER.error("Error in line {} of file '{}'.", line_no, data_file)
-                raise
-
-            document_dict["nasty_batch_meta"] = nasty_batch_meta
-            yield document_dict
+    return load_document_line_batches(
+        data_file,
+        partial(
+            _parse_nasty_batch_results_line,
+            nasty_batch_meta=nasty_batch_meta,
+            loads=json_loads_func(json_backend),
+        ),
+        batch_size=batch_size,
+        skip_lines=skip_lines,
+        progress_bar=progress_bar,
+    )
+
+
+def _parse_nasty_batch_results_line(
+    line: str,
+    *,
+    nasty_batch_meta: Optional[Mapping[str, object]],
+    loads: Callable[[str], Any] = json.loads,
+) -> Mapping[str, object]:
+    document_dict = loads(line)
+    document_dict["nasty_batch_meta"] = nasty_batch_meta
+    return cast(Mapping[str, object], document_dict)
@@ -18,17 +18,16 @@ import json
 import re
 from datetime import date
 from enum import Enum
+from functools import partial
 from itertools import chain
-from json import JSONDecodeError
 from logging import getLogger
 from pathlib import Path
-from typing import Counter, Iterator, Mapping, Optional, Tuple
+from typing import Any, Callable, Counter, Iterator, Mapping, Optional, Tuple, cast
 
 import requests
 from elasticsearch_dsl import Date, InnerDoc, Keyword, Object
 from nasty_utils import (
     ColoredBraceStyleAdapter,
-    DecompressingTextIOWrapper,
     FileNotOnServerError,
     advance_date_by_month,
     download_file_with_progressbar,
@@ -39,6 +38,11 @@ from nasty_utils import (
 )
 
 from nasty_data.document.reddit import RedditDocument
+from nasty_data.elasticsearch_.index import (
+    DocumentLineBatch,
+    load_document_line_batches,
+)
+from nasty_data.elasticsearch_.serializer import JsonBackend, json_loads_func
 
 _LOGGER = ColoredBraceStyleAdapter(getLogger(__name__))
 
@@ -241,11 +245,39 @@ class PushshiftRedditDocument(RedditDocument):
         return "pushshift_dump_meta", "dump_file"
 
 
+def is_pushshift_dump_file(file: Path) -> bool:
+    """Whether the file is named like a Pushshift dump, e.g., "RC_2019-01.zst"."""
+
+    return any(
+        re.match(file_pattern, file.name)
+        for file_pattern in chain.from_iterable(_PUSHSHIFT_FILE_PATTERNS.values())
+    )
+
+
 def load_document_dicts_from_pushshift_dump(
     dump_file: Path,
     *,
+    skip_lines: int = 0,
     progress_bar: bool = True,
+    json_backend: JsonBackend = JsonBackend.AUTO,
 ) -> Iterator[Mapping[str, object]]:
+    for batch in load_document_batches_from_pushshift_dump(
+        dump_file,
+        skip_lines=skip_lines,
+        progress_bar=progress_bar,
+        json_backend=json_backend,
+    ):
+        yield from batch.load_document_dicts()
+
+
+def load_document_batches_from_pushshift_dump(
+    dump_file: Path,
+    *,
+    batch_size: int = 1000,
+    skip_lines: int = 0,
+    progress_bar: bool = True,
+    json_backend: JsonBackend = JsonBackend.AUTO,
+) -> Iterator[DocumentLineBatch]:
     pushshift_dump_meta: Optional[Mapping[str, object]] = None
     for dump_type, file_pattern in (
         (t, p) for t, ps in _PUSHSHIFT_FILE_PATTERNS.items() for p in ps
@@ -259,20 +291,30 @@ def load_document_dicts_from_pushshift_dump(
             }
             break
 
-    with DecompressingTextIOWrapper(
-        dump_file, encoding="UTF-8", progress_bar=progress_bar, warn_uncompressed=False
-    ) as fin:
-        for line_no, line in enumerate(fin):
-            # For some reason, there is at least one line (specifically, line 29876 in
-            # file RS_2011-01.bz2) that contains NUL characters at the beginning of it,
-            # which we remove with the following.
-            line = line.lstrip("\0")
+    return load_document_line_batches(
+        dump_file,
+        partial(
+            _parse_pushshift_dump_line,
+            pushshift_dump_meta=pushshift_dump_meta,
+            loads=json_loads_func(json_backend),
+        ),
+        batch_size=batch_size,
+        skip_lines=skip_lines,
+        progress_bar=progress_bar,
+    )
 
-            try:
-                document_dict = json.loads(line)
-            except JSONDecodeError:
-                _LOGGER.error("Error in line {} of file '{}'.", line_no, dump_file)
-                raise
 
-            document_dict["pushshift_dump_meta"] = pushshift_dump_meta
-            yield document_dict
+def _parse_pushshift_dump_line(
+    line: str,
+    *,
+    pushshift_dump_meta: Optional[Mapping[str, object]],
+    loads: Callable[[str], Any] = json.loads,
+) -> Mapping[str, object]:
+    # For some reason, there is at least one line (specifically, line 29876 in file
+    # RS_2011-01.bz2) that contains NUL characters at the beginning of it, which we
+    # remove with the following.
+    line = line.lstrip("\0")
+
+    document_dict = loads(line)
+    document_dict["pushshift_dump_meta"] = pushshift_dump_meta
+    return cast(Mapping[str, object], document_dict)
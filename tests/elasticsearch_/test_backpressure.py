@@ -0,0 +1,70 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from threading import Thread
+from time import sleep
+
+import pytest
+
+from nasty_data.elasticsearch_.backpressure import InFlightWindow
+
+
+def test_admits_single_oversized_batch() -> None:
+    window = InFlightWindow(max_documents=10, max_bytes=100)
+    assert window.acquire(20, 1000)
+    assert window.num_documents == 20
+    window.release(20, 1000)
+    assert window.num_documents == 0
+    window.close()
+
+
+def test_blocks_until_released() -> None:
+    window = InFlightWindow(max_documents=10)
+    assert window.acquire(6)
+
+    acquired = []
+    thread = Thread(target=lambda: acquired.append(window.acquire(6)))
+    thread.start()
+    sleep(0.1)
+    assert not acquired
+
+    window.release(6)
+    thread.join(timeout=5)
+    assert acquired == [True]
+    assert window.num_waits == 1
+    assert window.max_num_documents_seen == 6
+    window.close()
+
+
+def test_close_rejects_waiting_and_future_acquires() -> None:
+    window = InFlightWindow(max_bytes=100)
+    assert window.acquire(1, 80)
+
+    acquired = []
+    thread = Thread(target=lambda: acquired.append(window.acquire(1, 80)))
+    thread.start()
+    sleep(0.1)
+    window.close()
+    thread.join(timeout=5)
+    assert acquired == [False]
+    assert not window.acquire(1, 1)
+
+
+def test_validation() -> None:
+    with pytest.raises(ValueError):
+        InFlightWindow(max_documents=0)
+    with pytest.raises(ValueError):
+        InFlightWindow(max_bytes=0)
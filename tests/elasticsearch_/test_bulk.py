@@ -0,0 +1,56 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import pytest
+
+from nasty_data.elasticsearch_.bulk import AdaptiveBulkSizer
+
+
+def test_adaptive_bulk_sizer_within_tolerance() -> None:
+    bulk_sizer = AdaptiveBulkSizer(target_latency=2.0, chunk_size=500)
+    bulk_sizer.record(2.2)
+    assert bulk_sizer.chunk_size == 500
+
+
+def test_adaptive_bulk_sizer_scales_proportionally() -> None:
+    bulk_sizer = AdaptiveBulkSizer(
+        target_latency=2.0, chunk_size=500, max_chunk_bytes=10 * 1024 * 1024
+    )
+    bulk_sizer.record(4.0)
+    assert bulk_sizer.chunk_size == 250
+    assert bulk_sizer.max_chunk_bytes == 5 * 1024 * 1024
+
+    # Growth is limited per request.
+    bulk_sizer.record(0.1)
+    assert bulk_sizer.chunk_size == 375
+
+
+def test_adaptive_bulk_sizer_rejections_and_bounds() -> None:
+    bulk_sizer = AdaptiveBulkSizer(
+        target_latency=2.0, chunk_size=500, min_chunk_size=200, max_chunk_size=600
+    )
+    bulk_sizer.record(2.0, rejected=True)
+    assert bulk_sizer.chunk_size == 250
+    bulk_sizer.record(2.0, rejected=True)
+    assert bulk_sizer.chunk_size == 200
+    for _ in range(10):
+        bulk_sizer.record(0.5)
+    assert bulk_sizer.chunk_size == 600
+
+
+def test_adaptive_bulk_sizer_validation() -> None:
+    with pytest.raises(ValueError):
+        AdaptiveBulkSizer(target_latency=0)
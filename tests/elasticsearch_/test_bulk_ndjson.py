@@ -0,0 +1,71 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from pathlib import Path
+from typing import Sequence
+
+from nasty_data.elasticsearch_.bulk_ndjson import (
+    BulkNdjsonManifest,
+    find_bulk_ndjson_manifests,
+    read_bulk_ndjson,
+    write_bulk_ndjson,
+)
+from nasty_data.source.pushshift import PushshiftRedditDocument
+
+
+def _actions(num_actions: int) -> Sequence[bytes]:
+    return [
+        b'{"delete":{"_id":"t3_%d"}}\n' % i
+        if i % 7 == 3
+        else b'{"update":{"_id":"t3_%d"}}\n{"doc":{"id":"%d"}}\n' % (i, i)
+        for i in range(num_actions)
+    ]
+
+
+def test_round_trip(tmp_path: Path) -> None:
+    actions = _actions(25)
+    dump_file = Path("RS_2020-01.zst")
+    assert (
+        write_bulk_ndjson(
+            tmp_path,
+            dump_file,
+            PushshiftRedditDocument,
+            [actions[:10], actions[10:]],
+            segment_size=10,
+        )
+        == 25
+    )
+
+    manifest_file = BulkNdjsonManifest.file_for(tmp_path, dump_file)
+    assert find_bulk_ndjson_manifests(tmp_path) == [manifest_file]
+    manifest = BulkNdjsonManifest.load(manifest_file)
+    assert manifest.num_actions == 25
+    assert len(manifest.segments) == 3
+
+    bulks = list(read_bulk_ndjson(manifest, tmp_path, bulk_size=4))
+    assert [len(bulk.actions) for bulk in bulks] == [4] * 6 + [1]
+    assert [action for bulk in bulks for action in bulk.actions] == list(actions)
+
+
+def test_replaces_previous_segments(tmp_path: Path) -> None:
+    dump_file = Path("RS_2020-01.zst")
+    write_bulk_ndjson(
+        tmp_path, dump_file, PushshiftRedditDocument, [_actions(20)], segment_size=5
+    )
+    write_bulk_ndjson(
+        tmp_path, dump_file, PushshiftRedditDocument, [_actions(5)], segment_size=5
+    )
+    assert len(list(tmp_path.glob("*.ndjson.zst"))) == 1
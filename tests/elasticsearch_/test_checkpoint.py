@@ -0,0 +1,99 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+from nasty_data.elasticsearch_.checkpoint import DumpCheckpoint
+
+
+def _dump_file(tmp_path: Path) -> Path:
+    dump_file = tmp_path / "RC_2020-01.zst"
+    dump_file.write_bytes(b"dump")
+    return dump_file
+
+
+def test_acknowledge_out_of_order(tmp_path: Path) -> None:
+    checkpoint = DumpCheckpoint(_dump_file(tmp_path), interval=100)
+    for line_no in [2, 0, 3]:
+        checkpoint.acknowledge(line_no)
+    assert checkpoint.line_no == 1
+    checkpoint.acknowledge(1)
+    assert checkpoint.line_no == 4
+
+
+def test_save_every_interval(tmp_path: Path) -> None:
+    checkpoint = DumpCheckpoint(_dump_file(tmp_path), interval=2)
+    checkpoint.acknowledge(0)
+    assert not checkpoint.file.exists()
+    checkpoint.acknowledge(1)
+    assert json.loads(checkpoint.file.read_text())["line_no"] == 2
+
+
+def test_resume(tmp_path: Path) -> None:
+    dump_file = _dump_file(tmp_path)
+    checkpoint = DumpCheckpoint(dump_file)
+    assert checkpoint.load() == 0
+    for line_no in range(5):
+        checkpoint.acknowledge(line_no)
+    checkpoint.save()
+
+    assert DumpCheckpoint(dump_file).load() == 5
+    assert DumpCheckpoint.is_checkpoint_file(checkpoint.file)
+    assert not DumpCheckpoint.is_checkpoint_file(dump_file)
+
+
+def test_refuse_changed_dump(tmp_path: Path) -> None:
+    dump_file = _dump_file(tmp_path)
+    checkpoint = DumpCheckpoint(dump_file)
+    checkpoint.acknowledge(0)
+    checkpoint.save()
+
+    dump_file.write_bytes(b"other dump")
+    with pytest.raises(ValueError):
+        DumpCheckpoint(dump_file).load()
+
+
+def test_refuse_touched_dump(tmp_path: Path) -> None:
+    dump_file = _dump_file(tmp_path)
+    checkpoint = DumpCheckpoint(dump_file)
+    checkpoint.save()
+
+    stat = dump_file.stat()
+    os.utime(dump_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+    with pytest.raises(ValueError):
+        DumpCheckpoint(dump_file).load()
+
+
+def test_acknowledged_lines_are_pruned(tmp_path: Path) -> None:
+    checkpoint = DumpCheckpoint(_dump_file(tmp_path), interval=1000)
+    for line_no in reversed(range(1, 100)):
+        checkpoint.acknowledge(line_no)
+    assert checkpoint.line_no == 0
+    checkpoint.acknowledge(0)
+    assert checkpoint.line_no == 100
+    assert not checkpoint._acknowledged
+
+
+def test_acknowledge_twice(tmp_path: Path) -> None:
+    checkpoint = DumpCheckpoint(_dump_file(tmp_path), interval=1000)
+    for line_no in [1, 1, 0, 0, 2, 1]:
+        checkpoint.acknowledge(line_no)
+    assert checkpoint.line_no == 3
+    assert not checkpoint._acknowledged
@@ -0,0 +1,60 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from pathlib import Path
+
+from nasty_data.elasticsearch_.content_hash import ContentHashStore, content_hash
+
+
+def test_content_hash() -> None:
+    upsert_op = {"_id": "t3_a", "_index": "a", "doc": {"x": 1, "y": 2}}
+    assert content_hash(upsert_op) == content_hash(
+        {"_index": "b", "doc": {"y": 2, "x": 1}, "_id": "t3_a"}
+    )
+    assert content_hash(upsert_op) != content_hash(
+        {**upsert_op, "doc": {"x": 1, "y": 3}}
+    )
+
+
+def test_only_acknowledged_hashes_are_stored(tmp_path: Path) -> None:
+    file = tmp_path / "hashes.sqlite"
+    with ContentHashStore(file, index_name="a") as content_hashes:
+        assert content_hashes.changed({"1": b"a", "2": b"b", "3": b"c"}) == {
+            "1",
+            "2",
+            "3",
+        }
+        content_hashes.acknowledge("1")
+        content_hashes.acknowledge("2", ok=False)
+
+    with ContentHashStore(file, index_name="a") as content_hashes:
+        assert content_hashes.changed({"1": b"a", "2": b"b", "3": b"c"}) == {"2", "3"}
+        assert content_hashes.changed({"1": b"x"}) == {"1"}
+        assert content_hashes.num_unchanged == 1
+
+    # Hashes are kept per index.
+    with ContentHashStore(file, index_name="b") as content_hashes:
+        assert content_hashes.changed({"1": b"a"}) == {"1"}
+
+
+def test_clear(tmp_path: Path) -> None:
+    file = tmp_path / "hashes.sqlite"
+    with ContentHashStore(file, index_name="a", commit_interval=1) as content_hashes:
+        content_hashes.changed({"1": b"a"})
+        content_hashes.acknowledge("1")
+        assert content_hashes.changed({"1": b"a"}) == set()
+        content_hashes.clear()
+        assert content_hashes.changed({"1": b"a"}) == {"1"}
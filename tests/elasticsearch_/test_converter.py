@@ -0,0 +1,40 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import pytest
+
+from nasty_data.benchmark.synthetic import (
+    SyntheticDataset,
+    generate_synthetic_documents,
+)
+from nasty_data.elasticsearch_.converter import (
+    document_converter,
+    verify_document_converter,
+)
+
+
+@pytest.mark.parametrize("dataset", list(SyntheticDataset))
+def test_converter_matches_elasticsearch_dsl(dataset: SyntheticDataset) -> None:
+    document_dicts = list(generate_synthetic_documents(dataset, num_documents=500))
+    assert verify_document_converter(dataset.document_cls, document_dicts) == 500
+
+
+@pytest.mark.parametrize("dataset", list(SyntheticDataset))
+def test_converter_is_cached(dataset: SyntheticDataset) -> None:
+    converter = document_converter(dataset.document_cls)
+    assert converter is not None
+    assert document_converter(dataset.document_cls) is converter
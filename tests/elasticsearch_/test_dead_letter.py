@@ -0,0 +1,76 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import gzip
+import json
+from pathlib import Path
+
+import pytest
+
+from nasty_data.elasticsearch_.dead_letter import DeadLetter, DeadLetterFile
+
+
+def test_write_and_append(tmp_path: Path) -> None:
+    file = tmp_path / "dead-letters.ndjson.gz"
+    for _ in range(2):
+        dead_letters = DeadLetterFile(file, dump_file=Path("RC_2020-01.zst"))
+        dead_letters.write_parse_error(DeadLetter(1, "{", "JSONDecodeError()"))
+        dead_letters.write_index_error(
+            2, {"update": {"status": 400}}, upsert_op=b'{"update":{}}\n{}\n'
+        )
+        dead_letters.close()
+
+    with gzip.open(file, "rt", encoding="UTF-8") as fin:
+        records = [json.loads(line) for line in fin]
+    assert [record["stage"] for record in records] == ["parse", "index"] * 2
+    assert records[0]["line"] == "{"
+    assert records[1]["upsert_op"] == '{"update":{}}\n{}\n'
+    assert records[1]["dump_file"] == "RC_2020-01.zst"
+
+
+def test_no_file_without_errors(tmp_path: Path) -> None:
+    dead_letters = DeadLetterFile(tmp_path / "dead-letters.ndjson.gz")
+    dead_letters.record_success(100)
+    dead_letters.close()
+    assert not dead_letters.file.exists()
+
+
+def test_abort_above_max_error_rate(tmp_path: Path) -> None:
+    dead_letters = DeadLetterFile(
+        tmp_path / "dead-letters.ndjson.gz", max_error_rate=0.1, min_num_documents=10
+    )
+    # Errors are tolerated until the minimum number of documents is seen.
+    for line_no in range(3):
+        dead_letters.write_parse_error(DeadLetter(line_no, "", ""))
+    dead_letters.record_success(6)
+    with pytest.raises(Exception, match="maximum error rate"):
+        dead_letters.write_parse_error(DeadLetter(9, "", ""))
+    dead_letters.close()
+
+
+def test_below_max_error_rate(tmp_path: Path) -> None:
+    dead_letters = DeadLetterFile(
+        tmp_path / "dead-letters.ndjson.gz", max_error_rate=0.1, min_num_documents=10
+    )
+    dead_letters.record_success(99)
+    dead_letters.write_parse_error(DeadLetter(99, "", ""))
+    dead_letters.close()
+    assert dead_letters.num_errors == 1
+
+
+def test_validation(tmp_path: Path) -> None:
+    with pytest.raises(ValueError):
+        DeadLetterFile(tmp_path / "dead-letters.ndjson.gz", max_error_rate=2)
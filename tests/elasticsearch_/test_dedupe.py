@@ -0,0 +1,109 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from datetime import datetime
+from typing import Iterator, List, Mapping, Tuple
+
+import pytest
+
+from nasty_data.elasticsearch_.dedupe import (
+    BloomFilter,
+    DuplicatePolicy,
+    find_duplicate_ids,
+)
+from nasty_data.elasticsearch_.index import _collapse_duplicates
+
+
+def test_bloom_filter_no_false_negatives() -> None:
+    bloom_filter = BloomFilter(capacity=1000)
+    items = [f"t3_{i}" for i in range(1000)]
+    assert not any(bloom_filter.add(item) for item in items)
+    assert all(item in bloom_filter for item in items)
+    assert all(bloom_filter.add(item) for item in items)
+    assert bloom_filter.num_items == 1000
+
+
+def test_bloom_filter_false_positive_rate() -> None:
+    bloom_filter = BloomFilter(capacity=10000)
+    for i in range(10000):
+        bloom_filter.add(f"t3_{i}")
+    num_false_positives = sum(f"t1_{i}" in bloom_filter for i in range(10000))
+    assert num_false_positives < 20
+
+
+def test_bloom_filter_validation() -> None:
+    with pytest.raises(ValueError):
+        BloomFilter(capacity=0)
+    with pytest.raises(ValueError):
+        BloomFilter(capacity=1, bits_per_item=0)
+
+
+@pytest.mark.parametrize("capacity", [1, 100, 10000])
+def test_find_duplicate_ids(capacity: int) -> None:
+    # A too small capacity adds more filters, but still finds all duplicates.
+    ids = [f"t3_{i}" for i in range(2000)] + ["t3_5", "t3_1999", "t3_5"]
+    duplicate_ids = find_duplicate_ids(ids, capacity=capacity)
+    assert duplicate_ids["t3_5"] in (3, 4)
+    assert duplicate_ids["t3_1999"] in (2, 3)
+    assert len(duplicate_ids) < 10
+
+
+def test_duplicate_policy() -> None:
+    old = {"_id": "t3_a", "doc": {"retrieved_on": datetime(2020, 1, 1)}}
+    new = {"_id": "t3_a", "upsert": {"retrieved_on": datetime(2020, 2, 1)}}
+    assert DuplicatePolicy.FIRST.prefers(1, new, 2, old)
+    assert DuplicatePolicy.LAST.prefers(2, old, 1, new)
+    assert DuplicatePolicy.LATEST_RETRIEVED.prefers(1, new, 2, old)
+    assert not DuplicatePolicy.LATEST_RETRIEVED.prefers(2, old, 1, new)
+    assert DuplicatePolicy.LATEST_RETRIEVED.prefers(2, old, 1, old)
+
+
+def test_collapse_duplicates_sends_after_last_occurrence() -> None:
+    ids = ["a", "b", "a", "c", "b", "a", "d"]
+    # Sent IDs after reading each line: "c" is a false positive and "d" has a too high
+    # count, which is only sent at the end.
+    expected_sent_ids = [
+        [],
+        [],
+        [],
+        ["c"],
+        ["c", "b"],
+        ["c", "b", "a"],
+        ["c", "b", "a"],
+    ]
+    sent: List[Tuple[int, Mapping[str, object]]] = []
+
+    def numbered_upsert_ops() -> Iterator[Tuple[int, Mapping[str, object]]]:
+        for line_no, id_ in enumerate(ids):
+            yield line_no, {"_id": id_}
+            assert [upsert_op["_id"] for _, upsert_op in sent] == (
+                expected_sent_ids[line_no]
+            )
+
+    for numbered_upsert_op in _collapse_duplicates(
+        numbered_upsert_ops(),
+        {"a": 3, "b": 2, "c": 1, "d": 2},
+        policy=DuplicatePolicy.FIRST,
+        checkpoint=None,
+        metrics=None,
+    ):
+        sent.append(numbered_upsert_op)
+    assert sent == [
+        (3, {"_id": "c"}),
+        (1, {"_id": "b"}),
+        (0, {"_id": "a"}),
+        (6, {"_id": "d"}),
+    ]
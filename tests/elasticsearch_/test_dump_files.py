@@ -0,0 +1,82 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from pathlib import Path
+
+import pytest
+
+from nasty_data.elasticsearch_.dump_files import find_dump_files
+from nasty_data.source.nasty_batch_results import is_nasty_batch_results_file
+from nasty_data.source.pushshift import is_pushshift_dump_file
+
+
+@pytest.fixture
+def dump_directory(tmp_path: Path) -> Path:
+    for name in [
+        "RC_2019-01.zst",
+        "RS_2019-02.xz",
+        "RS_v2_2008-03.xz",
+        "RC_2019-01.zst.sample",
+        "all.sample",
+        "RC_2019-02.zst.tmp",
+        "RC_2019-01.zst.checkpoint.json",
+        ".RC_2019-03.zst",
+        "sha256sums.txt",
+        "batch.data.jsonl.xz",
+        "batch.meta.json",
+    ]:
+        (tmp_path / name).write_bytes(b"")
+    (tmp_path / "RC_2019-04.zst").mkdir()
+    return tmp_path
+
+
+def test_directory_of_pushshift_dumps(dump_directory: Path) -> None:
+    assert find_dump_files(dump_directory, is_dump_file=is_pushshift_dump_file) == [
+        dump_directory / "RC_2019-01.zst",
+        dump_directory / "RS_2019-02.xz",
+        dump_directory / "RS_v2_2008-03.xz",
+    ]
+
+
+def test_directory_of_nasty_batch_results(dump_directory: Path) -> None:
+    assert find_dump_files(
+        dump_directory, is_dump_file=is_nasty_batch_results_file
+    ) == [dump_directory / "batch.data.jsonl.xz"]
+
+
+def test_directory_without_filter(dump_directory: Path) -> None:
+    files = find_dump_files(dump_directory)
+    assert dump_directory / "RC_2019-01.zst.sample" in files
+    assert dump_directory / "RC_2019-01.zst.checkpoint.json" not in files
+    assert dump_directory / ".RC_2019-03.zst" not in files
+
+
+def test_glob_pattern(dump_directory: Path) -> None:
+    assert find_dump_files(
+        dump_directory / "RC_*", is_dump_file=is_pushshift_dump_file
+    ) == [dump_directory / "RC_2019-01.zst"]
+
+
+def test_single_file(dump_directory: Path) -> None:
+    file = dump_directory / "all.sample"
+    assert find_dump_files(file, is_dump_file=is_pushshift_dump_file) == [file]
+
+
+def test_no_dump_files(dump_directory: Path) -> None:
+    with pytest.raises(FileNotFoundError):
+        find_dump_files(
+            dump_directory / "RS_2020-*", is_dump_file=is_pushshift_dump_file
+        )
@@ -0,0 +1,70 @@
+#
+# Copyright 2019-2020 Lukas Schmelzeisen
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from datetime import date, datetime
+from math import isnan
+
+import pytest
+from elasticsearch.serializer import JSONSerializer
+
+from nasty_data.elasticsearch_.serializer import (
+    JsonBackend,
+    OrjsonSerializer,
+    elasticsearch_serializer,
+    json_loads_func,
+)
+
+orjson = pytest.importorskip("orjson")
+
+
+def test_same_output_as_default_serializer() -> None:
+    data = {
+        "id": "t3_a",
+        "created_utc": datetime(2020, 1, 2, 3, 4, 5),
+        "retrieved_on": date(2020, 1, 2),
+        "score": 1.5,
+        "title": "Grüße",
+        "tags": ["a", None, True],
+        "large": 2 ** 70,
+        1: "non-str key",
+    }
+    assert OrjsonSerializer().dumps(data) == JSONSerializer().dumps(data)
+
+
+@pytest.mark.parametrize("value", [float("nan"), float("inf"), float("-inf")])
+def test_non_finite_floats(value: float) -> None:
+    # Documented difference: only the standard library writes invalid JSON.
+    data = {"score": value}
+    assert OrjsonSerializer().dumps(data) == '{"score":null}'
+    assert JSONSerializer().dumps(data) in (
+        '{"score":NaN}',
+        '{"score":Infinity}',
+        '{"score":-Infinity}',
+    )
+
+
+def test_loads_accepts_what_stdlib_accepts() -> None:
+    loads = json_loads_func(JsonBackend.ORJSON)
+    assert loads('{"id": 1}') == {"id": 1}
+    assert loads('{"id": 18446744073709551616}') == {"id": 2 ** 64}
+    assert isnan(loads('{"score": NaN}')["score"])
+
+
+def test_elasticsearch_serializer() -> None:
+    assert isinstance(elasticsearch_serializer(JsonBackend.ORJSON), OrjsonSerializer)
+    assert not isinstance(
+        elasticsearch_serializer(JsonBackend.STDLIB), OrjsonSerializer
+    )